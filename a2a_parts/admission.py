@@ -0,0 +1,182 @@
+import hashlib
+import os
+import threading
+from typing import Any
+from fastapi import Request
+import a2a.error_types as a2a_error_types
+from utils import metrics
+from utils.log import get_logger
+
+log = get_logger("admission")
+
+# Concurrent streams allowed in total, per Bearer token and per client IP (0 means no limit)
+MAX_STREAMS = int(os.getenv("MAX_STREAMS", "1000"))
+MAX_STREAMS_PER_TOKEN = int(os.getenv("MAX_STREAMS_PER_TOKEN", "100"))
+MAX_STREAMS_PER_IP = int(os.getenv("MAX_STREAMS_PER_IP", "100"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+# "memory" counts streams in this process, "redis" across every worker sharing REDIS_URL
+ADMISSION_STORE = os.getenv("ADMISSION_STORE", "memory").lower()
+
+STREAMING_METHODS = frozenset({"message/stream", "tasks/sendSubscribe", "tasks/resubscribe"})
+
+
+class TooManyStreamsError(a2a_error_types.JSONRPCError):
+    code: int = -32029
+    message: str = "Too many concurrent streams, retry later"
+    data: Any | None = None
+
+
+class Overloaded(Exception):
+    '''
+    A stream was refused; `limit` is "global" or the kind of client limit hit
+    '''
+
+    def __init__(self, limit: str):
+        super().__init__(f"{limit} stream limit reached")
+        self.limit = limit
+
+
+class LimiterUnavailable(Exception):
+    '''
+    The limiter's shared store could not be reached
+    '''
+
+
+class Lease:
+    '''
+    One admitted stream, held until the stream ends. Releasing twice is harmless.
+    '''
+    __slots__ = ("limiter", "client", "id", "released")
+
+    def __init__(self, limiter: "Limiter", client: str, lease_id: str | None = None):
+        self.limiter = limiter
+        self.client = client
+        self.id = lease_id
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.limiter.release(self)
+
+    async def arelease(self):
+        if not self.released:
+            self.released = True
+            await self.limiter.arelease(self)
+
+
+class Limiter:
+    '''
+    Counts concurrent streams. `acquire` either admits a stream at once or
+    raises Overloaded; nothing waits for a slot. It raises LimiterUnavailable
+    when a shared store can't be reached.
+    '''
+
+    def acquire(self, client: str, client_limit: int) -> Lease:
+        raise NotImplementedError
+
+    def release(self, lease: Lease):
+        raise NotImplementedError
+
+    def active(self) -> int:
+        '''
+        Streams admitted by this process and not yet released
+        '''
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    # Awaitable variants for the event loop; a limiter backed by a network
+    # store runs the calls on a worker thread
+
+    async def aacquire(self, client: str, client_limit: int) -> Lease:
+        return self.acquire(client, client_limit)
+
+    async def arelease(self, lease: Lease):
+        self.release(lease)
+
+
+class InMemoryLimiter(Limiter):
+    def __init__(self, max_streams: int = MAX_STREAMS):
+        self.max_streams = max_streams
+        self._total = 0
+        self._clients: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, client: str, client_limit: int) -> Lease:
+        with self._lock:
+            if self.max_streams and self._total >= self.max_streams:
+                raise Overloaded("global")
+            count = self._clients.get(client, 0)
+            if client_limit and count >= client_limit:
+                raise Overloaded(client.partition(":")[0])
+            self._total += 1
+            self._clients[client] = count + 1
+        return Lease(self, client)
+
+    def release(self, lease: Lease):
+        with self._lock:
+            self._total -= 1
+            count = self._clients.get(lease.client, 1) - 1
+            if count > 0:
+                self._clients[lease.client] = count
+            else:
+                self._clients.pop(lease.client, None)
+
+    def active(self) -> int:
+        return self._total
+
+
+def client_key(request: Request) -> tuple[str, int]:
+    '''
+    Who a request counts against, and their limit: the Bearer token when there
+    is one (hashed, so tokens are never kept), the client IP otherwise. The IP
+    is the one uvicorn reports, which is the proxy's unless the proxy is in
+    FORWARDED_ALLOW_IPS.
+    '''
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token.strip():
+        return "token:" + hashlib.sha256(token.strip().encode()).hexdigest()[:32], MAX_STREAMS_PER_TOKEN
+    host = request.client.host if request.client else "unknown"
+    return "ip:" + host, MAX_STREAMS_PER_IP
+
+
+async def admit(request: Request) -> Lease | None:
+    '''
+    Admit one stream for the request's client. Raises Overloaded over a limit.
+
+    When the limiter's store is down the stream is admitted uncounted and None
+    returned: limits protect the agent from overload, and an outage of the
+    store that counts streams shouldn't take streaming down with it.
+    '''
+    client, client_limit = client_key(request)
+    try:
+        return await limiter.aacquire(client, client_limit)
+    except Overloaded as e:
+        metrics.admission_rejected.inc(limit=e.limit)
+        raise
+    except LimiterUnavailable as e:
+        log.warning("admission_unavailable", extra={"error": str(e)})
+        metrics.admission_unavailable.inc()
+        return None
+
+
+def overloaded_error(e: Overloaded) -> TooManyStreamsError:
+    return TooManyStreamsError(data={"limit": e.limit, "retryAfter": ADMISSION_RETRY_AFTER_SECONDS})
+
+
+def create_limiter() -> Limiter:
+    if ADMISSION_STORE == "redis":
+        from a2a_parts.redis_admission import RedisLimiter
+        return RedisLimiter.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    return InMemoryLimiter()
+
+
+limiter = create_limiter()
+
+streams_admitted = metrics.Gauge(
+    "streams_admitted",
+    "Streams this process admitted that are still running",
+    limiter.active,
+)
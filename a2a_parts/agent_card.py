@@ -1,7 +1,16 @@
+import hashlib
 import os
+import threading
+from typing import NamedTuple
 import a2a.types as a2a_types
+from a2a_parts.skills import skills
+from utils.lru import LRUCache
 from utils.random_name_genertor import RandomNameRepository
 
+# Rendered cards kept, one per distinct base URL
+AGENT_CARD_CACHE_SIZE = int(os.getenv("AGENT_CARD_CACHE_SIZE", "64"))
+AGENT_CARD_MAX_AGE = int(os.getenv("AGENT_CARD_MAX_AGE", "300"))
+
 agent_name_suffix = (
     "_" + os.getenv("APP_ENV") + "_" + RandomNameRepository.generate_suffix()
     if os.getenv("APP_ENV") == "local"
@@ -11,7 +20,7 @@ agent_name_suffix = (
 def get_card(base_url):
     card = a2a_types.AgentCard(
         name=f"Streaming Agent Example{agent_name_suffix}",
-        description="An agent that streams popular text content like the Bible, Romeo and Juliet, and The Art of War",
+        description="An agent that streams popular text content like the Bible, Romeo and Juliet, The Art of War and Sherlock Holmes, and searches across them",
         url=f"{base_url}",
         provider=a2a_types.AgentProvider(
             organization="Telex",
@@ -21,41 +30,53 @@ def get_card(base_url):
         documentationUrl=f"{base_url}/docs",
         capabilities=a2a_types.AgentCapabilities(
             streaming=True,
-            pushNotifications=False,
+            pushNotifications=True,
             stateTransitionHistory=True,
         ),
         authentication=a2a_types.AgentAuthentication(schemes=["Bearer"]),
         defaultInputModes=["text/plain"],
         defaultOutputModes=["text/plain"],
-        skills=[
-            a2a_types.AgentSkill(
-                id="stream_bible",
-                name="Stream bible",
-                description="Streams the bible",
-                tags=["bible"],
-                examples=["In the beginning was the word, and the word was with God, and the word was God"],
-                inputModes=["text/plain"],
-                outputModes=["text/plain"],
-            ),
-            a2a_types.AgentSkill(
-                id="stream_art_of_war",
-                name="Stream Art of War",
-                description="Streams the Art of War",
-                tags=["art_of_war"],
-                examples=["The art of war is of vital importance to the State."],
-                inputModes=["text/plain"],
-                outputModes=["text/plain"],
-            ),
-            a2a_types.AgentSkill(
-                id="stream_romeo_and_juliet",
-                name="Stream Romeo and Juliet",
-                description="Streams Romeo and Juliet",
-                tags=["romeo_and_juliet"],
-                examples=["Two households, both alike in dignity, from ancient grudge break to new mutiny"],
-                inputModes=["text/plain"],
-                outputModes=["text/plain"],
-            )
-        ],
+        skills=list(skills),
     )
 
     return card
+
+
+class RenderedCard(NamedTuple):
+    body: bytes
+    etag: str
+
+
+rendered_cards = LRUCache(AGENT_CARD_CACHE_SIZE)
+_rendered_version = skills.version
+_rendered_lock = threading.Lock()
+
+
+def render_card(base_url: str) -> RenderedCard:
+    '''
+    The card for `base_url` as JSON bytes with a strong ETag, rendered once
+    per base URL and again only after the skill registry changes
+    '''
+    global _rendered_version
+    if skills.version != _rendered_version:
+        with _rendered_lock:
+            if skills.version != _rendered_version:
+                rendered_cards.clear()
+                _rendered_version = skills.version
+
+    rendered = rendered_cards.get(base_url)
+    if rendered is None:
+        body = get_card(base_url).model_dump_json().encode()
+        rendered = RenderedCard(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+        rendered_cards.put(base_url, rendered)
+    return rendered
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    '''
+    If-None-Match uses the weak comparison, so W/"x" matches "x"
+    '''
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
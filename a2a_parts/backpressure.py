@@ -0,0 +1,119 @@
+import os
+import time
+from contextlib import aclosing
+import anyio
+from fastapi.responses import StreamingResponse
+from typing import Awaitable, Callable
+from starlette.types import Receive, Scope, Send
+from a2a_parts import coalescing
+from utils import metrics, profiling
+from utils.log import get_logger
+
+log = get_logger("backpressure")
+
+# Frames produced ahead of the socket before the producer has to wait
+STREAM_BUFFER_FRAMES = int(os.getenv("STREAM_BUFFER_FRAMES", "32"))
+# A single write may take this long before the client counts as stalled (0 waits forever)
+STREAM_WRITE_DEADLINE_SECONDS = float(os.getenv("STREAM_WRITE_DEADLINE_SECONDS", "15"))
+
+
+class BackpressureStreamingResponse(StreamingResponse):
+    '''
+    StreamingResponse with a bounded buffer between the frame producer and the
+    socket, a deadline on every write, and a watch for the client going away.
+    Frames leaving the buffer are bundled into writes as STREAM_FLUSH_BYTES says.
+
+    A slow client fills the buffer and pauses the producer; a stalled one misses
+    the write deadline and the stream is aborted, as it is on disconnect. The
+    body iterator is closed either way so its resources are released at once.
+    '''
+    # Awaited however the stream ends, e.g. to give back its admission slot
+    on_close: Callable[[], Awaitable[None]] | None = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        outcome = "completed"
+        response_complete = False
+        started = time.perf_counter()
+        bytes_written = 0
+        events_written = 0
+        frames_in, frames_out = anyio.create_memory_object_stream[bytes](STREAM_BUFFER_FRAMES)
+
+        async def produce():
+            async with frames_in:
+                async for chunk in self.body_iterator:
+                    if not isinstance(chunk, (bytes, memoryview)):
+                        chunk = chunk.encode(self.charset)
+                    try:
+                        await frames_in.send(chunk)
+                    except anyio.BrokenResourceError:
+                        # The writer gave up on this client
+                        return
+
+        async def write(message):
+            with profiling.span("write"):
+                if STREAM_WRITE_DEADLINE_SECONDS:
+                    with anyio.fail_after(STREAM_WRITE_DEADLINE_SECONDS):
+                        await send(message)
+                else:
+                    await send(message)
+
+        async def consume(task_group):
+            nonlocal outcome, response_complete, bytes_written, events_written
+            try:
+                await write({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+                # Frames are bundled here, past the buffer, so a partial bundle is
+                # flushed on time however the body iterator is produced
+                async with frames_out, aclosing(coalescing.abundle_writes(frames_out)) as chunks:
+                    async for chunk in chunks:
+                        await write({"type": "http.response.body", "body": chunk, "more_body": True})
+                        if not bytes_written:
+                            metrics.stream_first_chunk_seconds.observe(time.perf_counter() - started)
+                        bytes_written += len(chunk)
+                        # A chunk can hold several bundled events, each ending in a blank line
+                        events_written += chunk.count(b"\n\n")
+                await write({"type": "http.response.body", "body": b"", "more_body": False})
+                response_complete = True
+            except TimeoutError:
+                outcome = "stalled"
+            except OSError:
+                outcome = "disconnected"
+            task_group.cancel_scope.cancel()
+
+        async def watch_disconnect(task_group):
+            nonlocal outcome
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    break
+            # The server also reports a disconnect once the response is complete
+            if not response_complete:
+                outcome = "disconnected"
+            task_group.cancel_scope.cancel()
+
+        try:
+            async with anyio.create_task_group() as task_group:
+                task_group.start_soon(produce)
+                task_group.start_soon(consume, task_group)
+                task_group.start_soon(watch_disconnect, task_group)
+        finally:
+            aclose = getattr(self.body_iterator, "aclose", None)
+            with anyio.CancelScope(shield=True):
+                if aclose is not None:
+                    await aclose()
+                if self.on_close is not None:
+                    await self.on_close()
+            duration = time.perf_counter() - started
+            profiling.finish()
+            metrics.streams_ended.inc(outcome=outcome)
+            metrics.stream_duration_seconds.observe(duration, outcome=outcome)
+            metrics.stream_bytes.observe(bytes_written)
+            metrics.stream_events.observe(events_written)
+            log.info("stream_ended", extra={
+                "outcome": outcome,
+                "bytes": bytes_written,
+                "events": events_written,
+                "seconds": round(duration, 3),
+            })
+
+        if outcome == "completed" and self.background is not None:
+            await self.background()
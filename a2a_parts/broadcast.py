@@ -0,0 +1,184 @@
+import asyncio
+import os
+import weakref
+from typing import Any, AsyncIterator, Hashable
+from a2a_parts.streaming import SectionStream, aiter_frames
+from utils import metrics
+from utils.log import get_logger
+
+log = get_logger("broadcast")
+
+# Frames a broadcast keeps for late joiners, and how far the producer may run
+# ahead of its slowest subscriber
+BROADCAST_BUFFER_FRAMES = int(os.getenv("BROADCAST_BUFFER_FRAMES", "8192"))
+# Producer yields to the event loop this often while filling the buffer
+PRODUCER_YIELD_EVERY = 64
+
+
+class InvalidSelection(ValueError):
+    pass
+
+
+def selection_from_metadata(*metadata: dict[str, Any] | None) -> dict[str, int] | None:
+    '''
+    Read `{"broadcast": {"seed": 7}}` or `{"broadcast": {"section": 3}}` from the
+    first metadata dict that has it. Raises InvalidSelection on a malformed selection.
+    '''
+    for fields in metadata:
+        selection = (fields or {}).get("broadcast")
+        if selection is None:
+            continue
+        if not isinstance(selection, dict) or len(selection.keys() & {"seed", "section"}) != 1:
+            raise InvalidSelection("broadcast needs exactly one of seed or section")
+
+        name, value = next((k, v) for k, v in selection.items() if k in ("seed", "section"))
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise InvalidSelection(f"broadcast {name} must be an integer")
+        if name == "section" and value < 1:
+            raise InvalidSelection("broadcast section numbers start at 1")
+        return {name: value}
+
+    return None
+
+
+class Broadcast:
+    '''
+    One producer encodes a section once into a ring buffer; every subscriber
+    reads the same frames through its own cursor. A subscriber that joins late
+    starts from the first frame as long as it is still buffered.
+
+    The producer never overwrites a frame a subscriber has yet to read, so it
+    runs at most `capacity` frames ahead of the slowest one. A stalled client
+    holds it back until the write deadline drops that client.
+    '''
+
+    def __init__(self, key: Hashable, stream: SectionStream, capacity: int = BROADCAST_BUFFER_FRAMES):
+        self.key = key
+        self.stream = stream
+        self.capacity = capacity
+        self.ring: list[bytes | None] = [None] * capacity
+        self.head = 0
+        self.done = False
+        self.error: BaseException | None = None
+        self._readers: set[object] = set()
+        # Next frame of each subscriber reading from the ring
+        self._cursors: dict[object, int] = {}
+        self._changed = asyncio.Event()
+        self._room = asyncio.Event()
+        self._producer: asyncio.Task | None = None
+
+    @property
+    def oldest(self) -> int:
+        return max(0, self.head - self.capacity)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._readers)
+
+    def start(self):
+        if self._producer is None:
+            self._producer = asyncio.get_running_loop().create_task(self._produce())
+
+    async def _produce(self):
+        try:
+            async for frame in aiter_frames(self.stream):
+                while self._cursors and self.head - min(self._cursors.values()) >= self.capacity:
+                    self._room.clear()
+                    await self._room.wait()
+                self.ring[self.head % self.capacity] = frame
+                self.head += 1
+                self._notify()
+                if self.head % PRODUCER_YIELD_EVERY == 0:
+                    await asyncio.sleep(0)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+            if self.subscribers == 0:
+                broadcasts.release(self)
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def subscribe(self) -> AsyncIterator[bytes]:
+        '''
+        The broadcast's frames from the first. The subscriber holds the
+        producer back from now on, not only once the response starts reading.
+        '''
+        reader = object()
+        self._readers.add(reader)
+        self._cursors[reader] = 0
+        frames = self._read(reader)
+        # A response dropped before its first read never runs _read's finally
+        weakref.finalize(frames, self._leave, reader)
+        return frames
+
+    async def _read(self, reader: object) -> AsyncIterator[bytes]:
+        cursor = 0
+        try:
+            while True:
+                if cursor < self.oldest:
+                    # Only when the frames were overwritten before this subscriber
+                    # joined: encode the rest of the section ourselves
+                    self._cursors.pop(reader, None)
+                    self._room.set()
+                    log.warning("broadcast_fallback", extra={"document": self.stream.document, "frames_behind": self.oldest - cursor})
+                    metrics.broadcast_fallbacks.inc()
+                    seq = 0
+                    async for frame in aiter_frames(self.stream):
+                        if seq >= cursor:
+                            yield frame
+                        seq += 1
+                    return
+                if cursor < self.head:
+                    yield self.ring[cursor % self.capacity]
+                    cursor += 1
+                    self._cursors[reader] = cursor
+                    self._room.set()
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    await self._changed.wait()
+        finally:
+            self._leave(reader)
+
+    def _leave(self, reader: object):
+        if reader not in self._readers:
+            return
+        self._readers.discard(reader)
+        self._cursors.pop(reader, None)
+        self._room.set()
+        if not self._readers:
+            broadcasts.release(self)
+
+
+class BroadcastRegistry:
+    def __init__(self):
+        self._broadcasts: dict[Hashable, Broadcast] = {}
+
+    def __len__(self):
+        return len(self._broadcasts)
+
+    def join(self, stream: SectionStream) -> Broadcast:
+        # The title tells search streams apart, which all share the same pseudo section
+        section = stream.section
+        key = (stream.document, section.kind, section.start, section.end, section.title)
+        broadcast = self._broadcasts.get(key)
+        # Once the first frame has been overwritten a new joiner can't start from the top
+        if broadcast is None or broadcast.oldest > 0:
+            broadcast = self._broadcasts[key] = Broadcast(key, stream)
+            broadcast.start()
+        return broadcast
+
+    def release(self, broadcast: Broadcast):
+        # Finished broadcasts go with their last subscriber; running ones stay
+        # so the next joiner still shares the producer
+        if broadcast.done and self._broadcasts.get(broadcast.key) is broadcast:
+            del self._broadcasts[broadcast.key]
+
+
+broadcasts = BroadcastRegistry()
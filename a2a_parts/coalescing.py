@@ -0,0 +1,104 @@
+import json
+import os
+from typing import AnyStr, AsyncIterator, Callable, Iterable, Iterator
+import anyio
+from anyio.streams.memory import MemoryObjectReceiveStream
+
+# Lines per message: a frame closes after BATCH_LINES lines or once it holds
+# BATCH_BYTES of text, whichever comes first. 1 and 0 keep one line per frame.
+BATCH_LINES = max(1, int(os.getenv("STREAM_BATCH_LINES", "1")))
+BATCH_BYTES = int(os.getenv("STREAM_BATCH_BYTES", "0"))
+# "parts" sends every line as its own TextPart, "joined" sends one newline-joined TextPart
+BATCH_FORMAT = os.getenv("STREAM_BATCH_FORMAT", "parts").lower()
+
+# Frames per write: buffered frames go out once FLUSH_BYTES are pending or
+# FLUSH_MS have passed since the first of them was buffered. 0 writes every frame.
+FLUSH_BYTES = int(os.getenv("STREAM_FLUSH_BYTES", "0"))
+FLUSH_MS = int(os.getenv("STREAM_FLUSH_MS", "50"))
+
+
+def pack(batch: list[str]) -> list[str]:
+    if BATCH_FORMAT == "joined" and len(batch) > 1:
+        return ["\n".join(line.strip() for line in batch)]
+    return batch
+
+
+def pack_escaped(batch: list[bytes]) -> list[bytes]:
+    '''
+    `pack` for lines that are already stripped and JSON-escaped
+    '''
+    if BATCH_FORMAT == "joined" and len(batch) > 1:
+        # The joined text is stripped again when it becomes a TextPart
+        lo, hi = 0, len(batch)
+        while lo < hi and not batch[lo]:
+            lo += 1
+        while hi > lo and not batch[hi - 1]:
+            hi -= 1
+        return [b"\\n".join(batch[lo:hi])]
+    return batch
+
+
+def text_size(line: str) -> int:
+    '''
+    Bytes a line adds to a message: stripped and JSON-escaped, as the corpus
+    pack stores it, so text and pack lines are batched alike
+    '''
+    return len(json.dumps(line.strip(), ensure_ascii=False).encode()) - 2
+
+
+def batch_lines(
+    lines: Iterable[AnyStr],
+    pack_batch: Callable[[list[AnyStr]], list[AnyStr]] = pack,
+    size: Callable[[AnyStr], int] = text_size,
+) -> Iterator[list[AnyStr]]:
+    batch: list[AnyStr] = []
+    batch_bytes = 0
+
+    for line in lines:
+        batch.append(line)
+        if BATCH_BYTES:
+            batch_bytes += size(line)
+        if len(batch) >= BATCH_LINES or (BATCH_BYTES and batch_bytes >= BATCH_BYTES):
+            yield pack_batch(batch)
+            batch = []
+            batch_bytes = 0
+
+    if batch:
+        yield pack_batch(batch)
+
+
+async def abundle_writes(frames: MemoryObjectReceiveStream[bytes]) -> AsyncIterator[bytes]:
+    '''
+    The frames received from `frames`, bundled into writes of at least
+    FLUSH_BYTES. A partial bundle goes out FLUSH_MS after its first frame,
+    also while the producer is stalled.
+    '''
+    if not FLUSH_BYTES:
+        async for frame in frames:
+            yield frame
+        return
+
+    buffer = bytearray()
+    deadline = 0.0
+    while True:
+        frame = None
+        # Receiving from a memory stream can be cancelled without losing a frame
+        with anyio.move_on_after(max(0.0, deadline - anyio.current_time()) if buffer else None):
+            try:
+                frame = await frames.receive()
+            except anyio.EndOfStream:
+                break
+
+        if frame is None:
+            yield bytes(buffer)
+            buffer.clear()
+            continue
+        if not buffer:
+            deadline = anyio.current_time() + FLUSH_MS / 1000
+        buffer += frame
+        if len(buffer) >= FLUSH_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+
+    if buffer:
+        yield bytes(buffer)
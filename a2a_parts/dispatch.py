@@ -0,0 +1,136 @@
+import inspect
+import anyio
+from typing import Any, Callable
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from pydantic_core import from_json
+import a2a.types as a2a_types
+import a2a.error_types as a2a_error_types
+from a2a_parts.handle_messaging import handle_message_send, handle_message_stream
+from a2a_parts import admission, handle_tasks
+from a2a_parts.backpressure import BackpressureStreamingResponse
+from utils import metrics, profiling
+from utils.log import get_logger
+
+log = get_logger("dispatch")
+
+def last_event_id(request: Request) -> str | None:
+    return request.headers.get("last-event-id")
+
+
+# Every handler takes the validated request and the HTTP request, and returns
+# either a pydantic response model or a ready Starlette response
+Handler = Callable[[a2a_types.JSONRPCRequest, Request], Any]
+
+HANDLERS: dict[str, Handler] = {
+    "message/stream": lambda rpc, request: handle_message_stream(rpc.params, rpc.id, last_event_id(request)),
+    "tasks/sendSubscribe": lambda rpc, request: handle_message_stream(rpc.params, rpc.id, last_event_id(request)),
+    "message/send": lambda rpc, request: handle_message_send(rpc.params, rpc.id),
+    "tasks/get": lambda rpc, request: handle_tasks.handle_get_task(rpc.params, rpc.id),
+    "tasks/cancel": lambda rpc, request: handle_tasks.handle_cancel_task(rpc.params, rpc.id),
+    "tasks/resubscribe": lambda rpc, request: handle_tasks.handle_resubscribe(rpc.params, rpc.id, last_event_id(request)),
+    "tasks/pushNotification/set": lambda rpc, request: handle_tasks.handle_set_push_notification(rpc.params, rpc.id),
+    "tasks/pushNotification/get": lambda rpc, request: handle_tasks.handle_get_push_notification(rpc.params, rpc.id),
+}
+
+
+def json_response(model: BaseModel) -> Response:
+    return Response(model.model_dump_json(), media_type="application/json")
+
+
+def error_response(error: a2a_error_types.JSONRPCError, request_id=None) -> Response:
+    return json_response(a2a_types.JSONRPCResponse(id=request_id, error=error))
+
+
+def peek_request_id(body: bytes):
+    '''
+    Best-effort id for error responses, only used once validation has failed
+    '''
+    try:
+        payload = from_json(body, allow_partial=True)
+    except ValueError:
+        return None
+    request_id = payload.get("id") if isinstance(payload, dict) else None
+    return request_id if isinstance(request_id, (int, str)) else None
+
+
+def validation_error(e: ValidationError) -> a2a_error_types.JSONRPCError:
+    first = e.errors(include_url=False)[0]
+
+    if first["type"] == "json_invalid":
+        return a2a_error_types.JSONParseError()
+    if first["type"] == "union_tag_invalid":
+        return a2a_error_types.MethodNotFoundError()
+
+    details = [
+        {"loc": ".".join(str(part) for part in error["loc"]), "msg": error["msg"]}
+        for error in e.errors(include_url=False)
+    ]
+    # loc starts with the union tag (the method), then the failing field
+    if len(first["loc"]) > 1 and first["loc"][1] == "params":
+        return a2a_error_types.InvalidParamsError(data=details)
+    return a2a_error_types.InvalidRequestError(data=details)
+
+
+async def dispatch(body: bytes, request: Request) -> Response:
+    '''
+    Validate the raw body in one pass and hand it to the method's handler.
+
+    A2ARequest is a union discriminated on `method`, so validate_json only
+    walks the schema of the method that was called.
+    '''
+    try:
+        rpc_request = a2a_types.A2ARequest.validate_json(body)
+    except ValidationError as e:
+        return error_response(validation_error(e), peek_request_id(body))
+
+    metrics.rpc_requests.inc(method=rpc_request.method)
+    log.info("rpc_received", extra={"method": rpc_request.method, "rpc_id": rpc_request.id})
+
+    lease = None
+    if rpc_request.method in admission.STREAMING_METHODS:
+        try:
+            lease = await admission.admit(request)
+        except admission.Overloaded as e:
+            # Refused at once rather than queued, with a hint when to come back
+            response = error_response(admission.overloaded_error(e), rpc_request.id)
+            response.headers["Retry-After"] = str(admission.ADMISSION_RETRY_AFTER_SECONDS)
+            return response
+
+    profile = profiling.begin(request.headers.get(profiling.HEADER))
+    try:
+        response = await call_handler(rpc_request, request)
+    except BaseException:
+        if lease is not None:
+            with anyio.CancelScope(shield=True):
+                await lease.arelease()
+        raise
+    if lease is not None:
+        # A stream holds its slot until it ends, an error answer gives it back now
+        if isinstance(response, BackpressureStreamingResponse):
+            response.on_close = lease.arelease
+        else:
+            await lease.arelease()
+    if profile is not None:
+        response.headers["X-Profile-Id"] = profile.id
+        # A stream's profile runs until the stream ends
+        if not isinstance(response, StreamingResponse):
+            profile.finish()
+    return response
+
+
+async def call_handler(rpc_request: a2a_types.JSONRPCRequest, request: Request) -> Response:
+    handler = HANDLERS.get(rpc_request.method)
+    if handler is None:
+        return error_response(a2a_error_types.MethodNotFoundError(), rpc_request.id)
+
+    try:
+        response = handler(rpc_request, request)
+        if inspect.isawaitable(response):
+            response = await response
+    except Exception:
+        log.exception("rpc_failed", extra={"method": rpc_request.method, "rpc_id": rpc_request.id})
+        return error_response(a2a_error_types.InternalError(), rpc_request.id)
+
+    return json_response(response) if isinstance(response, BaseModel) else response
@@ -0,0 +1,209 @@
+import functools
+import os
+import time
+from typing import Callable, Hashable, Iterable, Iterator, NamedTuple
+from uuid import uuid4 as uuid
+import a2a.types as a2a_types
+from a2a_parts.messaging import build_agent_message_from_lines, build_artifact_chunk_from_lines, build_status_update
+from utils import metrics, profiling
+from utils.lru import LRUCache
+
+FRAME_CACHE_ENABLED = os.getenv("FRAME_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+FRAME_CACHE_MAX_BYTES = int(os.getenv("FRAME_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Placeholder ids rendered into a template and then cut out of it
+RPC_ID_SLOT = "rpc-id-slot"
+MESSAGE_ID_SLOT = "message-id-slot"
+TASK_ID_SLOT = "task-id-slot"
+# Two text parts rendered into a skeleton frame, to find where parts go and what separates them
+PART_SLOTS = ("part-slot-1", "part-slot-2")
+# Artifact chunks are rendered as continuing the artifact; the first and last one a stream sends are flipped
+CONTINUES = b'"append":true'
+STARTS = b'"append":false'
+NOT_LAST = b'"lastChunk":false'
+LAST = b'"lastChunk":true'
+STATUS_EVENT = "statusUpdate"
+
+
+class FrameTemplate(NamedTuple):
+    '''
+    An encoded SSE frame split around the JSON-RPC id and the messageId,
+    or for an artifact chunk the id of the task it belongs to
+    '''
+    head: bytes
+    middle: bytes
+    tail: bytes
+
+    def fill(self, rpc_id: bytes, message_id: bytes) -> bytes:
+        return b"".join((self.head, rpc_id, self.middle, message_id, self.tail))
+
+    @property
+    def size(self) -> int:
+        return len(self.head) + len(self.middle) + len(self.tail)
+
+
+def encode_frame(event: str, lines: list[str], task_id: bytes | None = None) -> bytes:
+    started = time.perf_counter()
+    if task_id is not None:
+        frame = render_template(event, lines, artifact=True).fill(uuid().hex.encode(), task_id)
+    else:
+        with profiling.span("build"):
+            a2a_response = build_agent_message_from_lines(lines)
+        with profiling.span("serialize"):
+            frame = f"event: {event}\ndata: {a2a_response.model_dump_json()}\n\n".encode("utf-8")
+    metrics.frame_render_seconds.observe(time.perf_counter() - started, method="model")
+    return frame
+
+
+def encode_status_frame(task_id: str, state: a2a_types.TaskState, final: bool = False) -> bytes:
+    a2a_response = build_status_update(task_id, state, final)
+    return f"event: {STATUS_EVENT}\ndata: {a2a_response.model_dump_json(exclude_none=True)}\n\n".encode("utf-8")
+
+
+def render_template(event: str, lines: list[str], artifact: bool = False) -> FrameTemplate:
+    '''
+    An agent message frame, or with `artifact` a chunk of a task's artifact
+    '''
+    with profiling.span("build"):
+        if artifact:
+            a2a_response = build_artifact_chunk_from_lines(TASK_ID_SLOT, lines)
+        else:
+            a2a_response = build_agent_message_from_lines(lines)
+            a2a_response.result.messageId = MESSAGE_ID_SLOT
+        a2a_response.id = RPC_ID_SLOT
+    with profiling.span("serialize"):
+        # Artifact output is new, so it can leave out the null fields message frames have always sent
+        frame = f"event: {event}\ndata: {a2a_response.model_dump_json(exclude_none=artifact)}\n\n".encode("utf-8")
+
+    # The rpc id comes before the text and the messageId after it, and an
+    # artifact's task id before it too, so no split can land inside the lines
+    head, rest = frame.split(f'"{RPC_ID_SLOT}"'.encode(), 1)
+    if artifact:
+        middle, _, tail = rest.partition(f'"{TASK_ID_SLOT}"'.encode())
+    else:
+        middle, _, tail = rest.rpartition(f'"{MESSAGE_ID_SLOT}"'.encode())
+    return FrameTemplate(head + b'"', b'"' + middle + b'"', b'"' + tail)
+
+
+@functools.cache
+def skeleton(event: str, artifact: bool = False) -> tuple[FrameTemplate, bytes, bytes, bytes]:
+    '''
+    (template, before the first part's text, between two parts' texts, after
+    the last part's text) of an `event` frame. The parts are in the template's
+    middle for a message and in its tail for an artifact chunk.
+    '''
+    template = render_template(event, list(PART_SLOTS), artifact)
+    before, rest = (template.tail if artifact else template.middle).split(PART_SLOTS[0].encode(), 1)
+    separator, after = rest.split(PART_SLOTS[1].encode(), 1)
+    return template, before, separator, after
+
+
+def splice_template(event: str, escaped: list[bytes], artifact: bool = False) -> FrameTemplate:
+    '''
+    `render_template` for lines that are already stripped and JSON-escaped:
+    the text goes straight between skeleton bytes, without building a model
+    '''
+    template, before, separator, after = skeleton(event, artifact)
+    with profiling.span("serialize"):
+        parts = before + separator.join(escaped) + after
+        return template._replace(tail=parts) if artifact else template._replace(middle=parts)
+
+
+def starting_chunk(frame: bytes) -> bytes:
+    '''
+    An artifact chunk frame made the one that starts the artifact. The flags
+    follow the parts, whose escaped text cannot contain them, so the last
+    occurrence is the field itself.
+    '''
+    head, _, tail = frame.rpartition(CONTINUES)
+    return head + STARTS + tail
+
+
+def last_chunk(frame: bytes) -> bytes:
+    head, _, tail = frame.rpartition(NOT_LAST)
+    return head + LAST + tail
+
+
+def templates_size(templates: list[FrameTemplate]) -> int:
+    return sum(template.size for template in templates)
+
+
+section_templates = LRUCache(FRAME_CACHE_MAX_BYTES, sizeof=templates_size)
+
+
+def timed_templates(
+    method: str,
+    render: Callable,
+    event: str,
+    frames: Iterable[list],
+    artifact: bool = False,
+) -> list[FrameTemplate]:
+    templates = []
+    for lines in frames:
+        started = time.perf_counter()
+        templates.append(render(event, lines, artifact))
+        metrics.frame_render_seconds.observe(time.perf_counter() - started, method=method)
+    return templates
+
+
+def build_templates(event: str, frames: Iterable[list[str]], artifact: bool = False) -> list[FrameTemplate]:
+    return timed_templates("template", render_template, event, frames, artifact)
+
+
+def splice_templates(event: str, frames: Iterable[list[bytes]], artifact: bool = False) -> list[FrameTemplate]:
+    return timed_templates("splice", splice_template, event, frames, artifact)
+
+
+def cached_templates(key: Hashable, event: str, artifact: bool = False) -> list[FrameTemplate] | None:
+    return section_templates.get((key, event, artifact))
+
+
+def store_templates(key: Hashable, event: str, templates: list[FrameTemplate], artifact: bool = False):
+    section_templates.put((key, event, artifact), templates)
+
+
+def fill_templates(templates: list[FrameTemplate], task_id: bytes | None = None) -> Iterator[bytes]:
+    '''
+    Fresh ids into each template: an rpc id and a messageId, or for artifact
+    chunks an rpc id and `task_id`
+    '''
+    for template in templates:
+        with profiling.span("serialize"):
+            frame = template.fill(uuid().hex.encode(), task_id or uuid().hex.encode())
+        yield frame
+
+
+def stream_frames(
+    key: Hashable,
+    event: str,
+    frames: Callable[[], Iterable[list[str]]],
+    escaped_frames: Callable[[], Iterable[list[bytes]]] | None = None,
+    task_id: bytes | None = None,
+) -> Iterator[bytes]:
+    '''
+    Yield one SSE frame per group of lines of a section.
+
+    With the cache enabled, the section is rendered into templates once
+    and every later stream only splices fresh ids into the cached bytes.
+    `key` identifies the section, `frames` produces its text on a cache miss,
+    or `escaped_frames` its pre-escaped text when the corpus pack has it.
+    With `task_id` (JSON-escaped) the frames are chunks of that task's artifact.
+    '''
+    artifact = task_id is not None
+    if escaped_frames is not None and not FRAME_CACHE_ENABLED:
+        yield from fill_templates(splice_templates(event, escaped_frames(), artifact), task_id)
+        return
+    if not FRAME_CACHE_ENABLED:
+        for lines in frames():
+            yield encode_frame(event, lines, task_id)
+        return
+
+    templates = cached_templates(key, event, artifact)
+    if templates is None:
+        if escaped_frames is not None:
+            templates = splice_templates(event, escaped_frames(), artifact)
+        else:
+            templates = build_templates(event, frames(), artifact)
+        store_templates(key, event, templates, artifact)
+
+    yield from fill_templates(templates, task_id)
@@ -1,13 +1,30 @@
-from fastapi.responses import StreamingResponse
+import asyncio
+import inspect
+from anyio import to_thread
 import a2a.types as a2a_types
 import a2a.error_types as a2a_error_types
 import os
-import time
 import json
 import random
-from functools import reduce
+import re
 from uuid import uuid4 as uuid
-from a2a_parts.messaging import build_agent_message_from_line
+from a2a_parts.streaming import Segment, SectionStream, output_from_metadata, parse_event_id, streaming_response
+from a2a_parts.task_store import TaskRecord, tasks
+from a2a_parts.pacing import TokenBucket, pacing_from_metadata
+from a2a_parts.broadcast import InvalidSelection, broadcasts, selection_from_metadata
+from a2a_parts.skills import Route, UnknownSkill, skills
+from a2a_parts.push_notifications import INVALID_PUSH_URL, valid_url
+from a2a_parts.task_runner import runner
+from utils import document_index, metrics, profiling, search_index
+from utils.log import get_logger
+
+log = get_logger("handle_messaging")
+
+# i to cccxcix, enough for any chapter; the lookbehind keeps it from matching nothing
+ROMAN_NUMERAL = re.compile(r"c{0,3}(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3})(?<=[ivxlc])", re.IGNORECASE)
+CHAPTER_REFERENCE = re.compile(rf"\bchapter\s+(\d+|{ROMAN_NUMERAL.pattern})\b", re.IGNORECASE)
+VERSE_REFERENCE = re.compile(r"\bverses?\s+(\d+)(?:\s*(?:-|to)\s*(\d+))?", re.IGNORECASE)
+ROMAN_NUMERALS = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100}
 
 def get_task_id(params: a2a_types.MessageSendParams):
     task_id = uuid().hex if not params.message.taskId else params.message.taskId
@@ -25,223 +42,424 @@ def waypoints_generator():
         data = json.dumps(waypoint)
         yield f"event: locationUpdate\ndata: {data}\n\n"
 
-def get_random_sherlock_chapter():
-    file_path = "documents/the-adventures-of-sherlock-holmes.txt"
+def choose(sections: list[document_index.Section], selection: dict[str, int] | None = None) -> document_index.Section:
+    '''
+    Random section, or the one a broadcast selection names: a 1-based `section`
+    number, or a `seed` so every request with the same seed gets the same section
+    '''
+    if selection is None:
+        return random.choice(sections)
+    if "section" in selection:
+        if selection["section"] > len(sections):
+            raise InvalidSelection(f"broadcast section must be between 1 and {len(sections)}")
+        return sections[selection["section"] - 1]
+    return random.Random(selection["seed"]).choice(sections)
+
+def sherlock_chapter_stream(index: document_index.DocumentIndex, chapter: document_index.Section) -> SectionStream:
     stream_limit = int(os.getenv("STREAM_LIMIT", "50000"))  # default to 50KB if not set
-    total_bytes_sent = 0
-
-    chapter_titles = [
-        "I. A SCANDAL IN BOHEMIA",
-        "II. THE RED-HEADED LEAGUE",
-        "III. A CASE OF IDENTITY",
-        "IV. THE BOSCOMBE VALLEY MYSTERY",
-        "V. THE FIVE ORANGE PIPS",
-        "VI. THE MAN WITH THE TWISTED LIP",
-        "VII. THE ADVENTURE OF THE BLUE CARBUNCLE",
-        "VIII. THE ADVENTURE OF THE SPECKLED BAND",
-        "IX. THE ADVENTURE OF THE ENGINEER’S THUMB",
-        "X. THE ADVENTURE OF THE NOBLE BACHELOR",
-        "XI. THE ADVENTURE OF THE BERYL CORONET",
-        "XII. THE ADVENTURE OF THE COPPER BEECHES",
+    key = (index.name, chapter.kind, chapter.start)
+
+    return SectionStream(
+        document=index.name,
+        section=chapter,
+        segments=[
+            Segment(key, "storyMeta", lambda: [chapter.title]),
+            Segment(
+                key,
+                "storyLine",
+                lambda: (line for line in index.iter_lines(chapter) if line.strip()),
+                escaped=(lambda: (line for line in index.iter_escaped(chapter) if line)) if index.escaped is not None else None,
+            ),
+        ],
+        byte_limit=stream_limit,
+    )
+
+def get_random_sherlock_chapter(selection: dict[str, int] | None = None) -> SectionStream:
+    index = document_index.get_index("sherlock")
+    return sherlock_chapter_stream(index, choose(index.of_kind("chapter"), selection))
+
+def bible_chapter_stream(index: document_index.DocumentIndex, chapter: document_index.Section) -> SectionStream:
+    def verses():
+        for verse in index.within("verse", chapter):
+            yield " ".join(line.strip() for line in index.iter_lines(verse) if line.strip())
+
+    return SectionStream(
+        document=index.name,
+        section=chapter,
+        segments=[Segment((index.name, chapter.kind, chapter.start), "verse", verses)],
+    )
+
+def get_random_bible_chapter(selection: dict[str, int] | None = None) -> SectionStream:
+    '''
+    Pick a random chapter from the bible index
+    Stream that chapter verse by verse, straight from its byte range
+
+    Raises FileNotFoundError up front if documents/bible.txt is missing
+    '''
+    index = document_index.get_index("bible")
+    chapters = index.of_kind("chapter")
+
+    if not chapters:
+        raise ValueError("No chapters found in the bible text.")
+
+    return bible_chapter_stream(index, choose(chapters, selection))
+
+
+def rj_scene_stream(index: document_index.DocumentIndex, scene: document_index.Section) -> SectionStream:
+    key = (index.name, scene.kind, scene.start)
+
+    return SectionStream(
+        document=index.name,
+        section=scene,
+        segments=[
+            # ACT and SCENE as meta info, then the lines of the scene
+            Segment(key, "sceneMeta", lambda: [f"{scene.parent} - {scene.title}"]),
+            Segment(
+                key,
+                "sceneLine",
+                lambda: index.iter_lines(scene),
+                escaped=(lambda: index.iter_escaped(scene)) if index.escaped is not None else None,
+            ),
+        ],
+    )
+
+
+def get_random_rj_scene(selection: dict[str, int] | None = None) -> SectionStream:
+    index = document_index.get_index("romeo_and_juliet")
+    scenes = index.of_kind("scene")
+
+    if not scenes:
+        raise ValueError("No scenes found in Romeo and Juliet text.")
+
+    return rj_scene_stream(index, choose(scenes, selection))
+
+
+def search_stream(query: str) -> SectionStream:
+    '''
+    The best-matching passages across every document, ranked by BM25,
+    each sent as one line prefixed with the document it comes from
+    '''
+    index = search_index.get_index()
+    hits = index.search(query)
+    # Queries with the same terms rank the same passages, but the heading
+    # quotes the query as it was written
+    key = ("search", " ".join(search_index.tokenize(query)))
+
+    return SectionStream(
+        document="search",
+        section=document_index.Section("query", query, 0, 0),
+        segments=[
+            Segment(("search", query), "searchMeta", lambda: [f'{len(hits)} passages for "{query}"']),
+            Segment(key, "searchResult", lambda: (f"[{hit.document}] {search_index.passage_text(hit)}" for hit in hits)),
+        ],
+    )
+
+
+def art_of_war_stream(index: document_index.DocumentIndex, section: document_index.Section) -> SectionStream:
+    '''
+    A chapter, or a run of verses inside one, read verse by verse from the
+    precomputed verse table. Each verse goes out whole as one line.
+    '''
+    chapter = section if section.kind == "chapter" else index.enclosing("chapter", section.start)
+    verses = index.within("verse", section)
+    heading = chapter.title
+    if section.kind != "chapter" and verses:
+        first, last = verses[0].title.split(",")[0], verses[-1].title.split(",")[-1]
+        heading = f"{chapter.title}, verse {first}" if first == last else f"{chapter.title}, verses {first}-{last}"
+
+    def verse_lines():
+        for verse in verses:
+            yield " ".join(line.strip() for line in index.iter_lines(verse) if line.strip())
+
+    key = (index.name, section.kind, section.start, section.end)
+    return SectionStream(
+        document=index.name,
+        section=section,
+        segments=[
+            Segment(key, "chapterMeta", lambda: [heading]),
+            Segment(key, "verse", verse_lines),
+        ],
+    )
+
+
+def roman_to_int(numeral: str) -> int:
+    values = [ROMAN_NUMERALS[char] for char in numeral.lower()]
+    return sum(-value if value < following else value for value, following in zip(values, values[1:] + [0]))
+
+
+def reference_number(value: int | str, roman: bool = False) -> int:
+    '''
+    A chapter or verse number given as an int or a string of digits, or as a
+    roman numeral when `roman`. Raises ValueError for anything else, bools included.
+    '''
+    if type(value) is int:
+        return value
+    if isinstance(value, str):
+        if value.isdigit():
+            return int(value)
+        if roman and ROMAN_NUMERAL.fullmatch(value):
+            return roman_to_int(value)
+    raise ValueError(f"{value!r} is not a number")
+
+
+def get_art_of_war_section(
+    chapter_number: int | None = None,
+    verse_range: tuple[int, int] | None = None,
+    selection: dict[str, int] | None = None,
+) -> SectionStream:
+    '''
+    A chapter by number, or picked at random without one, optionally narrowed
+    to the verses numbered `verse_range`
+    '''
+    index = document_index.get_index("art_of_war")
+    chapters = index.of_kind("chapter")
+
+    if not chapters:
+        raise ValueError("No chapters found in the Art of War text.")
+
+    if chapter_number is not None:
+        if not 1 <= chapter_number <= len(chapters):
+            raise InvalidSelection(f"The Art of War has chapters 1 to {len(chapters)}")
+        chapter = chapters[chapter_number - 1]
+    else:
+        chapter = choose(chapters, selection)
+
+    if verse_range is None:
+        return art_of_war_stream(index, chapter)
+
+    first, last = verse_range
+    # A verse titled "13,14" covers both numbers
+    verses = [
+        verse for verse in index.within("verse", chapter)
+        if any(first <= int(number) <= last for number in verse.title.split(","))
     ]
+    if not verses:
+        raise InvalidSelection(f"{chapter.title} has no verses {first} to {last}")
+    return art_of_war_stream(index, document_index.Section("verses", "", verses[0].start, verses[-1].end))
+
+
+def art_of_war_reference(route: Route) -> tuple[int | None, tuple[int, int] | None]:
+    '''
+    The chapter and verse range a message asks for: DataPart fields
+    `{"chapter": 3, "verses": [5, 8]}`, or "chapter iii verses 5-8" in its text
+    '''
+    chapter, verses = route.data.get("chapter"), route.data.get("verses")
+    if chapter is None:
+        reference = CHAPTER_REFERENCE.search(route.text)
+        chapter = reference.group(1) if reference else None
+    if verses is None:
+        reference = VERSE_REFERENCE.search(route.text)
+        verses = [reference.group(1), reference.group(2) or reference.group(1)] if reference else None
 
-    chosen_idx = random.randint(0, len(chapter_titles) - 1)
-    chosen_title = chapter_titles[chosen_idx]
-    next_title = chapter_titles[chosen_idx + 1] if chosen_idx + 1 < len(chapter_titles) else None
-
-    with open(file_path, "r", encoding="utf-8") as f:
-        in_chapter = False
-        passed_intro = False
-
-        for line in f:
-            stripped = line.strip().upper()
-
-            if not passed_intro:
-                if stripped == "I. A SCANDAL IN BOHEMIA":
-                    passed_intro = True
-                else:
-                    continue
-
-            if stripped == chosen_title.upper():
-                in_chapter = True
-
-                meta_response = build_agent_message_from_line(chosen_title.title())
-                chunk = f"event: storyMeta\ndata: {meta_response.model_dump_json()}\n\n"
-                total_bytes_sent += len(chunk.encode("utf-8"))
-                if total_bytes_sent > stream_limit:
-                    break
-                yield chunk
-                continue
-
-            if in_chapter and next_title and stripped == next_title.upper():
-                break
-
-            if in_chapter and line.strip():
-                a2a_response = build_agent_message_from_line(line)
-                chunk = f"event: storyLine\ndata: {a2a_response.model_dump_json()}\n\n"
-                total_bytes_sent += len(chunk.encode("utf-8"))
-                if total_bytes_sent > stream_limit:
-                    break
-                yield chunk
-
-def get_random_bible_chapter():
-    '''
-    Get a random 100KB chunk
-    Seek up to the beginning of the nearest chapter
-    Read down to the end of the chapter
-    Stream that chapter verse by verse
-    '''
-
-    def extract_chapter_verse(line):
-        parts = line.strip().split(" ", 1)
-        if len(parts) < 2:
-            return None, None
-        chapter_verse = parts[0]
-        if ":" not in chapter_verse:
-            return None, None
-        try:
-            chapter_str, verse_str = chapter_verse.split(":")
-            return int(chapter_str), int(verse_str)
-        except ValueError:
-            return None, None
-
-    file_path = "documents/bible.txt"
-    file_size = os.path.getsize(file_path)
-
-    # Choose a random offset
-    start_pos = random.randint(0, max(0, file_size - 100 * 1024))
-
-    with open(file_path, "r", encoding="utf-8") as f:
-        f.seek(start_pos)
-        if start_pos != 0:
-            f.readline()  # skip partial line
-        forward_lines = f.readlines()
-
-    with open(file_path, "r", encoding="utf-8") as f:
-        full_lines = f.readlines()
-
-    # Find the index of the first full line from the forward chunk
-    first_line = forward_lines[0].strip()
     try:
-        start_index = full_lines.index(first_line + "\n")
+        if chapter is not None:
+            chapter = reference_number(chapter, roman=True)
+        if verses is not None:
+            if not isinstance(verses, list):
+                verses = [verses, verses]
+            first, last = (reference_number(number) for number in verses)
+            verses = (first, last)
     except ValueError:
-        # fallback in case of line-ending inconsistency
-        start_index = 0
-
-    # Walk backward to find the nearest line with verse `X:1`
-    chapter_start_index = start_index
-    for i in range(start_index, -1, -1):
-        line = full_lines[i]
-        chapter, verse = extract_chapter_verse(line)
-        if chapter is not None and verse == 1:
-            chapter_start_index = i
-            break
-
-    # Identify the current chapter
-    current_chapter, _ = extract_chapter_verse(full_lines[chapter_start_index])
-
-    # Yield lines in this chapter until next chapter begins
-    for line in full_lines[chapter_start_index:]:
-        chapter, verse = extract_chapter_verse(line)
-        if chapter is not None and chapter != current_chapter and verse == 1:
-            break
-
-
-        a2a_response = build_agent_message_from_line(line)
-
-        yield f"event: verse\ndata: {a2a_response.model_dump_json()}\n\n"
-
-
-def get_random_rj_scene():
-    file_path = "documents/romeo-and-juliet.txt"
-
-    with open(file_path, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    scenes = []
-    act_at_last_scene = None
-    current_act = None
-    current_scene = None
-    buffer = []
-    start_index = 0
-
-    for i, line in enumerate(lines):
-        stripped = line.strip().upper()
-
-        if stripped.startswith("ACT "):
-            current_act = stripped.title()  # Don't assign yet
-            continue
-
-        if stripped.startswith("SCENE "):
-            # Capture the previous scene
-            if current_scene and buffer:
-                scenes.append({
-                    "act": act_at_last_scene,
-                    "scene": current_scene,
-                    "start": start_index,
-                    "end": i,
-                    "lines": buffer,
-                })
-                buffer = []
-
-            # New scene begins here
-            current_scene = stripped.title()
-            start_index = i
-            act_at_last_scene = current_act  # Now assign act to this scene
-            continue
-
-        if current_scene:
-            buffer.append(line)
-
-    # Capture final scene
-    if current_scene and buffer:
-        scenes.append({
-            "act": act_at_last_scene,
-            "scene": current_scene,
-            "start": start_index,
-            "end": len(lines),
-            "lines": buffer,
-        })
+        raise InvalidSelection("chapter must be a number and verses a number or a [first, last] pair")
+    return chapter, verses
 
-    if not scenes:
-        raise ValueError("No scenes found in Romeo and Juliet text.")
 
-    chosen = random.choice(scenes)
+SECTION_STREAMS = {
+    "sherlock": sherlock_chapter_stream,
+    "bible": bible_chapter_stream,
+    "romeo_and_juliet": rj_scene_stream,
+    "art_of_war": art_of_war_stream,
+}
+
+
+async def restore_stream(
+    document: str,
+    kind: str,
+    start: int,
+    query: str | None = None,
+    end: int | None = None,
+) -> SectionStream | None:
+    '''
+    Rebuild the stream for a section recorded on a task
+    '''
+    if document == "search":
+        return await to_thread.run_sync(search_stream, query or "")
+    index = document_index.get_index(document)
+    section = index.find(kind, start) if end is None else document_index.Section(kind, "", start, end)
+    if section is None or document not in SECTION_STREAMS:
+        return None
+    return SECTION_STREAMS[document](index, section)
+
+
+@skills.handler("search_documents")
+async def search_skill(route: Route, selection: dict[str, int] | None = None) -> SectionStream:
+    query = str(route.data.get("query", route.remainder)).strip()
+    if not search_index.tokenize(query):
+        raise InvalidSelection("search needs a query with at least one word to look for")
+    # Ranking scores every passage holding a query term, too slow for the event loop
+    return await to_thread.run_sync(search_stream, query)
+
+
+@skills.handler("stream_bible")
+def bible_skill(route: Route, selection: dict[str, int] | None = None) -> SectionStream:
+    return get_random_bible_chapter(selection)
+
+
+@skills.handler("stream_romeo_and_juliet")
+def rj_skill(route: Route, selection: dict[str, int] | None = None) -> SectionStream:
+    return get_random_rj_scene(selection)
+
+
+@skills.handler("stream_art_of_war")
+def art_of_war_skill(route: Route, selection: dict[str, int] | None = None) -> SectionStream:
+    chapter, verses = art_of_war_reference(route)
+    return get_art_of_war_section(chapter, verses, selection)
+
+
+@skills.handler("stream_sherlock")
+def sherlock_skill(route: Route, selection: dict[str, int] | None = None) -> SectionStream:
+    return get_random_sherlock_chapter(selection)
+
 
-    # Yield ACT and SCENE as meta info
-    meta_text = f"{chosen['act']} - {chosen['scene']}"
-    meta_response = build_agent_message_from_line(meta_text)
+async def select_stream(params: a2a_types.MessageSendParams, selection: dict[str, int] | None = None) -> SectionStream:
+    with profiling.span("route"):
+        route = skills.route(params.message.parts)
+        metrics.skill_routes.inc(skill=route.skill.id)
+        stream = skills.handler_for(route.skill)(route, selection)
+        if inspect.isawaitable(stream):
+            stream = await stream
+        return stream
 
-    yield f"event: sceneMeta\ndata: {meta_response.model_dump_json()}\n\n"
 
-    # Yield lines from the scene
-    for line in chosen["lines"]:
-        a2a_response = build_agent_message_from_line(line)
+def document_unavailable(request_id=None):
+    return a2a_types.JSONRPCResponse(
+        id=request_id,
+        error=a2a_error_types.InternalError(
+            message="The requested document is not available on this agent",
+        ),
+    )
 
-        yield f"event: sceneLine\ndata: {a2a_response.model_dump_json()}\n\n"
 
+async def resume_task_stream(task: TaskRecord, last_received: int | None = None, pacing: TokenBucket | None = None):
+    '''
+    Continue a task's stream after the last frame the client saw, or after the
+    last frame handed to it when the client didn't say
+    '''
+    stream = await restore_stream(task.document, task.section_kind, task.section_start, task.query, task.section_end)
+    if stream is None:
+        return None
+    if last_received is not None:
+        tasks.advance(task, last_received + 1)
+    return streaming_response(stream, task, pacing)
+
+
+def invalid_params(message: str, request_id=None):
+    return a2a_types.JSONRPCResponse(
+        id=request_id,
+        error=a2a_error_types.InvalidParamsError(data=message),
+    )
 
-def handle_message_stream(params: a2a_types.MessageSendParams):
+
+async def handle_message_stream(params: a2a_types.MessageSendParams, request_id=None, last_event_id=None):
     try:
-        params.message.parts
-        text_prompt = reduce(
-            lambda acc, cur: (acc + cur.text).lower() if cur.kind == "text" else acc, 
-            params.message.parts, 
-            ""
-        )
+        pacing = pacing_from_metadata(params.metadata, params.message.metadata)
+        selection = selection_from_metadata(params.metadata, params.message.metadata)
+        output = output_from_metadata(params.metadata, params.message.metadata)
+    except ValueError as e:
+        return invalid_params(str(e), request_id)
 
-        if "bible" in text_prompt:
-            return StreamingResponse(get_random_bible_chapter(), media_type="text/event-stream")
-        elif "romeo" in text_prompt or "juliet" in text_prompt:
-            return StreamingResponse(get_random_rj_scene(), media_type="text/event-stream")
-        else:
-            return StreamingResponse(get_random_sherlock_chapter(), media_type="text/event-stream")
-        
+    try:
+        # A reconnecting EventSource sends the id of the last frame it received
+        resume = parse_event_id(last_event_id)
+        task = await tasks.aget(resume[0]) if resume else None
+        if task is not None:
+            response = await resume_task_stream(task, resume[1], pacing)
+            if response is not None:
+                return response
+
+        stream = await select_stream(params, selection)
+        task = await tasks.asave(TaskRecord(
+            id=get_task_id(params),
+            document=stream.document,
+            section_kind=stream.section.kind,
+            section_start=stream.section.start,
+            section_end=stream.section.end if stream.section.kind == "verses" else None,
+            context_id=params.message.contextId,
+            query=stream.section.title if stream.document == "search" else None,
+            output=output,
+        ))
+        # Identical selections share one encoding of the section; artifact chunks carry their task's id, so can't
+        frames = None
+        if selection is not None and output == "messages":
+            frames = broadcasts.join(stream).subscribe()
+        elif selection is not None:
+            log.info("broadcast_skipped", extra={"rpc_id": request_id, "reason": "artifact output"})
+        return streaming_response(stream, task, pacing, frames)
+
+    except (InvalidSelection, UnknownSkill) as e:
+        return invalid_params(str(e), request_id)
+    except FileNotFoundError:
+        return document_unavailable(request_id)
     except:
+        log.exception("stream_failed", extra={"rpc_id": request_id})
         response = a2a_types.JSONRPCResponse(
-            messageId=uuid().hex,
+            id=request_id,
             error=a2a_error_types.InternalError(
                 message="An error occured",
             ),
         )
         return response
+
+
+async def handle_message_send(params: a2a_types.MessageSendParams, request_id=None):
+    '''
+    Non-streaming variant: answers at once with the task `submitted` while a
+    background worker produces the section into its artifacts, one per segment
+    (e.g. the scene title, then the scene), for tasks/get to pick up.
+    With `configuration.blocking` the answer waits for the finished task.
+    '''
+    try:
+        selection = selection_from_metadata(params.metadata, params.message.metadata)
+        stream = await select_stream(params, selection)
+    except (InvalidSelection, UnknownSkill) as e:
+        return invalid_params(str(e), request_id)
+    except FileNotFoundError:
+        return document_unavailable(request_id)
+
+    configuration = params.configuration
+    push_config = configuration.pushNotificationConfig if configuration is not None else None
+    if push_config is not None:
+        if not valid_url(push_config.url):
+            return invalid_params(INVALID_PUSH_URL, request_id)
+        # The configuration's model of the config predates the one tasks/pushNotification/set takes
+        push_config = a2a_types.PushNotificationConfig.model_validate(push_config.model_dump())
+
+    task_id = get_task_id(params)
+    previous = await tasks.aget(task_id)
+    task = await tasks.asave(TaskRecord(
+        id=task_id,
+        document=stream.document,
+        section_kind=stream.section.kind,
+        section_start=stream.section.start,
+        section_end=stream.section.end if stream.section.kind == "verses" else None,
+        context_id=params.message.contextId,
+        query=stream.section.title if stream.document == "search" else None,
+        state=a2a_types.TaskState.submitted,
+        history=(previous.history if previous is not None else []) + [params.message],
+        background=True,
+        push_config=push_config,
+    ))
+
+    try:
+        done = runner.submit(stream, task)
+    except asyncio.QueueFull:
+        await tasks.afinish(task, a2a_types.TaskState.rejected)
+        return a2a_types.JSONRPCResponse(
+            id=request_id,
+            error=a2a_error_types.InternalError(message="Too many tasks are queued, try again later"),
+        )
+
+    history_length = configuration.historyLength if configuration is not None else None
+    if configuration is not None and configuration.blocking:
+        await done.wait()
+    return a2a_types.SendMessageResponse(id=request_id, result=task.as_task(history_length))
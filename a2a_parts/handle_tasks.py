@@ -0,0 +1,87 @@
+import a2a.types as a2a_types
+import a2a.error_types as a2a_error_types
+from a2a_parts.handle_messaging import resume_task_stream
+from a2a_parts.pacing import pacing_from_metadata
+from a2a_parts.push_notifications import INVALID_PUSH_URL, valid_url
+from a2a_parts.streaming import parse_event_id
+from a2a_parts.task_store import TERMINAL_STATES, tasks
+
+
+def error_response(error: a2a_error_types.JSONRPCError, request_id=None):
+    return a2a_types.JSONRPCResponse(id=request_id, error=error)
+
+
+async def handle_get_task(params: a2a_types.TaskQueryParams, request_id=None):
+    task = await tasks.aget(params.id)
+    if task is None:
+        return error_response(a2a_error_types.TaskNotFoundError(), request_id)
+
+    return a2a_types.GetTaskResponse(id=request_id, result=task.as_task(params.historyLength))
+
+
+async def handle_cancel_task(params: a2a_types.TaskIdParams, request_id=None):
+    '''
+    Mark the task canceled and signal whichever process is producing it, whose
+    stream or worker stops at its next frame and sends a final canceled status
+    '''
+    task = await tasks.aget(params.id)
+    if task is None:
+        return error_response(a2a_error_types.TaskNotFoundError(), request_id)
+    if task.state in TERMINAL_STATES:
+        return error_response(a2a_error_types.TaskNotCancelableError(), request_id)
+
+    if not await tasks.arequest_cancel(task.id):
+        return error_response(a2a_error_types.TaskNotFoundError(), request_id)
+    task.cancel_requested = True
+    await tasks.afinish(task, a2a_types.TaskState.canceled)
+    return a2a_types.CancelTaskResponse(id=request_id, result=task.as_task())
+
+
+async def handle_resubscribe(params: a2a_types.TaskIdParams, request_id=None, last_event_id=None):
+    task = await tasks.aget(params.id)
+    if task is None:
+        return error_response(a2a_error_types.TaskNotFoundError(), request_id)
+
+    try:
+        pacing = pacing_from_metadata(params.metadata)
+    except ValueError as e:
+        return error_response(a2a_error_types.InvalidParamsError(data=str(e)), request_id)
+
+    # Only trust Last-Event-ID when it belongs to the task being resubscribed to
+    resume = parse_event_id(last_event_id)
+    last_received = resume[1] if resume and resume[0] == task.id else None
+
+    response = await resume_task_stream(task, last_received, pacing)
+    if response is None:
+        return error_response(a2a_error_types.TaskNotFoundError(), request_id)
+    return response
+
+
+async def handle_set_push_notification(params: a2a_types.TaskPushNotificationConfig, request_id=None):
+    task = await tasks.aget(params.id)
+    if task is None:
+        return error_response(a2a_error_types.TaskNotFoundError(), request_id)
+    # A streamed task's updates already go to the client holding its stream
+    if not task.background:
+        return error_response(a2a_error_types.PushNotificationNotSupportedError(), request_id)
+    if not valid_url(params.pushNotificationConfig.url):
+        return error_response(a2a_error_types.InvalidParamsError(data=INVALID_PUSH_URL), request_id)
+
+    task.push_config = params.pushNotificationConfig
+    await tasks.asave(task)
+    return a2a_types.SetTaskPushNotificationResponse(id=request_id, result=params)
+
+
+async def handle_get_push_notification(params: a2a_types.TaskIdParams, request_id=None):
+    task = await tasks.aget(params.id)
+    if task is None:
+        return error_response(a2a_error_types.TaskNotFoundError(), request_id)
+    if task.push_config is None:
+        return error_response(
+            a2a_error_types.InvalidParamsError(data="The task has no push notification config"),
+            request_id,
+        )
+    return a2a_types.GetTaskPushNotificationResponse(
+        id=request_id,
+        result=a2a_types.TaskPushNotificationConfig(id=task.id, pushNotificationConfig=task.push_config),
+    )
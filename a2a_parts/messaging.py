@@ -9,3 +9,34 @@ def build_agent_message_from_line(line: str) -> a2a_types.Message:
             role="agent",
         )
     )
+
+def build_agent_message_from_lines(lines: list[str]) -> a2a_types.Message:
+    return a2a_types.SendStreamingMessageSuccessResponse(
+        result=a2a_types.Message(
+            messageId=uuid().hex,
+            parts=[a2a_types.TextPart(text=line.strip()) for line in lines],
+            role="agent",
+        )
+    )
+
+def build_artifact_chunk_from_lines(task_id: str, lines: list[str]) -> a2a_types.SendStreamingMessageSuccessResponse:
+    return a2a_types.SendStreamingMessageSuccessResponse(
+        result=a2a_types.TaskArtifactUpdateEvent(
+            id=task_id,
+            artifact=a2a_types.Artifact(
+                parts=[a2a_types.TextPart(text=line.strip()) for line in lines],
+                index=0,
+                append=True,
+                lastChunk=False,
+            ),
+        )
+    )
+
+def build_status_update(task_id: str, state: a2a_types.TaskState, final: bool = False) -> a2a_types.SendStreamingMessageSuccessResponse:
+    return a2a_types.SendStreamingMessageSuccessResponse(
+        result=a2a_types.TaskStatusUpdateEvent(
+            id=task_id,
+            status=a2a_types.TaskStatus(state=state),
+            final=final,
+        )
+    )
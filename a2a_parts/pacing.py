@@ -0,0 +1,133 @@
+import asyncio
+import heapq
+import itertools
+from typing import Any, AsyncIterator
+
+# Hard ceiling so a request can't ask for a pace that is effectively a busy loop
+MAX_WAKEUPS_PER_SECOND = 1000
+
+
+class TokenBucket:
+    '''
+    Allows `rate` units per second with bursts of up to `burst` units.
+    The unit is a message ("lines") or a byte of SSE output ("bytes").
+    '''
+
+    def __init__(self, rate: float, unit: str = "lines", burst: float | None = None):
+        self.rate = rate
+        self.unit = unit
+        self.burst = burst if burst is not None else max(1.0, rate / 10)
+        self.tokens = self.burst
+        self.updated_at: float | None = None
+
+    def cost(self, frame: bytes) -> float:
+        return len(frame) if self.unit == "bytes" else 1
+
+    def reserve(self, cost: float, now: float) -> float:
+        '''
+        Take `cost` tokens and return when they are actually available
+        '''
+        if self.updated_at is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        self.tokens -= cost
+        if self.tokens >= 0:
+            return now
+        return now + -self.tokens / self.rate
+
+
+def pacing_from_metadata(*metadata: dict[str, Any] | None) -> TokenBucket | None:
+    '''
+    Read `{"pacing": {"linesPerSecond": 20}}` or `{"pacing": {"bytesPerSecond": 4096, "burst": 8192}}`
+    from the first metadata dict that has it. Raises ValueError on a malformed pace.
+    '''
+    for fields in metadata:
+        pacing = (fields or {}).get("pacing")
+        if pacing is None:
+            continue
+        if not isinstance(pacing, dict):
+            raise ValueError("pacing must be an object")
+
+        if "linesPerSecond" in pacing:
+            unit, rate = "lines", pacing["linesPerSecond"]
+        elif "bytesPerSecond" in pacing:
+            unit, rate = "bytes", pacing["bytesPerSecond"]
+        else:
+            raise ValueError("pacing needs linesPerSecond or bytesPerSecond")
+
+        burst = pacing.get("burst")
+        if not isinstance(rate, (int, float)) or rate <= 0:
+            raise ValueError("pacing rate must be a positive number")
+        if unit == "lines" and rate > MAX_WAKEUPS_PER_SECOND:
+            raise ValueError(f"linesPerSecond can be at most {MAX_WAKEUPS_PER_SECOND}")
+        if burst is not None and (not isinstance(burst, (int, float)) or burst <= 0):
+            raise ValueError("pacing burst must be a positive number")
+        return TokenBucket(float(rate), unit, None if burst is None else float(burst))
+
+    return None
+
+
+class PacingScheduler:
+    '''
+    One timer for every paced stream on the event loop.
+
+    Streams park a future in a heap ordered by wake-up time; a single task
+    sleeps until the earliest one is due and releases everything that is.
+    '''
+
+    def __init__(self):
+        self._heap: list[tuple[float, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _ensure_running(self, loop: asyncio.AbstractEventLoop):
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._heap = []
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def sleep_until(self, when: float):
+        loop = asyncio.get_running_loop()
+        self._ensure_running(loop)
+
+        future = loop.create_future()
+        heapq.heappush(self._heap, (when, next(self._order), future))
+        if self._heap[0][2] is future:
+            self._wakeup.set()
+        # A cancelled stream cancels its future, and the scheduler skips it
+        await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            while self._heap and self._heap[0][0] <= now:
+                _, _, future = heapq.heappop(self._heap)
+                if not future.done():
+                    future.set_result(None)
+
+            timeout = self._heap[0][0] - now if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except TimeoutError:
+                pass
+
+
+scheduler = PacingScheduler()
+
+
+async def apace(frames: AsyncIterator[bytes], bucket: TokenBucket) -> AsyncIterator[bytes]:
+    loop = asyncio.get_running_loop()
+    async for frame in frames:
+        now = loop.time()
+        when = bucket.reserve(bucket.cost(frame), now)
+        if when > now:
+            await scheduler.sleep_until(when)
+        yield frame
@@ -0,0 +1,254 @@
+import asyncio
+import collections
+import contextlib
+import ipaddress
+import os
+import random
+import socket
+from typing import NamedTuple
+from urllib.parse import urlsplit
+import httpx
+import a2a.types as a2a_types
+from a2a_parts.task_store import TaskRecord
+from utils import metrics
+from utils.log import get_logger
+
+log = get_logger("push_notifications")
+
+# How long updates for one webhook are gathered before they are sent together, and at most how many
+PUSH_BATCH_MS = int(os.getenv("PUSH_BATCH_MS", "50"))
+PUSH_BATCH_SIZE = int(os.getenv("PUSH_BATCH_SIZE", "64"))
+PUSH_MAX_ATTEMPTS = int(os.getenv("PUSH_MAX_ATTEMPTS", "5"))
+# Retries wait a random time up to base * 2^attempt, capped
+PUSH_RETRY_BASE_MS = int(os.getenv("PUSH_RETRY_BASE_MS", "200"))
+PUSH_RETRY_MAX_MS = int(os.getenv("PUSH_RETRY_MAX_MS", "10000"))
+PUSH_HOST_CONCURRENCY = int(os.getenv("PUSH_HOST_CONCURRENCY", "4"))
+PUSH_MAX_CONNECTIONS = int(os.getenv("PUSH_MAX_CONNECTIONS", "100"))
+PUSH_TIMEOUT_SECONDS = float(os.getenv("PUSH_TIMEOUT_SECONDS", "10"))
+# Webhook hosts allowed even though they are internal, e.g. "127.0.0.1,hooks.internal"
+PUSH_ALLOWED_HOSTS = frozenset(
+    host.strip().lower() for host in os.getenv("PUSH_ALLOWED_HOSTS", "").split(",") if host.strip()
+)
+
+TOKEN_HEADER = "X-A2A-Notification-Token"
+INVALID_PUSH_URL = "pushNotificationConfig.url must be an http or https URL of a public host"
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+UpdateEvent = a2a_types.TaskStatusUpdateEvent | a2a_types.TaskArtifactUpdateEvent
+
+
+class Destination(NamedTuple):
+    '''
+    Where a batch goes: updates for every task pushing to the same webhook with
+    the same credentials are sent together
+    '''
+    url: str
+    headers: tuple[tuple[str, str], ...]
+
+    @property
+    def host(self) -> str:
+        return urlsplit(self.url).netloc
+
+
+def public_address(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return ip.is_global and not ip.is_multicast
+
+
+def valid_url(url: str) -> bool:
+    '''
+    An http or https URL whose host isn't loopback, link-local or private,
+    unless it is in PUSH_ALLOWED_HOSTS. Names are checked again once
+    resolved, by the call that connects to them.
+    '''
+    parts = urlsplit(url)
+    host = parts.hostname
+    if parts.scheme not in ("http", "https") or not host:
+        return False
+    if host in PUSH_ALLOWED_HOSTS:
+        return True
+    if host == "localhost" or host.endswith(".localhost"):
+        return False
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return True
+    return public_address(host)
+
+
+async def resolve(host: str) -> list[str]:
+    infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+    return [info[4][0] for info in infos]
+
+
+class BlockedHost(Exception):
+    '''
+    A webhook host resolved to an address that may not be called
+    '''
+
+
+class PinnedTransport(httpx.AsyncBaseTransport):
+    '''
+    Resolves the webhook host of each call, checks that every address it
+    resolves to is public, and connects to the first one. Checking one lookup
+    and letting the connection do another would let a name be rebound to an
+    internal address in between. The request keeps its Host header, and TLS
+    still sends and verifies the host name. Hosts in PUSH_ALLOWED_HOSTS are
+    called as they are.
+    '''
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        if host not in PUSH_ALLOWED_HOSTS:
+            try:
+                addresses = [address.split("%")[0] for address in await resolve(host)]
+            except OSError as e:
+                raise httpx.ConnectError(str(e), request=request) from e
+            if not addresses or not all(public_address(address) for address in addresses):
+                raise BlockedHost(host)
+            request.url = request.url.copy_with(host=addresses[0])
+            request.extensions = {**request.extensions, "sni_hostname": host}
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def destination(config: a2a_types.PushNotificationConfig) -> Destination:
+    headers = [("Content-Type", "application/json")]
+    if config.token:
+        headers.append((TOKEN_HEADER, config.token))
+    authentication = config.authentication
+    if authentication is not None and authentication.credentials and "bearer" in (
+        scheme.lower() for scheme in authentication.schemes
+    ):
+        headers.append(("Authorization", f"Bearer {authentication.credentials}"))
+    return Destination(config.url, tuple(headers))
+
+
+def retry_delay(attempt: int, retry_after: str | None = None) -> float:
+    '''
+    Full jitter, so webhooks that failed together don't retry together, but
+    never sooner than a Retry-After the receiver asked for
+    '''
+    delay = random.uniform(0, min(PUSH_RETRY_MAX_MS, PUSH_RETRY_BASE_MS * 2 ** attempt) / 1000)
+    if retry_after is not None and retry_after.isdigit():
+        delay = max(delay, min(int(retry_after), PUSH_RETRY_MAX_MS / 1000))
+    return delay
+
+
+class PushNotifier:
+    '''
+    Delivers task updates to the webhooks tasks were configured with.
+
+    `notify` only queues the update. Each destination has one delivery task
+    that gathers updates for PUSH_BATCH_MS, posts them as a JSON array, and
+    retries a failed batch before sending the next one, so a webhook receives
+    updates in order. All deliveries share one connection pool, and at most
+    PUSH_HOST_CONCURRENCY requests are in flight to any one host. A host's
+    limit is dropped once no delivery holds or waits for it.
+    '''
+
+    def __init__(self, transport: httpx.AsyncBaseTransport | None = None):
+        self.transport = transport
+        self._client: httpx.AsyncClient | None = None
+        self._pending: dict[Destination, list[bytes]] = {}
+        self._deliveries: dict[Destination, asyncio.Task] = {}
+        self._hosts: dict[str, asyncio.Semaphore] = {}
+        self._host_users: collections.Counter[str] = collections.Counter()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            transport = self.transport or httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(max_connections=PUSH_MAX_CONNECTIONS),
+            )
+            self._client = httpx.AsyncClient(transport=PinnedTransport(transport), timeout=PUSH_TIMEOUT_SECONDS)
+        return self._client
+
+    def notify(self, record: TaskRecord, event: UpdateEvent):
+        if record.push_config is None:
+            return
+        target = destination(record.push_config)
+        self._pending.setdefault(target, []).append(event.model_dump_json(exclude_none=True).encode())
+        if target not in self._deliveries:
+            self._deliveries[target] = asyncio.create_task(self._deliver(target))
+
+    async def close(self, timeout: float = 5):
+        '''
+        Give queued updates `timeout` seconds to go out, then drop the rest
+        '''
+        deliveries = list(self._deliveries.values())
+        if deliveries:
+            _, unfinished = await asyncio.wait(deliveries, timeout=timeout)
+            for delivery in unfinished:
+                delivery.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _deliver(self, target: Destination):
+        try:
+            while self._pending.get(target):
+                await asyncio.sleep(PUSH_BATCH_MS / 1000)
+                pending = self._pending[target]
+                batch = pending[:PUSH_BATCH_SIZE]
+                del pending[:PUSH_BATCH_SIZE]
+                await self._post(target, b"[" + b",".join(batch) + b"]", len(batch))
+        finally:
+            self._deliveries.pop(target, None)
+            if not self._pending.get(target):
+                self._pending.pop(target, None)
+
+    @contextlib.asynccontextmanager
+    async def _host_slot(self, host: str):
+        limit = self._hosts.get(host)
+        if limit is None:
+            limit = self._hosts[host] = asyncio.Semaphore(PUSH_HOST_CONCURRENCY)
+        self._host_users[host] += 1
+        try:
+            async with limit:
+                yield
+        finally:
+            self._host_users[host] -= 1
+            if not self._host_users[host]:
+                del self._host_users[host], self._hosts[host]
+
+    async def _post(self, target: Destination, body: bytes, events: int):
+        attempts = max(1, PUSH_MAX_ATTEMPTS)
+        for attempt in range(attempts):
+            retry_after = None
+            try:
+                async with self._host_slot(target.host):
+                    response = await self.client.post(target.url, content=body, headers=dict(target.headers))
+                if response.is_success:
+                    metrics.push_deliveries.inc(outcome="delivered")
+                    return
+                if response.status_code not in RETRY_STATUSES:
+                    log.warning("push_rejected", extra={"host": target.host, "status": response.status_code, "events": events})
+                    metrics.push_deliveries.inc(outcome="rejected")
+                    return
+                error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("retry-after")
+            except BlockedHost:
+                log.warning("push_blocked", extra={"host": target.host, "events": events})
+                metrics.push_deliveries.inc(outcome="blocked")
+                return
+            except httpx.HTTPError as e:
+                error = f"{type(e).__name__}: {e}"
+
+            if attempt + 1 < attempts:
+                metrics.push_deliveries.inc(outcome="retried")
+                await asyncio.sleep(retry_delay(attempt, retry_after))
+
+        log.warning("push_failed", extra={"host": target.host, "error": error, "events": events, "attempts": attempts})
+        metrics.push_deliveries.inc(outcome="failed")
+
+
+notifier = PushNotifier()
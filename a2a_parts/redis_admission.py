@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+from uuid import uuid4 as uuid
+import redis
+from anyio import to_thread
+from a2a_parts.admission import MAX_STREAMS, Lease, Limiter, LimiterUnavailable, Overloaded
+from a2a_parts.redis_task_store import REDIS_MAX_CONNECTIONS
+from utils.log import get_logger
+
+log = get_logger("redis_admission")
+
+# A lease a crashed worker never released stops counting after this long
+ADMISSION_LEASE_SECONDS = int(os.getenv("ADMISSION_LEASE_SECONDS", "30"))
+
+KEY_PREFIX = "streaming-agent:streams"
+
+# Drop expired leases, then add one to both sets if neither is full.
+# Returns 0 when admitted, 1 over the global limit, 2 over the client's.
+ACQUIRE = """
+local now, expires, lease = tonumber(ARGV[1]), tonumber(ARGV[2]), ARGV[3]
+local global_limit, client_limit, ttl = tonumber(ARGV[4]), tonumber(ARGV[5]), tonumber(ARGV[6])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+if global_limit > 0 and redis.call('ZCARD', KEYS[1]) >= global_limit then
+    return 1
+end
+if client_limit > 0 and redis.call('ZCARD', KEYS[2]) >= client_limit then
+    return 2
+end
+redis.call('ZADD', KEYS[1], expires, lease)
+redis.call('ZADD', KEYS[2], expires, lease)
+redis.call('EXPIRE', KEYS[1], ttl)
+redis.call('EXPIRE', KEYS[2], ttl)
+return 0
+"""
+
+
+def client_set(client: str) -> str:
+    return f"{KEY_PREFIX}:{client}"
+
+
+class RedisLimiter(Limiter):
+    '''
+    Counts streams across every worker. Each admitted stream is a lease in a
+    global sorted set and its client's, scored by when it expires; a background
+    thread pushes the expiry of this process's leases forward while they run.
+    '''
+
+    def __init__(self, client: redis.Redis, max_streams: int = MAX_STREAMS, lease_seconds: int = ADMISSION_LEASE_SECONDS):
+        self.client = client
+        self.max_streams = max_streams
+        self.lease_seconds = lease_seconds
+        self._acquire = client.register_script(ACQUIRE)
+        self._leases: dict[str, Lease] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._refresher = threading.Thread(target=self._refresh_loop, name="admission-lease-refresh", daemon=True)
+        self._refresher.start()
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisLimiter":
+        pool = redis.ConnectionPool.from_url(url, max_connections=REDIS_MAX_CONNECTIONS)
+        return cls(redis.Redis(connection_pool=pool), **kwargs)
+
+    def acquire(self, client: str, client_limit: int) -> Lease:
+        lease = Lease(self, client, uuid().hex)
+        now = time.time()
+        try:
+            result = self._acquire(
+                keys=[KEY_PREFIX, client_set(client)],
+                args=[now, now + self.lease_seconds, lease.id, self.max_streams, client_limit, self.lease_seconds * 2],
+            )
+        except redis.RedisError as e:
+            raise LimiterUnavailable(str(e)) from e
+        if result == 1:
+            raise Overloaded("global")
+        if result == 2:
+            raise Overloaded(client.partition(":")[0])
+        with self._lock:
+            self._leases[lease.id] = lease
+        return lease
+
+    def release(self, lease: Lease):
+        with self._lock:
+            self._leases.pop(lease.id, None)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.zrem(KEY_PREFIX, lease.id)
+            pipe.zrem(client_set(lease.client), lease.id)
+            pipe.execute()
+        except redis.RedisError as e:
+            # The lease expires by itself
+            log.warning("admission_release_failed", extra={"error": str(e)})
+
+    def active(self) -> int:
+        return len(self._leases)
+
+    async def aacquire(self, client: str, client_limit: int) -> Lease:
+        return await to_thread.run_sync(self.acquire, client, client_limit)
+
+    async def arelease(self, lease: Lease):
+        await to_thread.run_sync(self.release, lease)
+
+    def refresh(self):
+        with self._lock:
+            leases = list(self._leases.values())
+        if not leases:
+            return
+
+        expires = time.time() + self.lease_seconds
+        pipe = self.client.pipeline(transaction=False)
+        for key in {KEY_PREFIX, *(client_set(lease.client) for lease in leases)}:
+            pipe.expire(key, self.lease_seconds * 2)
+        for lease in leases:
+            pipe.zadd(KEY_PREFIX, {lease.id: expires}, xx=True)
+            pipe.zadd(client_set(lease.client), {lease.id: expires}, xx=True)
+        pipe.execute()
+
+    def close(self):
+        self._stopped.set()
+        self._refresher.join(timeout=1)
+
+    def _refresh_loop(self):
+        while not self._stopped.wait(self.lease_seconds / 3):
+            try:
+                self.refresh()
+            except redis.RedisError as e:
+                log.warning("admission_refresh_failed", extra={"error": str(e)})
@@ -0,0 +1,250 @@
+import os
+import threading
+import time
+import weakref
+import redis
+from anyio import to_thread
+from pydantic import TypeAdapter
+import a2a.types as a2a_types
+from a2a_parts.task_store import TASK_TTL_SECONDS, TaskRecord, TaskStore
+from utils.log import get_logger
+
+log = get_logger("redis_task_store")
+
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+# Cursor updates are buffered and written in one pipeline this often
+CURSOR_FLUSH_MS = int(os.getenv("TASK_CURSOR_FLUSH_MS", "250"))
+
+KEY_PREFIX = "streaming-agent:task:"
+CANCEL_CHANNEL = "streaming-agent:task-cancel"
+
+
+HISTORY = TypeAdapter(list[a2a_types.Message])
+ARTIFACTS = TypeAdapter(list[a2a_types.Artifact])
+TRANSITIONS = TypeAdapter(list[a2a_types.TaskStatus])
+
+
+def task_key(task_id: str) -> str:
+    return KEY_PREFIX + task_id
+
+
+def to_hash(record: TaskRecord) -> dict[str, str | int]:
+    return {
+        "id": record.id,
+        "document": record.document,
+        "section_kind": record.section_kind,
+        "section_start": record.section_start,
+        "section_end": "" if record.section_end is None else record.section_end,
+        "context_id": record.context_id or "",
+        "query": record.query or "",
+        "output": record.output,
+        "cursor": record.cursor,
+        "state": record.state.value,
+        "background": int(record.background),
+        "history": HISTORY.dump_json(record.history),
+        "artifacts": ARTIFACTS.dump_json(record.artifacts),
+        "transitions": TRANSITIONS.dump_json(record.transitions),
+        "push_config": record.push_config.model_dump_json() if record.push_config is not None else "",
+    }
+
+
+def from_hash(fields: dict[bytes, bytes]) -> TaskRecord:
+    values = {key.decode(): value for key, value in fields.items()}
+    lists = {
+        name: adapter.validate_json(values.pop(name))
+        for name, adapter in (("history", HISTORY), ("artifacts", ARTIFACTS), ("transitions", TRANSITIONS))
+        if values.get(name)
+    }
+    values = {key: value.decode() for key, value in values.items()}
+    return TaskRecord(
+        id=values["id"],
+        document=values["document"],
+        section_kind=values["section_kind"],
+        section_start=int(values["section_start"]),
+        section_end=int(values["section_end"]) if values.get("section_end") else None,
+        context_id=values["context_id"] or None,
+        query=values.get("query") or None,
+        output=values.get("output") or "messages",
+        cursor=int(values["cursor"]),
+        state=a2a_types.TaskState(values["state"]),
+        # A canceled task stays canceled if it is resumed
+        cancel_requested=values["state"] == a2a_types.TaskState.canceled.value,
+        background=values.get("background") == "1",
+        push_config=a2a_types.PushNotificationConfig.model_validate_json(values["push_config"]) if values.get("push_config") else None,
+        **lists,
+    )
+
+
+def merge(local: TaskRecord, stored: TaskRecord):
+    '''
+    Bring a record this process holds up to date with the stored one. States,
+    messages and artifacts are only ever appended and the cursor only moves
+    forward, so the longer list and the further cursor are the newer ones.
+    '''
+    if len(stored.transitions) > len(local.transitions):
+        local.transitions = stored.transitions
+        local.state = stored.state
+    if len(stored.history) > len(local.history):
+        local.history = stored.history
+    if len(stored.artifacts) > len(local.artifacts):
+        local.artifacts = stored.artifacts
+    local.cursor = max(local.cursor, stored.cursor)
+    local.cancel_requested = local.cancel_requested or stored.cancel_requested
+    if stored.push_config is not None:
+        local.push_config = stored.push_config
+
+
+class RedisTaskStore(TaskStore):
+    '''
+    Task records shared by every worker through Redis.
+
+    Cursor updates only mark the record dirty; a background thread writes all
+    dirty cursors in one pipeline every CURSOR_FLUSH_MS. Every `get` reads
+    Redis, so what other workers change is seen. Code on the event loop uses
+    the awaitable methods, which make the round trips on a thread. Cancels are
+    published on a channel so the worker that is streaming the task can stop it.
+    '''
+
+    def __init__(self, client: redis.Redis, ttl: int = TASK_TTL_SECONDS, flush_ms: int = CURSOR_FLUSH_MS):
+        self.client = client
+        self.ttl = ttl
+        self.flush_interval = flush_ms / 1000
+        self._dirty: dict[str, TaskRecord] = {}
+        self._dirty_lock = threading.Lock()
+        # Records being streamed by this process, for delivering cancels
+        self._local: weakref.WeakValueDictionary[str, TaskRecord] = weakref.WeakValueDictionary()
+        self._subscribe_error = ""
+        self._stopped = threading.Event()
+        self._pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self._listener = None
+        self._flusher = None
+
+    def start(self):
+        '''
+        Start flushing cursors and listening for cancels. Runs from the app's
+        lifespan, so importing the app never needs Redis. Without Redis the
+        flusher keeps retrying the subscription.
+        '''
+        if not self._subscribe():
+            log.warning("task_cancel_subscribe_failed", extra={"error": self._subscribe_error})
+        self._flusher = threading.Thread(target=self._flush_loop, name="task-cursor-flush", daemon=True)
+        self._flusher.start()
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisTaskStore":
+        pool = redis.ConnectionPool.from_url(url, max_connections=REDIS_MAX_CONNECTIONS)
+        return cls(redis.Redis(connection_pool=pool), **kwargs)
+
+    def save(self, record: TaskRecord) -> TaskRecord:
+        key = task_key(record.id)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hset(key, mapping=to_hash(record))
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+        self._local[record.id] = record
+        return record
+
+    def get(self, task_id: str) -> TaskRecord | None:
+        fields = self.client.hgetall(task_key(task_id))
+        if not fields:
+            return None
+        stored = from_hash(fields)
+        local = self._local.get(task_id)
+        if local is None:
+            self._local[task_id] = stored
+            return stored
+        # Streams here hold the local record, so keep handing it out, brought
+        # up to date with what other workers wrote
+        merge(local, stored)
+        return local
+
+    def advance(self, record: TaskRecord, cursor: int):
+        record.advance(cursor)
+        with self._dirty_lock:
+            self._dirty[record.id] = record
+
+    def transition(self, record: TaskRecord, state: a2a_types.TaskState):
+        record.transition(state)
+        self.save(record)
+
+    def add_artifact(self, record: TaskRecord, artifact: a2a_types.Artifact):
+        record.add_artifact(artifact)
+        self.save(record)
+
+    def finish(self, record: TaskRecord, state: a2a_types.TaskState = a2a_types.TaskState.completed):
+        record.finish(state)
+        with self._dirty_lock:
+            self._dirty.pop(record.id, None)
+        self.save(record)
+
+    def request_cancel(self, task_id: str) -> bool:
+        if not self.client.exists(task_key(task_id)):
+            return False
+        self.client.publish(CANCEL_CHANNEL, task_id)
+        return True
+
+    # Every call below is a round trip to Redis, so the loop hands it to a thread
+
+    async def asave(self, record: TaskRecord) -> TaskRecord:
+        return await to_thread.run_sync(self.save, record)
+
+    async def aget(self, task_id: str) -> TaskRecord | None:
+        return await to_thread.run_sync(self.get, task_id)
+
+    async def atransition(self, record: TaskRecord, state: a2a_types.TaskState):
+        await to_thread.run_sync(self.transition, record, state)
+
+    async def aadd_artifact(self, record: TaskRecord, artifact: a2a_types.Artifact):
+        await to_thread.run_sync(self.add_artifact, record, artifact)
+
+    async def afinish(self, record: TaskRecord, state: a2a_types.TaskState = a2a_types.TaskState.completed):
+        await to_thread.run_sync(self.finish, record, state)
+
+    async def arequest_cancel(self, task_id: str) -> bool:
+        return await to_thread.run_sync(self.request_cancel, task_id)
+
+    def flush(self):
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+
+        pipe = self.client.pipeline(transaction=False)
+        for record in dirty.values():
+            key = task_key(record.id)
+            pipe.hset(key, "cursor", record.cursor)
+            pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def close(self):
+        self._stopped.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=self.flush_interval * 2)
+        self.flush()
+        if self._listener is not None:
+            self._listener.stop()
+        self._pubsub.close()
+
+    def _subscribe(self) -> bool:
+        try:
+            self._pubsub.subscribe(**{CANCEL_CHANNEL: self._on_cancel})
+        except redis.RedisError as e:
+            self._subscribe_error = str(e)
+            return False
+        self._listener = self._pubsub.run_in_thread(sleep_time=0.5, daemon=True)
+        return True
+
+    def _flush_loop(self):
+        while not self._stopped.wait(self.flush_interval):
+            if self._listener is None and self._subscribe():
+                log.info("task_cancel_subscribed")
+            try:
+                self.flush()
+            except redis.RedisError as e:
+                log.warning("task_cursor_flush_failed", extra={"error": str(e)})
+                time.sleep(self.flush_interval)
+
+    def _on_cancel(self, message):
+        record = self._local.get(message["data"].decode())
+        if record is not None:
+            record.cancel_requested = True
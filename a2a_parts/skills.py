@@ -0,0 +1,194 @@
+import re
+import threading
+from typing import Any, Callable, NamedTuple
+import a2a.types as a2a_types
+
+
+class UnknownSkill(ValueError):
+    pass
+
+
+class Route(NamedTuple):
+    '''
+    The skill a message was routed to. `match` is the tag that picked it, None
+    when a DataPart named the skill or nothing matched and the default applies.
+    '''
+    skill: a2a_types.AgentSkill
+    text: str
+    data: dict[str, Any]
+    match: re.Match | None
+
+    @property
+    def remainder(self) -> str:
+        '''
+        The text after the matched tag, e.g. the query after "search:"
+        '''
+        return self.text[self.match.end():] if self.match else self.text
+
+
+def tag_pattern(tag: str) -> str:
+    # "art_of_war" also matches "art of war" and "art-of-war"
+    words = re.split(r"[_\s-]+", tag.strip())
+    return r"\b" + r"[\s_-]+".join(re.escape(word) for word in words) + r"\b"
+
+
+class SkillRegistry:
+    '''
+    The skills on the agent card, which the router matches messages against.
+
+    Every skill's tags are compiled into one alternation with a named group per
+    skill, so a message is scanned once however many skills there are. When
+    several skills match, the one registered first wins. Anchored skills only
+    match at the start of a message, like a command.
+    '''
+
+    def __init__(self, default: str):
+        self.default = default
+        self.version = 0
+        self._skills: list[a2a_types.AgentSkill] = []
+        self._anchored: set[str] = set()
+        self._handlers: dict[str, Callable] = {}
+        self._matcher: re.Pattern | None = None
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return iter(list(self._skills))
+
+    def register(self, skill: a2a_types.AgentSkill, anchored: bool = False) -> a2a_types.AgentSkill:
+        with self._lock:
+            self._skills = [existing for existing in self._skills if existing.id != skill.id] + [skill]
+            if anchored:
+                self._anchored.add(skill.id)
+            else:
+                self._anchored.discard(skill.id)
+            self._matcher = None
+            self.version += 1
+        return skill
+
+    def handler(self, skill_id: str):
+        '''
+        Decorator for the function that builds a stream for a skill's routes.
+        A handler with slow work to do may be a coroutine function, which is awaited.
+        '''
+        def register_handler(handler: Callable) -> Callable:
+            self._handlers[skill_id] = handler
+            return handler
+        return register_handler
+
+    def get(self, skill_id_or_tag: str) -> a2a_types.AgentSkill | None:
+        for skill in self._skills:
+            if skill.id == skill_id_or_tag:
+                return skill
+        for skill in self._skills:
+            if skill_id_or_tag in (skill.tags or []):
+                return skill
+        return None
+
+    def handler_for(self, skill: a2a_types.AgentSkill) -> Callable:
+        return self._handlers[skill.id]
+
+    def matcher(self) -> tuple[re.Pattern, list[a2a_types.AgentSkill]]:
+        with self._lock:
+            skills = self._skills
+            if self._matcher is None:
+                groups = []
+                for i, skill in enumerate(skills):
+                    if not skill.tags:
+                        continue
+                    pattern = "|".join(tag_pattern(tag) for tag in skill.tags)
+                    if skill.id in self._anchored:
+                        pattern = rf"^\s*(?:{pattern})[\s:]*"
+                    groups.append(f"(?P<skill{i}>{pattern})")
+                self._matcher = re.compile("|".join(groups) or r"(?!)", re.IGNORECASE)
+            return self._matcher, skills
+
+    def route(self, parts: list[a2a_types.Part]) -> Route:
+        '''
+        Route on a DataPart's `skill` field (an id or a tag) if there is one,
+        otherwise on the tags found in the text parts
+        '''
+        text = " ".join(part.text for part in parts if part.kind == "text")
+        data: dict[str, Any] = {}
+        for part in parts:
+            if part.kind == "data":
+                data.update(part.data)
+
+        requested = data.get("skill")
+        if requested is not None:
+            skill = self.get(str(requested))
+            if skill is None or skill.id not in self._handlers:
+                raise UnknownSkill(f"No skill {requested!r} on this agent")
+            return Route(skill, text, data, None)
+
+        matcher, skills = self.matcher()
+        best: tuple[int, re.Match] | None = None
+        for match in matcher.finditer(text):
+            rank = int(match.lastgroup.removeprefix("skill"))
+            if best is None or rank < best[0]:
+                best = (rank, match)
+            if rank == 0:
+                break
+
+        if best is None:
+            return Route(self.get(self.default), text, data, None)
+        return Route(skills[best[0]], text, data, best[1])
+
+
+skills = SkillRegistry(default="stream_sherlock")
+
+skills.register(
+    a2a_types.AgentSkill(
+        id="search_documents",
+        name="Search documents",
+        description="Streams the passages that best match a query, from every document",
+        tags=["search", "find"],
+        examples=["search: all warfare is based on deception"],
+        inputModes=["text/plain", "application/json"],
+        outputModes=["text/plain"],
+    ),
+    anchored=True,
+)
+skills.register(
+    a2a_types.AgentSkill(
+        id="stream_bible",
+        name="Stream bible",
+        description="Streams the bible",
+        tags=["bible"],
+        examples=["In the beginning was the word, and the word was with God, and the word was God"],
+        inputModes=["text/plain"],
+        outputModes=["text/plain"],
+    )
+)
+skills.register(
+    a2a_types.AgentSkill(
+        id="stream_romeo_and_juliet",
+        name="Stream Romeo and Juliet",
+        description="Streams Romeo and Juliet",
+        tags=["romeo_and_juliet", "romeo", "juliet"],
+        examples=["Two households, both alike in dignity, from ancient grudge break to new mutiny"],
+        inputModes=["text/plain"],
+        outputModes=["text/plain"],
+    )
+)
+skills.register(
+    a2a_types.AgentSkill(
+        id="stream_art_of_war",
+        name="Stream Art of War",
+        description="Streams the Art of War, a whole chapter or the verses asked for",
+        tags=["art_of_war", "sun_tzu"],
+        examples=["The art of war is of vital importance to the State.", "art of war chapter 3 verses 5-8"],
+        inputModes=["text/plain", "application/json"],
+        outputModes=["text/plain"],
+    )
+)
+skills.register(
+    a2a_types.AgentSkill(
+        id="stream_sherlock",
+        name="Stream Sherlock Holmes",
+        description="Streams a chapter of The Adventures of Sherlock Holmes, also when no other skill matches",
+        tags=["sherlock", "holmes"],
+        examples=["To Sherlock Holmes she is always the woman."],
+        inputModes=["text/plain"],
+        outputModes=["text/plain"],
+    )
+)
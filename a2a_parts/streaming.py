@@ -0,0 +1,255 @@
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Hashable, Iterable, Iterator, NamedTuple
+from anyio import to_thread
+import a2a.types as a2a_types
+from a2a_parts import coalescing, frame_cache
+from a2a_parts.backpressure import BackpressureStreamingResponse
+from a2a_parts.pacing import TokenBucket, apace
+from a2a_parts.task_store import TaskRecord, tasks
+from utils import profiling
+from utils.document_index import Section
+
+# "async" iterates frames on the event loop, "sync" hands a plain generator to
+# Starlette, which pulls every chunk through the threadpool
+STREAM_MODE = os.getenv("STREAM_MODE", "async").lower()
+# "messages" sends every group of lines as an agent message, "artifacts" sends
+# status updates around one artifact delivered in chunks
+STREAM_OUTPUT = os.getenv("STREAM_OUTPUT", "messages").lower()
+OUTPUTS = ("messages", "artifacts")
+
+
+class Segment(NamedTuple):
+    '''
+    A run of lines from one document section, sent as `event` frames
+    '''
+    key: Hashable
+    event: str
+    lines: Callable[[], Iterable[str]]
+    # The same lines stripped and JSON-escaped, when they come from the corpus pack
+    escaped: Callable[[], Iterable[bytes]] | None = None
+
+    def frames(self) -> Iterator[list[str]]:
+        return coalescing.batch_lines(profiling.timed("read", self.lines()))
+
+    def escaped_frames(self) -> Iterator[list[bytes]]:
+        return coalescing.batch_lines(profiling.timed("read", self.escaped()), coalescing.pack_escaped, len)
+
+
+@dataclass
+class SectionStream:
+    document: str
+    section: Section
+    segments: list[Segment] = field(default_factory=list)
+    byte_limit: int | None = None
+
+
+def event_id(task_id: str, seq: int) -> str:
+    return f"{task_id}:{seq}"
+
+
+def parse_event_id(value: str | None) -> tuple[str, int] | None:
+    '''
+    Split a Last-Event-ID header into (task id, sequence number of the last frame received)
+    '''
+    if not value:
+        return None
+    task_id, _, seq = value.strip().rpartition(":")
+    if not task_id or not seq.isdigit():
+        return None
+    return task_id, int(seq)
+
+
+def output_from_metadata(*metadata: dict[str, Any] | None) -> str:
+    '''
+    Read `{"output": "artifacts"}` or `{"output": "messages"}` from the first
+    metadata dict that has it, STREAM_OUTPUT otherwise. Raises ValueError on anything else.
+    '''
+    for fields in metadata:
+        output = (fields or {}).get("output")
+        if output is None:
+            continue
+        if output not in OUTPUTS:
+            raise ValueError(f"output must be one of {', '.join(OUTPUTS)}")
+        return output
+    return STREAM_OUTPUT
+
+
+def artifact_task_id(task: TaskRecord) -> bytes | None:
+    '''
+    The task id as it goes into artifact chunk frames, None for message output
+    '''
+    if task.output != "artifacts":
+        return None
+    return json.dumps(task.id, ensure_ascii=False)[1:-1].encode()
+
+
+def artifact_frames(task: TaskRecord, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    '''
+    A section as one artifact of `task`: a working status, the chunks, the
+    first starting the artifact and the last closing it, then the final status
+    '''
+    yield frame_cache.encode_status_frame(task.id, a2a_types.TaskState.working)
+    previous = None
+    for chunk in chunks:
+        if previous is not None:
+            yield previous
+        previous = frame_cache.starting_chunk(chunk) if previous is None else chunk
+    if previous is not None:
+        yield frame_cache.last_chunk(previous)
+    yield frame_cache.encode_status_frame(task.id, a2a_types.TaskState.completed, final=True)
+
+
+async def aartifact_frames(task: TaskRecord, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    yield frame_cache.encode_status_frame(task.id, a2a_types.TaskState.working)
+    previous = None
+    async for chunk in chunks:
+        if previous is not None:
+            yield previous
+        previous = frame_cache.starting_chunk(chunk) if previous is None else chunk
+    if previous is not None:
+        yield frame_cache.last_chunk(previous)
+    yield frame_cache.encode_status_frame(task.id, a2a_types.TaskState.completed, final=True)
+
+
+def tag_frame(task: TaskRecord, seq: int, frame: bytes) -> bytes:
+    return f"id: {event_id(task.id, seq)}\n".encode() + frame
+
+
+def canceled_frame(task: TaskRecord, seq: int) -> bytes:
+    # A canceled task that is resumed stops before reaching its cursor
+    return tag_frame(task, max(seq, task.cursor), frame_cache.encode_status_frame(task.id, a2a_types.TaskState.canceled, final=True))
+
+
+def finish_task(task: TaskRecord):
+    tasks.finish(task, a2a_types.TaskState.canceled if task.cancel_requested else a2a_types.TaskState.completed)
+
+
+async def afinish_task(task: TaskRecord):
+    await tasks.afinish(task, a2a_types.TaskState.canceled if task.cancel_requested else a2a_types.TaskState.completed)
+
+
+def limit_bytes(frames: Iterator[bytes], byte_limit: int | None) -> Iterator[bytes]:
+    total_bytes_sent = 0
+    for frame in frames:
+        total_bytes_sent += len(frame)
+        if byte_limit is not None and total_bytes_sent > byte_limit:
+            break
+        yield frame
+
+
+def iter_stream(stream: SectionStream, task: TaskRecord) -> Iterator[bytes]:
+    '''
+    Frames before the task's cursor were already delivered and are only counted,
+    so a resumed stream keeps its sequence numbers and byte limit
+    '''
+    task_id = artifact_task_id(task)
+    frames = (
+        frame
+        for segment in stream.segments
+        for frame in frame_cache.stream_frames(
+            segment.key, segment.event, segment.frames,
+            segment.escaped_frames if segment.escaped is not None else None,
+            task_id,
+        )
+    )
+    frames = limit_bytes(frames, stream.byte_limit)
+    if task_id is not None:
+        frames = artifact_frames(task, frames)
+    seq = 0
+    resume_from = task.cursor
+    for frame in frames:
+        # Closing the frames closes the document readers behind them
+        if task.cancel_requested:
+            frames.close()
+            break
+        if seq >= resume_from:
+            yield tag_frame(task, seq, frame)
+            tasks.advance(task, seq + 1)
+        seq += 1
+    if task.cancel_requested:
+        yield canceled_frame(task, seq)
+    finish_task(task)
+
+
+async def aiter_segment(segment: Segment, task_id: bytes | None = None) -> AsyncIterator[bytes]:
+    if not frame_cache.FRAME_CACHE_ENABLED and segment.escaped is None:
+        for lines in segment.frames():
+            yield frame_cache.encode_frame(segment.event, lines, task_id)
+        return
+
+    artifact = task_id is not None
+    templates = (
+        frame_cache.cached_templates(segment.key, segment.event, artifact) if frame_cache.FRAME_CACHE_ENABLED else None
+    )
+    if templates is None and segment.escaped is not None:
+        # Splicing pre-escaped lines is cheap enough to stay on the loop
+        templates = frame_cache.splice_templates(segment.event, segment.escaped_frames(), artifact)
+        if frame_cache.FRAME_CACHE_ENABLED:
+            frame_cache.store_templates(segment.key, segment.event, templates, artifact)
+    elif templates is None:
+        # Rendering a whole section is the one expensive step, keep it off the loop
+        templates = await to_thread.run_sync(
+            frame_cache.build_templates, segment.event, list(segment.frames()), artifact
+        )
+        frame_cache.store_templates(segment.key, segment.event, templates, artifact)
+
+    for frame in frame_cache.fill_templates(templates, task_id):
+        yield frame
+
+
+async def aiter_frames(stream: SectionStream, task_id: bytes | None = None) -> AsyncIterator[bytes]:
+    total_bytes_sent = 0
+    for segment in stream.segments:
+        async for frame in aiter_segment(segment, task_id):
+            total_bytes_sent += len(frame)
+            if stream.byte_limit is not None and total_bytes_sent > stream.byte_limit:
+                return
+            yield frame
+
+
+async def aiter_stream(
+    stream: SectionStream,
+    task: TaskRecord,
+    frames: AsyncIterator[bytes] | None = None,
+) -> AsyncIterator[bytes]:
+    seq = 0
+    resume_from = task.cursor
+    task_id = artifact_task_id(task)
+    frames = frames or aiter_frames(stream, task_id)
+    if task_id is not None:
+        frames = aartifact_frames(task, frames)
+    async for frame in frames:
+        if task.cancel_requested:
+            await frames.aclose()
+            break
+        if seq >= resume_from:
+            yield tag_frame(task, seq, frame)
+            tasks.advance(task, seq + 1)
+        seq += 1
+    if task.cancel_requested:
+        yield canceled_frame(task, seq)
+    await afinish_task(task)
+
+
+def streaming_response(
+    stream: SectionStream,
+    task: TaskRecord,
+    pacing: TokenBucket | None = None,
+    frames: AsyncIterator[bytes] | None = None,
+) -> BackpressureStreamingResponse:
+    '''
+    Stream a section for `task`, starting at the task's cursor.
+    `frames` replaces encoding the section for this stream, e.g. with a shared broadcast.
+    Paced and shared streams always run on the event loop, whatever STREAM_MODE says.
+    '''
+    if pacing is not None:
+        content = apace(aiter_stream(stream, task, frames), pacing)
+    elif frames is not None:
+        content = aiter_stream(stream, task, frames)
+    elif STREAM_MODE == "sync":
+        content = iter_stream(stream, task)
+    else:
+        content = aiter_stream(stream, task)
+    return BackpressureStreamingResponse(content, media_type="text/event-stream")
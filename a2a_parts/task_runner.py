@@ -0,0 +1,125 @@
+import asyncio
+import os
+import a2a.types as a2a_types
+from anyio import to_thread
+from a2a_parts.push_notifications import notifier
+from a2a_parts.streaming import Segment, SectionStream
+from a2a_parts.task_store import TaskRecord, tasks
+from utils import metrics
+from utils.log import get_logger
+
+log = get_logger("task_runner")
+
+# Tasks produced at once, and how many more may wait before message/send is refused
+TASK_WORKERS = int(os.getenv("TASK_WORKERS", "4"))
+TASK_QUEUE_SIZE = int(os.getenv("TASK_QUEUE_SIZE", "256"))
+
+
+def segment_text(segment: Segment, byte_budget: int | None, record: TaskRecord) -> tuple[str, int]:
+    '''
+    A segment's lines joined into one text, stopping before the line that would
+    go over `byte_budget`, or early if the task is canceled. Returns the text
+    and the bytes it used.
+    '''
+    lines = []
+    used = 0
+    for line in segment.lines():
+        if record.cancel_requested:
+            break
+        size = len(line.encode())
+        if byte_budget is not None and used + size > byte_budget:
+            break
+        used += size
+        lines.append(line.strip())
+    return "\n".join(lines), used
+
+
+class TaskRunner:
+    '''
+    Produces message/send tasks in the background: `submit` queues a task and
+    returns at once, and a fixed set of workers read each task's section, one
+    segment at a time on a worker thread, into the task's artifacts.
+    Workers are started on the running loop the first time a task is queued.
+    '''
+
+    def __init__(self, workers: int = TASK_WORKERS, queue_size: int = TASK_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._queue: asyncio.Queue | None = None
+        self._workers: list[asyncio.Task] = []
+
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.queue_size)
+            self._workers = [
+                asyncio.create_task(self._work(), name=f"task-worker-{i}") for i in range(self.workers)
+            ]
+
+    def submit(self, stream: SectionStream, record: TaskRecord) -> asyncio.Event:
+        '''
+        Queue `record` to be produced from `stream`. The returned event is set
+        once the task has finished. Raises asyncio.QueueFull when the queue is.
+        '''
+        self.start()
+        done = asyncio.Event()
+        self._queue.put_nowait((stream, record, done))
+        return done
+
+    async def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._queue = None
+        self._workers = []
+
+    async def _work(self):
+        while True:
+            stream, record, done = await self._queue.get()
+            try:
+                await self.run(stream, record)
+            finally:
+                done.set()
+                self._queue.task_done()
+
+    async def run(self, stream: SectionStream, record: TaskRecord):
+        # Canceled while it was queued
+        if record.cancel_requested:
+            await tasks.afinish(record, a2a_types.TaskState.canceled)
+            notifier.notify(record, record.status_event())
+            return
+
+        await tasks.atransition(record, a2a_types.TaskState.working)
+        notifier.notify(record, record.status_event())
+        try:
+            remaining = stream.byte_limit
+            for index, segment in enumerate(stream.segments):
+                text, used = await to_thread.run_sync(segment_text, segment, remaining, record)
+                if record.cancel_requested:
+                    break
+                artifact = a2a_types.Artifact(
+                    name=segment.event,
+                    parts=[a2a_types.TextPart(text=text)],
+                    index=index,
+                )
+                await tasks.aadd_artifact(record, artifact)
+                notifier.notify(record, a2a_types.TaskArtifactUpdateEvent(id=record.id, artifact=artifact))
+                if remaining is not None:
+                    remaining -= used
+        except Exception:
+            log.exception("task_failed", extra={"task_id": record.id})
+            await tasks.afinish(record, a2a_types.TaskState.failed)
+        else:
+            await tasks.afinish(record, a2a_types.TaskState.canceled if record.cancel_requested else a2a_types.TaskState.completed)
+        notifier.notify(record, record.status_event())
+
+
+runner = TaskRunner()
+
+task_queue_depth = metrics.Gauge(
+    "task_queue_depth",
+    "message/send tasks waiting for a background worker",
+    runner.queued,
+)
@@ -0,0 +1,227 @@
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+import a2a.types as a2a_types
+
+TASK_TTL_SECONDS = int(os.getenv("TASK_TTL_SECONDS", "3600"))
+# "memory" keeps tasks in this process, "redis" shares them between workers
+TASK_STORE = os.getenv("TASK_STORE", "memory").lower()
+
+# States a task never leaves
+TERMINAL_STATES = frozenset({
+    a2a_types.TaskState.completed,
+    a2a_types.TaskState.canceled,
+    a2a_types.TaskState.failed,
+    a2a_types.TaskState.rejected,
+})
+
+
+@dataclass
+class TaskRecord:
+    '''
+    Where a task's stream is: the document section it was given and how many
+    frames of it have been handed to the client so far. Tasks run in the
+    background also keep the messages they were sent and what they produced.
+    '''
+    id: str
+    document: str
+    section_kind: str
+    section_start: int
+    context_id: str | None = None
+    # Set for sections that span a range rather than one indexed section, e.g. a run of verses
+    section_end: int | None = None
+    # The query a search task ranks passages for
+    query: str | None = None
+    # How the stream is framed: "messages" or "artifacts"
+    output: str = "messages"
+    cursor: int = 0
+    state: a2a_types.TaskState = a2a_types.TaskState.working
+    updated_at: float = field(default_factory=time.monotonic)
+    # Set when a cancel for this task reaches the process streaming it; streams
+    # and background workers check it between frames and stop
+    cancel_requested: bool = False
+    history: list[a2a_types.Message] = field(default_factory=list)
+    artifacts: list[a2a_types.Artifact] = field(default_factory=list)
+    # Every state the task has been in, oldest first
+    transitions: list[a2a_types.TaskStatus] = field(default_factory=list)
+    # Produced by a background worker for message/send rather than streamed
+    background: bool = False
+    # Webhook that status and artifact updates are pushed to
+    push_config: a2a_types.PushNotificationConfig | None = None
+
+    def __post_init__(self):
+        if not self.transitions:
+            self.transitions.append(a2a_types.TaskStatus(state=self.state))
+
+    def advance(self, cursor: int):
+        self.cursor = cursor
+        self.updated_at = time.monotonic()
+
+    def transition(self, state: a2a_types.TaskState):
+        if state != self.state:
+            self.state = state
+            self.transitions.append(a2a_types.TaskStatus(state=state))
+        self.updated_at = time.monotonic()
+
+    def finish(self, state: a2a_types.TaskState = a2a_types.TaskState.completed):
+        self.transition(state)
+
+    def add_artifact(self, artifact: a2a_types.Artifact):
+        self.artifacts.append(artifact)
+        self.updated_at = time.monotonic()
+
+    def status_event(self) -> a2a_types.TaskStatusUpdateEvent:
+        return a2a_types.TaskStatusUpdateEvent(
+            id=self.id,
+            status=self.transitions[-1],
+            final=self.state not in (a2a_types.TaskState.submitted, a2a_types.TaskState.working),
+        )
+
+    def as_task(self, history_length: int | None = None) -> a2a_types.Task:
+        '''
+        The task as tasks/get returns it, with the last `history_length`
+        messages (all of them when None) and every state transition
+        '''
+        history = self.history
+        if history_length is not None:
+            history = history[-history_length:] if history_length > 0 else []
+        return a2a_types.Task(
+            id=self.id,
+            contextId=self.context_id,
+            status=self.transitions[-1],
+            artifacts=list(self.artifacts) or None,
+            history=list(history),
+            metadata={"stateTransitions": [
+                {"state": status.state.value, "timestamp": status.timestamp.isoformat()}
+                for status in self.transitions
+            ]},
+        )
+
+
+class TaskStore:
+    '''
+    Where task records live. Streams hold on to the record they were given and
+    report progress through `advance` and `finish`, which a backend may batch.
+    '''
+
+    def save(self, record: TaskRecord) -> TaskRecord:
+        raise NotImplementedError
+
+    def get(self, task_id: str) -> TaskRecord | None:
+        raise NotImplementedError
+
+    def advance(self, record: TaskRecord, cursor: int):
+        raise NotImplementedError
+
+    def transition(self, record: TaskRecord, state: a2a_types.TaskState):
+        raise NotImplementedError
+
+    def add_artifact(self, record: TaskRecord, artifact: a2a_types.Artifact):
+        raise NotImplementedError
+
+    def finish(self, record: TaskRecord, state: a2a_types.TaskState = a2a_types.TaskState.completed):
+        raise NotImplementedError
+
+    def request_cancel(self, task_id: str) -> bool:
+        '''
+        Ask whichever process is streaming `task_id` to stop. False if the task is unknown.
+        '''
+        raise NotImplementedError
+
+    def start(self):
+        '''
+        Start any background work, once the app is starting up
+        '''
+
+    def close(self):
+        pass
+
+    # Awaitable variants for code on the event loop. A backend whose calls do
+    # network I/O runs them on a worker thread; these run them in place.
+
+    async def asave(self, record: TaskRecord) -> TaskRecord:
+        return self.save(record)
+
+    async def aget(self, task_id: str) -> TaskRecord | None:
+        return self.get(task_id)
+
+    async def atransition(self, record: TaskRecord, state: a2a_types.TaskState):
+        self.transition(record, state)
+
+    async def aadd_artifact(self, record: TaskRecord, artifact: a2a_types.Artifact):
+        self.add_artifact(record, artifact)
+
+    async def afinish(self, record: TaskRecord, state: a2a_types.TaskState = a2a_types.TaskState.completed):
+        self.finish(record, state)
+
+    async def arequest_cancel(self, task_id: str) -> bool:
+        return self.request_cancel(task_id)
+
+
+class InMemoryTaskStore(TaskStore):
+    '''
+    Task records in this process, dropped once untouched for `ttl` seconds
+    '''
+
+    def __init__(self, ttl: int = TASK_TTL_SECONDS):
+        self.ttl = ttl
+        self._tasks: dict[str, TaskRecord] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def save(self, record: TaskRecord) -> TaskRecord:
+        with self._lock:
+            self._tasks[record.id] = record
+        self.evict_expired()
+        return record
+
+    def get(self, task_id: str) -> TaskRecord | None:
+        record = self._tasks.get(task_id)
+        if record is None or time.monotonic() - record.updated_at > self.ttl:
+            return None
+        return record
+
+    def advance(self, record: TaskRecord, cursor: int):
+        record.advance(cursor)
+
+    def transition(self, record: TaskRecord, state: a2a_types.TaskState):
+        record.transition(state)
+
+    def add_artifact(self, record: TaskRecord, artifact: a2a_types.Artifact):
+        record.add_artifact(artifact)
+
+    def finish(self, record: TaskRecord, state: a2a_types.TaskState = a2a_types.TaskState.completed):
+        record.finish(state)
+
+    def request_cancel(self, task_id: str) -> bool:
+        record = self.get(task_id)
+        if record is None:
+            return False
+        record.cancel_requested = True
+        return True
+
+    def evict_expired(self, force: bool = False):
+        now = time.monotonic()
+        # Sweeping is O(tasks), so do it at most a few times per TTL
+        if not force and now - self._last_sweep < min(60, self.ttl / 4):
+            return
+
+        with self._lock:
+            self._last_sweep = now
+            expired = [task_id for task_id, record in self._tasks.items() if now - record.updated_at > self.ttl]
+            for task_id in expired:
+                del self._tasks[task_id]
+
+
+def create_task_store() -> TaskStore:
+    if TASK_STORE == "redis":
+        from a2a_parts.redis_task_store import RedisTaskStore
+        return RedisTaskStore.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    return InMemoryTaskStore()
+
+
+tasks = create_task_store()
@@ -0,0 +1,103 @@
+'''
+Micro-benchmarks for A2A validation and serialization on the request hot path.
+
+    make bench-baseline
+    make bench-check
+
+bench-baseline saves a run under bench/baselines/, one folder per machine and
+Python version, and bench-check fails when a median is over 25% slower than
+the latest one. Baselines stay on the machine that recorded them. Needs
+pytest and pytest-benchmark.
+'''
+import json
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import a2a.types as a2a_types
+from a2a_parts.agent_card import get_card, render_card
+from a2a_parts.frame_cache import render_template
+from a2a_parts.messaging import build_agent_message_from_line
+
+LINE = "To Sherlock Holmes she is always _the_ woman. I have seldom heard him"
+
+STREAM_REQUEST = {
+    "jsonrpc": "2.0",
+    "id": "9f3c2a8e4b1d4c6f8a7e5d3b2c1a0f9e",
+    "method": "message/stream",
+    "params": {
+        "message": {
+            "kind": "message",
+            "role": "user",
+            "messageId": "0d7c1e5f9a2b4c8d9e6f3a1b5c7d9e2f",
+            "contextId": "c0ffee00c0ffee00c0ffee00c0ffee00",
+            "parts": [
+                {"kind": "text", "text": "Give me a scene from Romeo and Juliet"},
+                {"kind": "data", "data": {"skill": "stream_romeo_and_juliet"}},
+            ],
+            "metadata": {"telex_channel_id": "01968f5a-7b1c-7d2e-8f3a-4b5c6d7e8f90"},
+        },
+        "configuration": {
+            "acceptedOutputModes": ["text/plain"],
+            "historyLength": 0,
+            "blocking": False,
+        },
+    },
+}
+
+GET_TASK_REQUEST = {
+    "jsonrpc": "2.0",
+    "id": 7,
+    "method": "tasks/get",
+    "params": {"id": "5a1e0c3d9b7f4e2a8c6d1f3b5e7a9c0d", "historyLength": 10},
+}
+
+
+@pytest.mark.parametrize("payload", [STREAM_REQUEST, GET_TASK_REQUEST], ids=["message_stream", "tasks_get"])
+def test_validate_python(benchmark, payload):
+    request = benchmark(a2a_types.A2ARequest.validate_python, payload)
+    assert request.method == payload["method"]
+
+
+@pytest.mark.parametrize("payload", [STREAM_REQUEST, GET_TASK_REQUEST], ids=["message_stream", "tasks_get"])
+def test_validate_json(benchmark, payload):
+    body = json.dumps(payload).encode()
+    request = benchmark(a2a_types.A2ARequest.validate_json, body)
+    assert request.method == payload["method"]
+
+
+def test_build_agent_message_from_line(benchmark):
+    response = benchmark(build_agent_message_from_line, LINE)
+    assert response.result.parts[0].text == LINE
+
+
+def test_stream_frame_model_dump_json(benchmark):
+    response = build_agent_message_from_line(LINE)
+    frame = benchmark(response.model_dump_json)
+    assert LINE in frame
+
+
+def test_stream_frame_build_and_dump(benchmark):
+    frame = benchmark(lambda: f"event: storyLine\ndata: {build_agent_message_from_line(LINE).model_dump_json()}\n\n")
+    assert frame.startswith("event: storyLine")
+
+
+def test_stream_frame_template_fill(benchmark):
+    template = render_template("storyLine", [LINE])
+    frame = benchmark(template.fill, b"9f3c2a8e4b1d4c6f8a7e5d3b2c1a0f9e", b"0d7c1e5f9a2b4c8d9e6f3a1b5c7d9e2f")
+    assert LINE.encode() in frame
+
+
+def test_get_card(benchmark):
+    card = benchmark(get_card, "https://agents.example.com")
+    assert card.skills
+
+
+def test_get_card_render(benchmark):
+    body = benchmark(lambda: get_card("https://agents.example.com").model_dump_json())
+    assert "stream_bible" in body
+
+
+def test_render_card_cached(benchmark):
+    card = benchmark(render_card, "https://agents.example.com")
+    assert b"stream_bible" in card.body
@@ -0,0 +1,268 @@
+'''
+Load generator for message/stream.
+
+Drives concurrent message/stream requests for each keyword route and reports
+time to first event, inter-event latency percentiles, throughput and peak RSS
+as JSON, so runs can be compared across releases and streaming modes.
+
+    python -m bench.stream_bench --concurrency 50 --requests 200 --output results.json
+    python -m bench.stream_bench --set STREAM_MODE=sync --set FRAME_CACHE_ENABLED=false
+    python -m bench.stream_bench --url http://127.0.0.1:7001 --server-pid 1234
+'''
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import socket
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from uuid import uuid4 as uuid
+
+import httpx
+
+# Keyed by the document each prompt streams
+ROUTES = {
+    "bible": "Stream me a chapter of the bible",
+    "romeo_and_juliet": "Give me a scene from Romeo and Juliet",
+    "sherlock": "Tell me a story",
+}
+
+
+def stream_payload(prompt: str) -> dict:
+    return {
+        "jsonrpc": "2.0",
+        "id": uuid().hex,
+        "method": "message/stream",
+        "params": {
+            "message": {
+                "role": "user",
+                "messageId": uuid().hex,
+                "parts": [{"kind": "text", "text": prompt}],
+            },
+        },
+    }
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[rank]
+
+
+def summarize(values: list[float]) -> dict:
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def peak_rss_bytes(pid: int | None) -> int | None:
+    if pid is None:
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def failure_reason(status: int, content_type: str, body: bytes) -> str:
+    '''
+    Why a response that isn't an event stream failed, e.g. the JSON-RPC error
+    the agent answers with when a route's document is missing
+    '''
+    try:
+        error = json.loads(body).get("error") or {}
+    except (ValueError, AttributeError):
+        error = {}
+    if error:
+        return f"JSON-RPC {error.get('code')}: {error.get('message')}"
+    return f"HTTP {status} {content_type or 'without a content type'}"
+
+
+async def run_stream(client: httpx.AsyncClient, url: str, prompt: str) -> dict:
+    started = time.perf_counter()
+    first_event_at = None
+    event_times: list[float] = []
+    total_bytes = 0
+    pending = b""
+
+    async with client.stream("POST", url, json=stream_payload(prompt)) as response:
+        status = response.status_code
+        content_type = response.headers.get("content-type", "")
+        if status >= 300 or not content_type.startswith("text/event-stream"):
+            return {"status": status, "failure": failure_reason(status, content_type, await response.aread())}
+        async for chunk in response.aiter_raw():
+            now = time.perf_counter()
+            total_bytes += len(chunk)
+            pending += chunk
+            # Every complete SSE frame ends with a blank line
+            events = pending.count(b"\n\n")
+            if events:
+                pending = pending[pending.rfind(b"\n\n") + 2:]
+                if first_event_at is None:
+                    first_event_at = now
+                event_times.extend([now] * events)
+
+    finished = time.perf_counter()
+    return {
+        "status": status,
+        "failure": None,
+        "ttfe": None if first_event_at is None else first_event_at - started,
+        "gaps": [b - a for a, b in zip(event_times, event_times[1:])],
+        "events": len(event_times),
+        "bytes": total_bytes,
+        "duration": finished - started,
+    }
+
+
+async def run_route(url: str, prompt: str, concurrency: int, requests: int, timeout: float) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    errors: list[str] = []
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        async def one():
+            async with semaphore:
+                try:
+                    return await run_stream(client, url, prompt)
+                except httpx.HTTPError as e:
+                    errors.append(f"{type(e).__name__}: {e}")
+                    return None
+
+        started = time.perf_counter()
+        answered = [r for r in await asyncio.gather(*(one() for _ in range(requests))) if r]
+        wall = time.perf_counter() - started
+
+    # Only real streams count towards the latency and throughput figures
+    results = [r for r in answered if r["failure"] is None]
+    failures = [r["failure"] for r in answered if r["failure"] is not None]
+    total_bytes = sum(r["bytes"] for r in results)
+    total_events = sum(r["events"] for r in results)
+    return {
+        "requests": requests,
+        "completed": len(results),
+        "failed": len(failures),
+        "sample_failures": sorted(set(failures))[:5],
+        "non_2xx": sum(1 for r in answered if r["status"] >= 300),
+        "errors": len(errors),
+        "sample_errors": errors[:5],
+        "wall_seconds": wall,
+        "time_to_first_event": summarize([r["ttfe"] for r in results if r["ttfe"] is not None]),
+        "inter_event_latency": summarize([gap for r in results for gap in r["gaps"]]),
+        "stream_duration": summarize([r["duration"] for r in results]),
+        "bytes_per_second": total_bytes / wall if wall else None,
+        "events_per_second": total_events / wall if wall else None,
+        "total_bytes": total_bytes,
+        "total_events": total_events,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_local_server(port: int):
+    import uvicorn
+    from main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark message/stream")
+    parser.add_argument("--url", help="Benchmark a running server instead of starting one in-process")
+    parser.add_argument("--server-pid", type=int, help="PID of the server behind --url, for peak RSS")
+    parser.add_argument("--routes", nargs="+", choices=sorted(ROUTES), default=list(ROUTES))
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=100, help="Requests per route")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="Environment for the in-process server, e.g. STREAM_MODE=sync")
+    parser.add_argument("--label", help="Free-form name for this run")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    settings = dict(item.split("=", 1) for item in args.set)
+    # Settings are read at import time, so apply them before the app is loaded
+    os.environ.update(settings)
+
+    server = None
+    url = args.url
+    skipped = {}
+    run_routes = list(args.routes)
+    if url is None:
+        from utils import document_index
+
+        # Without its document a route only measures how fast errors come back
+        present = set(document_index.available_documents())
+        for route in run_routes:
+            if route not in present:
+                skipped[route] = f"{document_index.document_path(route)} is missing"
+                print(f"warning: skipping {route}, {skipped[route]}", file=sys.stderr)
+        run_routes = [route for route in run_routes if route in present]
+        server, thread = start_local_server(free_port())
+        url = f"http://127.0.0.1:{server.config.port}/"
+
+    try:
+        routes = {
+            route: asyncio.run(run_route(url, ROUTES[route], args.concurrency, args.requests, args.timeout))
+            for route in run_routes
+        }
+    finally:
+        if server is not None:
+            server.should_exit = True
+            thread.join(timeout=5)
+
+    report = {
+        "label": args.label,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "url": url,
+        "in_process": args.url is None,
+        "settings": settings,
+        "concurrency": args.concurrency,
+        "requests_per_route": args.requests,
+        "peak_rss_bytes": peak_rss_bytes(args.server_pid if args.url else None),
+        "routes": routes,
+        "skipped_routes": skipped,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
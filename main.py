@@ -1,48 +1,86 @@
 import os
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response
 from dotenv import load_dotenv
-import a2a.types as a2a_types
-from a2a_parts.agent_card import get_card
-from a2a_parts.handle_messaging import handle_message_stream
+from a2a_parts.admission import limiter
+from a2a_parts.agent_card import AGENT_CARD_MAX_AGE, etag_matches, render_card
+from a2a_parts.dispatch import dispatch
+from a2a_parts.push_notifications import notifier
+from a2a_parts.task_runner import runner
+from a2a_parts.task_store import tasks
+from utils import document_index, metrics, profiling, search_index
 
 load_dotenv()
-app = FastAPI()
 
 
-@app.post("/")
-def handle_rpc(request_data: dict):
-    try:
-        rpc_request = a2a_types.A2ARequest.validate_python(request_data)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the section offset tables once so requests can seek straight to a section
+    document_index.build_all()
+    # Maps documents/search.idx when it was built offline and is current, builds in memory otherwise
+    if search_index.available_documents():
+        search_index.get_index()
+    tasks.start()
+    yield
+    await runner.close()
+    await notifier.close()
+    limiter.close()
+    tasks.close()
+
 
-        if isinstance(rpc_request, a2a_types.StreamMessageRequest):
-            print("Recieved message/stream")
-            return handle_message_stream(params=rpc_request.params)
-        elif isinstance(rpc_request, a2a_types.GetTaskRequest):
-            print("Received tasks/get")
-        else:
-            raise HTTPException(status_code=400, detail="Method not supported")
+app = FastAPI(lifespan=lifespan)
 
-    except Exception as e:
-        print(f"Error processing request: {e}")
-        raise HTTPException(status_code=400, detail="Could not handle task")
+
+@app.post("/")
+async def handle_rpc(request: Request):
+    return await dispatch(await request.body(), request)
 
 
 @app.get("/")
 def root_route(request: Request):
     return HTMLResponse(
         """
-        <h1>Streaming Agent Example</h1><p style="font-size: 20px; line-height: 1.5rem">An agent that streams responses and can stream the bible, Romeo and Juliet, or Sherlock Holmes. If a keyword like "bible" is supplied, it streams the bible, if romeo or juliet are supplied, it streams a Scene of the play. If none of these are supplied, it streams a chapter of the Adventures of Sherlock Holmes.</p>
+        <h1>Streaming Agent Example</h1><p style="font-size: 20px; line-height: 1.5rem">An agent that streams responses and can stream the bible, Romeo and Juliet, The Art of War, or Sherlock Holmes. If a keyword like "bible" is supplied, it streams the bible, if romeo or juliet are supplied, it streams a Scene of the play, if "art of war" or "sun tzu" is supplied, it streams a chapter of The Art of War, or just the verses asked for, as in "art of war chapter 3 verses 5-8". If the message starts with "search" or "find", it streams the passages that best match the rest of it. If none of these are supplied, it streams a chapter of the Adventures of Sherlock Holmes.</p>
         """
     )
 
 
+@app.get("/metrics")
+async def metrics_route():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/debug/profiles/{profile_id}")
+async def profile_route(profile_id: str):
+    profile = profiling.profiles.get(profile_id)
+    if profile is None:
+        return JSONResponse({"error": "No such profile"}, status_code=404)
+    return profile.summary()
+
+
+@app.get("/debug/profiles/{profile_id}/collapsed")
+async def profile_stacks_route(profile_id: str):
+    profile = profiling.profiles.get(profile_id)
+    if profile is None:
+        return PlainTextResponse("No such profile\n", status_code=404)
+    return PlainTextResponse(profile.collapsed())
+
+
 @app.get("/.well-known/agent.json")
-def agent_card(request: Request):
+async def agent_card(request: Request):
     external_base = request.headers.get("x-external-base-url", "")
     base_url = str(request.base_url).rstrip("/") + external_base
 
-    return get_card(base_url)
+    card = render_card(base_url)
+    headers = {
+        "ETag": card.etag,
+        "Cache-Control": f"public, max-age={AGENT_CARD_MAX_AGE}",
+        "Vary": "X-External-Base-URL",
+    }
+    if etag_matches(request.headers.get("if-none-match"), card.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(card.body, media_type="application/json", headers=headers)
 
 
 if __name__ == "__main__":
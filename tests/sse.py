@@ -0,0 +1,40 @@
+import json
+import re
+
+RANDOM_ID = re.compile(rb'"(id|messageId)":"[0-9a-f]{32}"')
+
+
+def parse_frames(body: bytes) -> list[dict]:
+    '''
+    SSE frames as {"id", "event", "data"} with the data JSON decoded
+    '''
+    frames = []
+    for block in body.split(b"\n\n"):
+        if not block.strip():
+            continue
+        frame = {"id": None, "event": None, "data": None}
+        for line in block.split(b"\n"):
+            field, _, value = line.decode().partition(": ")
+            frame[field] = json.loads(value) if field == "data" else value
+        frames.append(frame)
+    return frames
+
+
+def without_random_ids(frame: bytes) -> bytes:
+    '''
+    A frame with its freshly generated rpc id and messageId blanked, for comparing encodings
+    '''
+    return RANDOM_ID.sub(rb'"\1":""', frame)
+
+
+def texts(frames: list[dict]) -> list[list[str]]:
+    '''
+    The text parts of each message or artifact frame
+    '''
+    result = []
+    for frame in frames:
+        data = frame["data"]["result"]
+        parts = data["artifact"]["parts"] if "artifact" in data else data.get("parts")
+        if parts is not None:
+            result.append([part["text"] for part in parts])
+    return result
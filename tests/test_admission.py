@@ -0,0 +1,196 @@
+import anyio
+import httpx
+import pytest
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+from a2a_parts import admission, coalescing, dispatch
+from a2a_parts.admission import InMemoryLimiter, LimiterUnavailable, Overloaded
+from a2a_parts.backpressure import BackpressureStreamingResponse
+from main import app
+from utils import metrics
+
+CLIENT_IP = "10.0.0.1"
+
+
+def stream_request(text: str = "romeo") -> dict:
+    return {
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": "message/stream",
+        "params": {"message": {"role": "user", "messageId": "m-1", "parts": [{"kind": "text", "text": text}]}},
+    }
+
+
+@pytest.fixture
+def limiter(monkeypatch) -> InMemoryLimiter:
+    limiter = InMemoryLimiter(max_streams=10)
+    monkeypatch.setattr(admission, "limiter", limiter)
+    monkeypatch.setattr(admission, "MAX_STREAMS_PER_IP", 2)
+    monkeypatch.setattr(admission, "MAX_STREAMS_PER_TOKEN", 3)
+    return limiter
+
+
+@pytest.fixture
+async def client():
+    transport = httpx.ASGITransport(app=app, client=(CLIENT_IP, 1234))
+    async with httpx.AsyncClient(transport=transport, base_url="http://agent") as client:
+        yield client
+
+
+def test_client_limits():
+    limiter = InMemoryLimiter(max_streams=0)
+    leases = [limiter.acquire("ip:a", 2) for _ in range(2)]
+    with pytest.raises(Overloaded) as refused:
+        limiter.acquire("ip:a", 2)
+    assert refused.value.limit == "ip"
+    # Other clients have their own count
+    limiter.acquire("ip:b", 2)
+    limiter.acquire("token:t", 1)
+    with pytest.raises(Overloaded) as refused:
+        limiter.acquire("token:t", 1)
+    assert refused.value.limit == "token"
+
+    leases[0].release()
+    leases[0].release()
+    assert limiter.active() == 3
+    limiter.acquire("ip:a", 2)
+
+
+def test_global_limit():
+    limiter = InMemoryLimiter(max_streams=2)
+    limiter.acquire("ip:a", 0)
+    lease = limiter.acquire("ip:b", 0)
+    with pytest.raises(Overloaded) as refused:
+        limiter.acquire("ip:c", 0)
+    assert refused.value.limit == "global"
+    lease.release()
+    limiter.acquire("ip:c", 0)
+
+
+@pytest.mark.anyio
+async def test_client_key_prefers_bearer_token(limiter, client, monkeypatch):
+    seen = []
+
+    async def aacquire(client, client_limit):
+        seen.append((client, client_limit))
+        raise Overloaded("ip")
+
+    monkeypatch.setattr(limiter, "aacquire", aacquire)
+    await client.post("/", json=stream_request())
+    await client.post("/", json=stream_request(), headers={"Authorization": "Bearer secret"})
+
+    assert seen[0] == ("ip:" + CLIENT_IP, 2)
+    assert seen[1][0].startswith("token:") and "secret" not in seen[1][0]
+    assert seen[1][1] == 3
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("trusted, counted", [(CLIENT_IP, "203.0.113.7"), ("127.0.0.1", CLIENT_IP)])
+async def test_forwarded_address_counts_only_from_a_trusted_proxy(limiter, monkeypatch, trusted, counted):
+    seen = []
+
+    async def aacquire(client, client_limit):
+        seen.append(client)
+        raise Overloaded("ip")
+
+    monkeypatch.setattr(limiter, "aacquire", aacquire)
+    proxied = ProxyHeadersMiddleware(app, trusted_hosts=trusted)
+    transport = httpx.ASGITransport(app=proxied, client=(CLIENT_IP, 1234))
+    async with httpx.AsyncClient(transport=transport, base_url="http://agent") as client:
+        await client.post("/", json=stream_request(), headers={"X-Forwarded-For": "203.0.113.7"})
+
+    assert seen == ["ip:" + counted]
+
+
+@pytest.mark.anyio
+async def test_refused_stream_gets_retry_after(limiter, client):
+    limiter.acquire("ip:" + CLIENT_IP, 2)
+    limiter.acquire("ip:" + CLIENT_IP, 2)
+
+    response = await client.post("/", json=stream_request())
+    assert response.headers["retry-after"] == str(admission.ADMISSION_RETRY_AFTER_SECONDS)
+    error = response.json()["error"]
+    assert error["code"] == -32029
+    assert error["data"] == {"limit": "ip", "retryAfter": admission.ADMISSION_RETRY_AFTER_SECONDS}
+    assert limiter.active() == 2
+
+
+@pytest.mark.anyio
+async def test_completed_stream_releases_its_slot(limiter, client):
+    response = await client.post("/", json=stream_request())
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert "event: sceneLine" in response.text
+    assert limiter.active() == 0
+
+
+@pytest.mark.anyio
+async def test_error_answer_releases_its_slot(limiter, client, monkeypatch):
+    invalid = stream_request()
+    invalid["params"]["metadata"] = {"output": "nope"}
+    response = await client.post("/", json=invalid)
+    assert response.json()["error"]["code"] == -32602
+    assert limiter.active() == 0
+
+    def fail(rpc, request):
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(dispatch.HANDLERS, "message/stream", fail)
+    response = await client.post("/", json=stream_request())
+    assert response.json()["error"]["code"] == -32603
+    assert limiter.active() == 0
+
+
+@pytest.mark.anyio
+async def test_disconnect_releases_its_slot(monkeypatch):
+    # Every frame written at once, so some are out before the disconnect
+    monkeypatch.setattr(coalescing, "FLUSH_BYTES", 0)
+    limiter = InMemoryLimiter()
+    lease = limiter.acquire("ip:a", 0)
+
+    async def frames():
+        while True:
+            yield b"event: storyLine\ndata: {}\n\n"
+            await anyio.sleep(0.01)
+
+    async def receive():
+        await anyio.sleep(0.05)
+        return {"type": "http.disconnect"}
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    response = BackpressureStreamingResponse(frames(), media_type="text/event-stream")
+    response.on_close = lease.arelease
+    with anyio.fail_after(5):
+        await response({"type": "http"}, receive, send)
+
+    assert len(sent) > 1
+    assert limiter.active() == 0
+
+
+@pytest.mark.anyio
+async def test_unavailable_limiter_admits_uncounted(limiter, client, monkeypatch):
+    async def aacquire(client, client_limit):
+        raise LimiterUnavailable("connection refused")
+
+    monkeypatch.setattr(limiter, "aacquire", aacquire)
+    before = metrics.admission_unavailable.value()
+
+    response = await client.post("/", json=stream_request())
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert metrics.admission_unavailable.value() == before + 1
+
+
+@pytest.mark.anyio
+async def test_unreachable_redis_is_unavailable():
+    redis = pytest.importorskip("redis")
+    from a2a_parts.redis_admission import RedisLimiter
+
+    limiter = RedisLimiter(redis.Redis(host="127.0.0.1", port=1, socket_connect_timeout=0.2))
+    try:
+        with pytest.raises(LimiterUnavailable):
+            await limiter.aacquire("ip:a", 1)
+        assert limiter.active() == 0
+    finally:
+        limiter.close()
@@ -0,0 +1,55 @@
+import asyncio
+import gc
+import pytest
+from a2a_parts import broadcast as broadcast_module
+from a2a_parts.broadcast import Broadcast
+from a2a_parts.handle_messaging import sherlock_chapter_stream
+from a2a_parts.streaming import aiter_frames
+from tests.sse import without_random_ids
+from utils import document_index, metrics
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def stream():
+    index = document_index.get_index("sherlock")
+    return sherlock_chapter_stream(index, index.of_kind("chapter")[0])
+
+
+async def read(frames, delay: float = 0) -> list[bytes]:
+    received = []
+    async for frame in frames:
+        received.append(without_random_ids(frame))
+        if delay:
+            await asyncio.sleep(delay)
+    return received
+
+
+async def test_slow_subscriber_holds_the_producer_back(stream):
+    expected = await read(aiter_frames(stream))
+    assert len(expected) > 16
+    fallbacks = metrics.broadcast_fallbacks.value()
+
+    shared = Broadcast(("test", "slow"), stream, capacity=4)
+    shared.start()
+    fast, slow = shared.subscribe(), shared.subscribe()
+    results = await asyncio.gather(read(fast), read(slow, delay=0.001))
+
+    assert results == [expected, expected]
+    assert metrics.broadcast_fallbacks.value() == fallbacks
+    assert shared.subscribers == 0
+
+
+async def test_unread_subscription_stops_holding_the_producer(stream):
+    shared = Broadcast(("test", "unread"), stream, capacity=4)
+    shared.start()
+    frames = shared.subscribe()
+    await asyncio.sleep(0.01)
+    assert shared.head == 4 and not shared.done
+
+    del frames
+    gc.collect()
+    await asyncio.wait_for(shared._producer, 5)
+    assert shared.done and shared.subscribers == 0
+    assert ("test", "unread") not in broadcast_module.broadcasts._broadcasts
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import anyio
+import pytest
+from a2a_parts import coalescing
+from a2a_parts.backpressure import BackpressureStreamingResponse
+
+
+class Frames:
+    '''
+    An async frame producer that records whether it was closed
+    '''
+
+    def __init__(self, count: int, delay: float = 0):
+        self.count = count
+        self.delay = delay
+        self.closed = False
+        self.sent = 0
+
+    async def __aiter__(self):
+        try:
+            for i in range(self.count):
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                self.sent += 1
+                yield f"data: {i}\n\n".encode()
+        finally:
+            self.closed = True
+
+
+@pytest.fixture(params=[0, 64], ids=["unbuffered", "buffered"])
+def flush_bytes(request, monkeypatch):
+    monkeypatch.setattr(coalescing, "FLUSH_BYTES", request.param)
+    monkeypatch.setattr(coalescing, "FLUSH_MS", 5)
+    return request.param
+
+
+async def bundle(frames: Frames) -> list[bytes]:
+    '''
+    The writes `frames` is bundled into, read through a memory stream as the response does
+    '''
+    send, receive = anyio.create_memory_object_stream[bytes](8)
+
+    async def produce():
+        async with send:
+            async for frame in frames:
+                await send.send(frame)
+
+    async with anyio.create_task_group() as task_group:
+        task_group.start_soon(produce)
+        async with receive:
+            return [chunk async for chunk in coalescing.abundle_writes(receive)]
+
+
+async def respond(frames: Frames, accept: int | None = None) -> list[bytes]:
+    '''
+    The body chunks a BackpressureStreamingResponse writes, with the client
+    going away after `accept` of them
+    '''
+    written = []
+
+    async def receive():
+        await anyio.sleep_forever()
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message["body"]:
+            if accept is not None and len(written) == accept:
+                raise OSError("client went away")
+            written.append(message["body"])
+
+    await BackpressureStreamingResponse(frames.__aiter__(), media_type="text/event-stream")({"type": "http"}, receive, send)
+    return written
+
+
+@pytest.mark.anyio
+async def test_every_frame_is_written_in_order(flush_bytes):
+    frames = Frames(50)
+    written = b"".join(await bundle(frames))
+    assert written == b"".join(f"data: {i}\n\n".encode() for i in range(50))
+
+
+@pytest.mark.anyio
+async def test_response_bundles_every_frame(flush_bytes):
+    frames = Frames(50)
+    chunks = await respond(frames)
+    assert b"".join(chunks) == b"".join(f"data: {i}\n\n".encode() for i in range(50))
+    if flush_bytes:
+        assert len(chunks) < 50
+    else:
+        assert len(chunks) == 50
+    assert frames.closed
+
+
+@pytest.mark.anyio
+async def test_disconnect_closes_the_producer(flush_bytes):
+    frames = Frames(1000, delay=0.002)
+    await respond(frames, accept=1)
+    assert frames.closed
+    assert frames.sent < 1000
+
+
+@pytest.mark.anyio
+async def test_stalled_producer_is_flushed_by_the_deadline(monkeypatch):
+    monkeypatch.setattr(coalescing, "FLUSH_BYTES", 1 << 20)
+    monkeypatch.setattr(coalescing, "FLUSH_MS", 5)
+    frames = Frames(3, delay=0.05)
+    # Each frame waits out the deadline on its own rather than for the buffer to fill
+    assert await bundle(frames) == [f"data: {i}\n\n".encode() for i in range(3)]
+
+
+def test_text_and_escaped_lines_batch_alike(monkeypatch):
+    monkeypatch.setattr(coalescing, "BATCH_LINES", 100)
+    monkeypatch.setattr(coalescing, "BATCH_BYTES", 40)
+    # Curly quotes are three bytes each, counted the same on both paths
+    lines = ["“Seven!” I answered. “Indeed”\n", "more.\n", "“I fancy,” said he, “Watson.”\n", "x\n"]
+    escaped = [json.dumps(line.strip(), ensure_ascii=False)[1:-1].encode() for line in lines]
+
+    text_batches = [len(batch) for batch in coalescing.batch_lines(lines)]
+    escaped_batches = [len(batch) for batch in coalescing.batch_lines(escaped, coalescing.pack_escaped, len)]
+    assert text_batches == escaped_batches == [2, 2]
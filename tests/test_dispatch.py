@@ -0,0 +1,57 @@
+import pytest
+from a2a_parts import dispatch
+from utils import document_index
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("body, code, request_id", [
+    (b"{not json", -32700, None),
+    (b"[1, 2]", -32600, None),
+    (b'{"jsonrpc": "1.0", "id": 7, "method": "tasks/get", "params": {"id": "x"}}', -32600, 7),
+    (b'{"jsonrpc": "2.0", "id": 7, "method": "tasks/explode", "params": {}}', -32601, 7),
+    (b'{"jsonrpc": "2.0", "id": "abc", "method": "tasks/get"}', -32602, "abc"),
+    (b'{"jsonrpc": "2.0", "id": 7, "method": "tasks/get", "params": {}}', -32602, 7),
+    (b'{"jsonrpc": "2.0", "id": 7, "method": "tasks/get", "params": {"id": "no-such-task"}}', -32001, 7),
+    (b'{"jsonrpc": "2.0", "id": 7, "method": "message/stream", "params": {"metadata": {"output": "nope"}, '
+     b'"message": {"role": "user", "messageId": "m", "parts": [{"kind": "text", "text": "holmes"}]}}}', -32602, 7),
+])
+async def test_error_mapping(client, body, code, request_id):
+    response = await client.post("/", content=body)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    payload = response.json()
+    assert payload["error"]["code"] == code
+    assert payload["id"] == request_id
+    assert payload["result"] is None
+
+
+async def test_invalid_params_say_which_field(client):
+    response = await client.post("/", content=b'{"jsonrpc": "2.0", "id": 7, "method": "tasks/get", "params": {}}')
+    assert response.json()["error"]["data"] == [{"loc": "tasks/get.params.id", "msg": "Field required"}]
+
+
+async def test_handler_failure_is_an_internal_error(client, monkeypatch):
+    def fail(rpc, request):
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(dispatch.HANDLERS, "tasks/get", fail)
+    response = await client.post("/", json={"jsonrpc": "2.0", "id": 9, "method": "tasks/get", "params": {"id": "x"}})
+    error = response.json()["error"]
+    assert error["code"] == -32603
+    assert "boom" not in response.text
+    assert response.json()["id"] == 9
+
+
+async def test_unavailable_document_is_an_internal_error(client, monkeypatch):
+    def missing(name):
+        raise FileNotFoundError(name)
+
+    monkeypatch.setattr(document_index, "get_index", missing)
+    response = await client.post("/", json={
+        "jsonrpc": "2.0", "id": 3, "method": "message/stream",
+        "params": {"message": {"role": "user", "messageId": "m", "parts": [{"kind": "text", "text": "bible"}]}},
+    })
+    error = response.json()["error"]
+    assert error["code"] == -32603
+    assert error["message"] == "The requested document is not available on this agent"
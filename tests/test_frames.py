@@ -0,0 +1,101 @@
+import json
+import pytest
+from a2a_parts import coalescing, frame_cache
+from a2a_parts.handle_messaging import rj_scene_stream, sherlock_chapter_stream
+from tests.sse import without_random_ids
+from utils import document_index
+
+TASK_ID = b"task-1"
+
+
+@pytest.fixture(scope="module")
+def packed_corpus(tmp_path_factory):
+    return str(tmp_path_factory.mktemp("corpus") / "corpus.pack")
+
+
+@pytest.fixture
+def indexes(packed_corpus, monkeypatch):
+    '''
+    Each document's index read from its text file and from a compiled corpus pack
+    '''
+    monkeypatch.setattr(document_index, "CORPUS_PATH", packed_corpus)
+    monkeypatch.setattr(document_index, "_corpus", None)
+    monkeypatch.setattr(document_index, "_corpus_opened", True)
+    plain = {name: document_index.build_index(name) for name in ("sherlock", "romeo_and_juliet")}
+
+    document_index.compile_corpus(packed_corpus)
+    monkeypatch.setattr(document_index, "_corpus_opened", False)
+    packed = {name: document_index.build_index(name) for name in plain}
+    assert all(index.escaped is not None for index in packed.values())
+    return plain, packed
+
+
+@pytest.fixture(params=[(1, 0, "parts"), (4, 0, "parts"), (4, 200, "joined")], ids=["line", "parts", "joined"])
+def batching(request, monkeypatch):
+    lines, size, form = request.param
+    monkeypatch.setattr(coalescing, "BATCH_LINES", lines)
+    monkeypatch.setattr(coalescing, "BATCH_BYTES", size)
+    monkeypatch.setattr(coalescing, "BATCH_FORMAT", form)
+
+
+def sections(plain, packed):
+    for build, name, kind in ((sherlock_chapter_stream, "sherlock", "chapter"), (rj_scene_stream, "romeo_and_juliet", "scene")):
+        for section in plain[name].of_kind(kind)[:3]:
+            yield build(plain[name], section), build(packed[name], section)
+
+
+def model_frames(segment, task_id=None) -> list[bytes]:
+    return [frame_cache.encode_frame(segment.event, lines, task_id) for lines in segment.frames()]
+
+
+def template_frames(segment, task_id=None) -> list[bytes]:
+    templates = frame_cache.build_templates(segment.event, segment.frames(), task_id is not None)
+    return list(frame_cache.fill_templates(templates, task_id))
+
+
+def splice_frames(segment, task_id=None) -> list[bytes]:
+    templates = frame_cache.splice_templates(segment.event, segment.escaped_frames(), task_id is not None)
+    return list(frame_cache.fill_templates(templates, task_id))
+
+
+@pytest.mark.usefixtures("batching")
+def test_every_path_encodes_the_same_frames(indexes):
+    for from_text, from_pack in sections(*indexes):
+        for segment, packed_segment in zip(from_text.segments, from_pack.segments):
+            expected = [without_random_ids(frame) for frame in model_frames(segment)]
+            assert expected
+            assert [without_random_ids(frame) for frame in template_frames(segment)] == expected
+            if packed_segment.escaped is not None:
+                assert [without_random_ids(frame) for frame in splice_frames(packed_segment)] == expected
+
+
+@pytest.mark.usefixtures("batching")
+def test_every_path_encodes_the_same_artifact_chunks(indexes):
+    for from_text, from_pack in sections(*indexes):
+        for segment, packed_segment in zip(from_text.segments, from_pack.segments):
+            expected = [without_random_ids(frame) for frame in model_frames(segment, TASK_ID)]
+            assert [without_random_ids(frame) for frame in template_frames(segment, TASK_ID)] == expected
+            if packed_segment.escaped is not None:
+                assert [without_random_ids(frame) for frame in splice_frames(packed_segment, TASK_ID)] == expected
+
+
+def test_cached_frames_match_a_fresh_encoding(indexes):
+    plain, _ = indexes
+    stream = sherlock_chapter_stream(plain["sherlock"], plain["sherlock"].of_kind("chapter")[0])
+    segment = stream.segments[1]
+    key = ("test", "cached")
+
+    first = list(frame_cache.stream_frames(key, segment.event, segment.frames))
+    assert frame_cache.cached_templates(key, segment.event) is not None
+    second = list(frame_cache.stream_frames(key, segment.event, segment.frames))
+    assert [without_random_ids(frame) for frame in first] == [without_random_ids(frame) for frame in second]
+    # Every frame gets fresh ids
+    assert first[0] != second[0]
+
+
+def test_escaping_round_trips(indexes):
+    plain, packed = indexes
+    section = plain["romeo_and_juliet"].of_kind("scene")[0]
+    lines = [line.strip() for line in plain["romeo_and_juliet"].iter_lines(section)]
+    escaped = list(packed["romeo_and_juliet"].iter_escaped(section))
+    assert [json.loads(b'"' + line + b'"') for line in escaped] == lines
@@ -0,0 +1,54 @@
+import threading
+import time
+import pytest
+from utils import profiling
+
+
+def test_samples_can_be_read_while_sampling(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_MS", 1)
+    profile = profiling.Profile("stacks")
+    profile.start_sampling(threading.get_ident())
+    try:
+        deadline = time.monotonic() + 0.3
+        while time.monotonic() < deadline:
+            collapsed = profile.collapsed()
+            summary = profile.summary()
+    finally:
+        profile.finish()
+        profile._sampler.join(timeout=1)
+
+    assert summary["samples"] > 0
+    assert "test_samples_can_be_read_while_sampling" in collapsed
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in profile.collapsed().splitlines()) == profile.summary()["samples"]
+
+
+@pytest.mark.anyio
+async def test_profile_of_a_stream_can_be_read_back(client, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_MS", 1)
+    response = await client.post("/", headers={profiling.HEADER: "stacks"}, json={
+        "jsonrpc": "2.0", "id": 1, "method": "message/stream",
+        "params": {
+            "message": {"role": "user", "messageId": "m", "parts": [{"kind": "text", "text": "romeo"}]},
+        },
+    })
+    assert response.headers["content-type"].startswith("text/event-stream")
+    profile_id = response.headers["X-Profile-Id"]
+
+    summary = (await client.get(f"/debug/profiles/{profile_id}")).json()
+    assert summary["complete"] and summary["mode"] == "stacks"
+    assert {"route", "write"} <= summary["stages"].keys()
+    assert summary["stages"]["write"]["count"] > 0
+    assert "every other request" in summary["scope"]
+
+    collapsed = await client.get(f"/debug/profiles/{profile_id}/collapsed")
+    assert collapsed.headers["content-type"].startswith("text/plain")
+    counts = [int(line.rsplit(" ", 1)[1]) for line in collapsed.text.splitlines()]
+    assert summary["samples"] > 0
+    assert sum(counts) == summary["samples"]
+
+
+@pytest.mark.anyio
+async def test_unknown_profile(client):
+    assert (await client.get("/debug/profiles/nope")).status_code == 404
+    assert (await client.get("/debug/profiles/nope/collapsed")).status_code == 404
@@ -0,0 +1,278 @@
+import asyncio
+import json
+import httpx
+import pytest
+import a2a.types as a2a_types
+from a2a_parts import push_notifications
+from a2a_parts.push_notifications import PushNotifier, retry_delay, valid_url
+from a2a_parts.task_store import TaskRecord, tasks
+from utils import metrics
+
+WEBHOOK = "https://hooks.test/a2a"
+
+
+@pytest.fixture(autouse=True)
+def fast_delivery(monkeypatch):
+    monkeypatch.setattr(push_notifications, "PUSH_BATCH_MS", 1)
+    monkeypatch.setattr(push_notifications, "PUSH_ALLOWED_HOSTS", frozenset({"hooks.test"}))
+
+
+@pytest.fixture
+def delays(monkeypatch) -> list[tuple[int, str | None]]:
+    '''
+    The retry delays asked for, skipped so tests don't wait them out
+    '''
+    asked = []
+
+    def delay(attempt: int, retry_after: str | None = None) -> float:
+        asked.append((attempt, retry_after))
+        return 0
+
+    monkeypatch.setattr(push_notifications, "retry_delay", delay)
+    return asked
+
+
+class Webhook:
+    '''
+    Answers calls with the given responses in turn, then 204s
+    '''
+
+    def __init__(self, *responses: httpx.Response):
+        self.responses = list(responses)
+        self.requests: list[httpx.Request] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        return self.responses.pop(0) if self.responses else httpx.Response(204)
+
+    def events(self) -> list[list[dict]]:
+        return [json.loads(request.content) for request in self.requests]
+
+
+def record(task_id: str = "task-1", **config) -> TaskRecord:
+    return TaskRecord(
+        id=task_id,
+        document="sherlock",
+        section_kind="chapter",
+        section_start=0,
+        background=True,
+        push_config=a2a_types.PushNotificationConfig(url=WEBHOOK, **config),
+    )
+
+
+def artifact_event(task: TaskRecord, index: int) -> a2a_types.TaskArtifactUpdateEvent:
+    artifact = a2a_types.Artifact(parts=[a2a_types.TextPart(text=f"part {index}")], index=index)
+    return a2a_types.TaskArtifactUpdateEvent(id=task.id, artifact=artifact)
+
+
+async def deliver(webhook: Webhook, *updates: tuple[TaskRecord, object]):
+    notifier = PushNotifier(transport=httpx.MockTransport(webhook))
+    for task, event in updates:
+        notifier.notify(task, event)
+    await notifier.close()
+
+
+@pytest.mark.anyio
+async def test_updates_are_batched_in_order():
+    webhook = Webhook()
+    first, second = record("task-1"), record("task-2")
+    await deliver(webhook, *((task, artifact_event(task, index)) for index in range(3) for task in (first, second)))
+
+    assert len(webhook.requests) == 1
+    [batch] = webhook.events()
+    assert [(event["id"], event["artifact"]["index"]) for event in batch] == [
+        (task_id, index) for index in range(3) for task_id in ("task-1", "task-2")
+    ]
+
+
+@pytest.mark.anyio
+async def test_batches_are_capped_and_sent_in_order(monkeypatch):
+    monkeypatch.setattr(push_notifications, "PUSH_BATCH_SIZE", 2)
+    webhook = Webhook()
+    task = record()
+    await deliver(webhook, *((task, artifact_event(task, index)) for index in range(5)))
+
+    batches = webhook.events()
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert [event["artifact"]["index"] for batch in batches for event in batch] == list(range(5))
+
+
+@pytest.mark.anyio
+async def test_credentials_are_sent():
+    webhook = Webhook()
+    task = record(
+        token="secret",
+        authentication=a2a_types.AuthenticationInfo(schemes=["Bearer"], credentials="jwt"),
+    )
+    await deliver(webhook, (task, task.status_event()))
+
+    headers = webhook.requests[0].headers
+    assert headers[push_notifications.TOKEN_HEADER] == "secret"
+    assert headers["authorization"] == "Bearer jwt"
+    assert headers["content-type"] == "application/json"
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("status", [429, 503])
+async def test_retries_honour_retry_after(delays, status):
+    webhook = Webhook(httpx.Response(status, headers={"Retry-After": "2"}))
+    task = record()
+    retried = metrics.push_deliveries.value(outcome="retried")
+    await deliver(webhook, (task, task.status_event()))
+
+    assert len(webhook.requests) == 2
+    assert webhook.requests[0].content == webhook.requests[1].content
+    assert delays == [(0, "2")]
+    assert metrics.push_deliveries.value(outcome="retried") == retried + 1
+
+
+@pytest.mark.anyio
+async def test_later_updates_wait_for_a_retried_batch(delays, monkeypatch):
+    monkeypatch.setattr(push_notifications, "PUSH_BATCH_SIZE", 1)
+    webhook = Webhook(httpx.Response(503))
+    task = record()
+    await deliver(webhook, *((task, artifact_event(task, index)) for index in range(3)))
+
+    assert [[event["artifact"]["index"] for event in batch] for batch in webhook.events()] == [[0], [0], [1], [2]]
+
+
+@pytest.mark.anyio
+async def test_gives_up_after_max_attempts(delays, monkeypatch):
+    monkeypatch.setattr(push_notifications, "PUSH_MAX_ATTEMPTS", 3)
+    webhook = Webhook(*(httpx.Response(503) for _ in range(5)))
+    task = record()
+    failed = metrics.push_deliveries.value(outcome="failed")
+    await deliver(webhook, (task, task.status_event()))
+
+    assert len(webhook.requests) == 3
+    assert len(delays) == 2
+    assert metrics.push_deliveries.value(outcome="failed") == failed + 1
+
+
+@pytest.mark.anyio
+async def test_zero_max_attempts_still_tries_once(delays, monkeypatch):
+    monkeypatch.setattr(push_notifications, "PUSH_MAX_ATTEMPTS", 0)
+    webhook = Webhook(httpx.Response(503))
+    task = record()
+    await deliver(webhook, (task, task.status_event()))
+
+    assert len(webhook.requests) == 1
+    assert delays == []
+
+
+@pytest.mark.anyio
+async def test_client_errors_are_not_retried(delays):
+    webhook = Webhook(httpx.Response(400))
+    task = record()
+    await deliver(webhook, (task, task.status_event()))
+
+    assert len(webhook.requests) == 1
+    assert delays == []
+
+
+@pytest.fixture
+def resolved(monkeypatch) -> list[str]:
+    '''
+    The addresses webhook hosts resolve to, with hooks.test no longer allowed
+    '''
+    addresses = ["93.184.215.14"]
+
+    async def resolve(host: str) -> list[str]:
+        return list(addresses)
+
+    monkeypatch.setattr(push_notifications, "PUSH_ALLOWED_HOSTS", frozenset())
+    monkeypatch.setattr(push_notifications, "resolve", resolve)
+    return addresses
+
+
+@pytest.mark.anyio
+async def test_calls_connect_to_the_address_checked(resolved):
+    webhook = Webhook()
+    task = record()
+    await deliver(webhook, (task, task.status_event()))
+
+    [request] = webhook.requests
+    assert request.url == "https://93.184.215.14/a2a"
+    assert request.headers["host"] == "hooks.test"
+    assert request.extensions["sni_hostname"] == "hooks.test"
+
+
+@pytest.mark.anyio
+async def test_internal_addresses_are_blocked_at_delivery(resolved, delays):
+    resolved.append("127.0.0.1")
+    webhook = Webhook()
+    task = record()
+    blocked = metrics.push_deliveries.value(outcome="blocked")
+    await deliver(webhook, (task, task.status_event()))
+
+    assert webhook.requests == []
+    assert delays == []
+    assert metrics.push_deliveries.value(outcome="blocked") == blocked + 1
+
+
+@pytest.mark.anyio
+async def test_host_limits_are_dropped_when_idle():
+    notifier = PushNotifier(transport=httpx.MockTransport(Webhook()))
+    task = record()
+    notifier.notify(task, task.status_event())
+    await asyncio.wait(list(notifier._deliveries.values()))
+
+    assert notifier._hosts == {}
+    assert not notifier._host_users
+    await notifier.close()
+
+
+def test_retry_delay_honours_retry_after():
+    assert retry_delay(0, "3") >= 3
+    assert retry_delay(0, "3600") <= push_notifications.PUSH_RETRY_MAX_MS / 1000
+    assert retry_delay(0, "soon") <= push_notifications.PUSH_RETRY_BASE_MS / 1000
+
+
+@pytest.mark.parametrize("url, valid", [
+    ("https://hooks.example.com/a2a", True),
+    ("http://93.184.215.14:8080/", True),
+    ("ftp://hooks.example.com/", False),
+    ("https:///a2a", False),
+    ("http://localhost:8001/", False),
+    ("http://127.0.0.1:8001/", False),
+    ("http://[::1]/", False),
+    ("http://10.1.2.3/", False),
+    ("http://192.168.0.10/", False),
+    ("http://169.254.169.254/latest/meta-data", False),
+    ("http://[fe80::1]/", False),
+])
+def test_valid_url(url, valid):
+    assert valid_url(url) is valid
+
+
+def test_allowed_hosts_may_be_internal(monkeypatch):
+    monkeypatch.setattr(push_notifications, "PUSH_ALLOWED_HOSTS", frozenset({"127.0.0.1"}))
+    assert valid_url("http://127.0.0.1:8001/")
+
+
+def set_request(task_id: str, url: str = "https://hooks.example.com/a2a") -> dict:
+    return {
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": "tasks/pushNotification/set",
+        "params": {"id": task_id, "pushNotificationConfig": {"url": url}},
+    }
+
+
+@pytest.mark.anyio
+async def test_set_on_a_background_task(client):
+    tasks.save(record("push-send", token=None))
+    response = (await client.post("/", json=set_request("push-send"))).json()
+    assert response["result"]["pushNotificationConfig"]["url"] == "https://hooks.example.com/a2a"
+    assert tasks.get("push-send").push_config.url == "https://hooks.example.com/a2a"
+
+    response = (await client.post("/", json=set_request("push-send", "http://10.0.0.5/"))).json()
+    assert response["error"]["code"] == -32602
+
+
+@pytest.mark.anyio
+async def test_set_on_a_streamed_task_is_not_supported(client):
+    tasks.save(TaskRecord(id="push-stream", document="sherlock", section_kind="chapter", section_start=0))
+    response = (await client.post("/", json=set_request("push-stream"))).json()
+    assert response["error"]["code"] == -32003
+    assert tasks.get("push-stream").push_config is None
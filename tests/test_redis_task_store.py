@@ -0,0 +1,146 @@
+import time
+import fakeredis
+import pytest
+import a2a.types as a2a_types
+from a2a_parts.redis_task_store import RedisTaskStore
+from a2a_parts.task_store import TaskRecord
+
+
+def wait_for(condition, timeout: float = 2) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def make_store(server):
+    '''
+    Stores sharing one Redis, as separate workers would
+    '''
+    stores = []
+
+    def make(**kwargs) -> RedisTaskStore:
+        store = RedisTaskStore(fakeredis.FakeRedis(server=server), **kwargs)
+        store.start()
+        stores.append(store)
+        return store
+
+    yield make
+    for store in stores:
+        store.close()
+
+
+def record(task_id: str = "task-1", **kwargs) -> TaskRecord:
+    return TaskRecord(id=task_id, document="sherlock", section_kind="chapter", section_start=120, **kwargs)
+
+
+def test_save_then_get_from_another_store(make_store):
+    saved = record(
+        context_id="ctx",
+        output="artifacts",
+        history=[a2a_types.Message(role="user", messageId="m-1", parts=[a2a_types.TextPart(text="sherlock")])],
+        push_config=a2a_types.PushNotificationConfig(url="https://hooks.example.com/a2a", token="secret"),
+    )
+    make_store().save(saved)
+
+    loaded = make_store().get("task-1")
+    assert loaded is not None and loaded is not saved
+    assert loaded.document == "sherlock" and loaded.section_start == 120
+    assert loaded.context_id == "ctx" and loaded.output == "artifacts"
+    assert loaded.history == saved.history
+    assert loaded.push_config == saved.push_config
+    assert [status.state for status in loaded.transitions] == [a2a_types.TaskState.working]
+
+
+def test_get_unknown_task(make_store):
+    assert make_store().get("missing") is None
+
+
+def test_cursor_flush_is_visible_to_another_store(make_store):
+    writer = make_store(flush_ms=20)
+    saved = writer.save(record())
+    writer.advance(saved, 7)
+
+    reader = make_store()
+    # Buffered until the flusher runs
+    assert wait_for(lambda: reader.client.hget("streaming-agent:task:task-1", "cursor") == b"7")
+    assert make_store().get("task-1").cursor == 7
+
+
+def test_finish_writes_state_and_cursor_at_once(make_store):
+    writer = make_store(flush_ms=60_000)
+    saved = writer.save(record())
+    writer.advance(saved, 3)
+    writer.finish(saved, a2a_types.TaskState.completed)
+
+    loaded = make_store().get("task-1")
+    assert loaded.cursor == 3
+    assert loaded.state == a2a_types.TaskState.completed
+
+
+def test_records_expire_after_ttl(make_store):
+    make_store(ttl=1).save(record())
+    assert make_store().get("task-1") is not None
+    time.sleep(1.1)
+    assert make_store().get("task-1") is None
+
+
+def test_cancel_reaches_the_store_streaming_the_task(make_store):
+    streaming = make_store()
+    saved = streaming.save(record())
+    other = make_store()
+
+    assert other.request_cancel("task-1")
+    assert wait_for(lambda: saved.cancel_requested)
+
+
+def test_get_sees_what_another_store_changed(make_store):
+    streaming = make_store(flush_ms=60_000)
+    held = streaming.save(record())
+    streaming.advance(held, 9)
+
+    other = make_store()
+    remote = other.get("task-1")
+    remote.push_config = a2a_types.PushNotificationConfig(url="https://hooks.example.com/a2a")
+    other.finish(remote, a2a_types.TaskState.canceled)
+
+    loaded = streaming.get("task-1")
+    assert loaded is held
+    assert loaded.state == a2a_types.TaskState.canceled and loaded.cancel_requested
+    assert loaded.push_config == remote.push_config
+    # The cursor this store has not flushed yet is kept
+    assert loaded.cursor == 9
+
+
+def test_starts_without_redis():
+    store = RedisTaskStore.from_url("redis://127.0.0.1:1/0", flush_ms=20)
+    store.start()
+    store.close()
+
+
+def test_cancel_unknown_task(make_store):
+    assert not make_store().request_cancel("missing")
+
+
+@pytest.mark.anyio
+async def test_awaitable_methods(make_store):
+    store = make_store()
+    saved = await store.asave(record(state=a2a_types.TaskState.submitted))
+    await store.atransition(saved, a2a_types.TaskState.working)
+    await store.aadd_artifact(saved, a2a_types.Artifact(parts=[a2a_types.TextPart(text="line")], index=0))
+    await store.afinish(saved, a2a_types.TaskState.completed)
+
+    loaded = await make_store().aget("task-1")
+    assert [status.state for status in loaded.transitions] == [
+        a2a_types.TaskState.submitted, a2a_types.TaskState.working, a2a_types.TaskState.completed,
+    ]
+    assert loaded.artifacts[0].parts[0].text == "line"
+    assert await make_store().arequest_cancel("task-1")
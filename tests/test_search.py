@@ -0,0 +1,55 @@
+import json
+import threading
+import pytest
+from a2a_parts import frame_cache
+from a2a_parts.handle_messaging import search_stream
+from utils import search_index
+
+
+def segment_texts(segment) -> list[str]:
+    texts = []
+    for frame in frame_cache.stream_frames(segment.key, segment.event, segment.frames):
+        data = json.loads(frame.split(b"data: ", 1)[1])
+        texts.append(data["result"]["parts"][0]["text"])
+    return texts
+
+
+def test_heading_quotes_each_query_as_written():
+    first, second = search_stream("Holmes Watson"), search_stream("holmes, watson!")
+    [first_meta, first_results] = first.segments
+    [second_meta, second_results] = second.segments
+
+    assert first_results.key == second_results.key
+    assert segment_texts(first_meta)[0].endswith('passages for "Holmes Watson"')
+    assert segment_texts(second_meta)[0].endswith('passages for "holmes, watson!"')
+    assert segment_texts(first_results) == segment_texts(second_results)
+
+
+def search_request(text: str) -> dict:
+    return {
+        "jsonrpc": "2.0", "id": 5, "method": "message/stream",
+        "params": {"message": {"role": "user", "messageId": "m", "parts": [{"kind": "text", "text": text}]}},
+    }
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("text", ["search:", "find ?!", "search   "])
+async def test_query_without_words_is_invalid(client, text):
+    error = (await client.post("/", json=search_request(text))).json()["error"]
+    assert error["code"] == -32602
+    assert "query" in error["data"]
+
+
+@pytest.mark.anyio
+async def test_ranking_runs_off_the_event_loop(client, monkeypatch):
+    threads = []
+    search = search_index.SearchIndex.search
+
+    def record_thread(self, query, *args, **kwargs):
+        threads.append(threading.current_thread())
+        return search(self, query, *args, **kwargs)
+
+    monkeypatch.setattr(search_index.SearchIndex, "search", record_thread)
+    response = await client.post("/", json=search_request("search: all warfare is based on deception"))
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert threads and threading.main_thread() not in threads
@@ -0,0 +1,86 @@
+import pytest
+import a2a.types as a2a_types
+from a2a_parts.broadcast import InvalidSelection
+# Importing handle_messaging also registers the skill handlers
+from a2a_parts.handle_messaging import art_of_war_reference
+from a2a_parts.skills import UnknownSkill, skills
+
+
+def route(text: str | None = None, **data):
+    parts = []
+    if text is not None:
+        parts.append(a2a_types.TextPart(text=text))
+    if data:
+        parts.append(a2a_types.DataPart(data=data))
+    return skills.route(parts)
+
+
+@pytest.mark.parametrize("text, skill", [
+    ("Stream me a chapter of the bible", "stream_bible"),
+    ("Give me a scene from Romeo and Juliet", "stream_romeo_and_juliet"),
+    ("juliet", "stream_romeo_and_juliet"),
+    ("art of war chapter 3 verses 5-8", "stream_art_of_war"),
+    ("what did Sun-Tzu say", "stream_art_of_war"),
+    ("Tell me about Sherlock", "stream_sherlock"),
+    ("Tell me a story", "stream_sherlock"),
+    ("", "stream_sherlock"),
+    ("search: all warfare is based on deception", "search_documents"),
+    ("Find the speckled band", "search_documents"),
+    # What follows the search verb is its query, even a document's name
+    ("find me a bible chapter", "search_documents"),
+    ("search romeo", "search_documents"),
+    ("search: holmes", "search_documents"),
+    ("search:", "search_documents"),
+    # The search verb only counts at the start
+    ("I can't find anything", "stream_sherlock"),
+    # The first-registered document wins
+    ("holmes reads the bible", "stream_bible"),
+    # Tags are whole words
+    ("two bibles", "stream_sherlock"),
+    ("Romeo's letter", "stream_romeo_and_juliet"),
+])
+def test_text_routes(text, skill):
+    assert route(text).skill.id == skill
+
+
+def test_search_remainder_is_the_query():
+    assert route("search:  speckled band").remainder == "speckled band"
+
+
+def test_data_part_names_the_skill():
+    routed = route("bible", skill="search", query="bible")
+    assert routed.skill.id == "search_documents"
+    assert routed.data["query"] == "bible"
+    assert route(skill="stream_art_of_war", chapter=3).skill.id == "stream_art_of_war"
+
+
+def test_unknown_skill():
+    with pytest.raises(UnknownSkill):
+        route(skill="stream_moby_dick")
+
+
+@pytest.mark.parametrize("text, data, reference", [
+    ("art of war chapter 3 verses 5-8", {}, (3, (5, 8))),
+    ("art of war chapter iii verse 5", {}, (3, (5, 5))),
+    ("art of war chapter xiv", {}, (14, None)),
+    # Not a roman numeral, so no chapter was asked for
+    ("art of war chapter civil", {}, (None, None)),
+    ("art of war", {"chapter": 3, "verses": [5, 8]}, (3, (5, 8))),
+    ("art of war", {"chapter": "iv", "verses": "2"}, (4, (2, 2))),
+])
+def test_art_of_war_reference(text, data, reference):
+    assert art_of_war_reference(route(text, **data)) == reference
+
+
+@pytest.mark.parametrize("data", [
+    {"chapter": True},
+    {"chapter": 3.5},
+    {"chapter": "iiii"},
+    {"chapter": [3]},
+    {"chapter": 3, "verses": [True, 2]},
+    {"chapter": 3, "verses": [1, 2, 3]},
+    {"chapter": 3, "verses": {"first": 1}},
+])
+def test_art_of_war_reference_rejects_other_types(data):
+    with pytest.raises(InvalidSelection):
+        art_of_war_reference(route("art of war", **data))
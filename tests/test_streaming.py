@@ -0,0 +1,98 @@
+import asyncio
+import pytest
+from tests.sse import parse_frames, texts
+
+pytestmark = pytest.mark.anyio
+
+
+def rpc(method: str, params: dict, request_id=1) -> dict:
+    return {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}
+
+
+def stream_request(text: str, task_id: str, **metadata) -> dict:
+    return rpc("message/stream", {
+        "message": {"role": "user", "messageId": "m-1", "taskId": task_id, "parts": [{"kind": "text", "text": text}]},
+        "metadata": metadata or None,
+    })
+
+
+async def stream(client, body: dict, last_event_id: str | None = None) -> list[dict]:
+    headers = {"Last-Event-ID": last_event_id} if last_event_id else {}
+    response = await client.post("/", json=body, headers=headers)
+    assert response.headers["content-type"].startswith("text/event-stream")
+    return parse_frames(response.content)
+
+
+async def test_last_event_id_resumes_after_the_frame_received(client):
+    full = await stream(client, stream_request("romeo", "resume-rj"))
+    assert [frame["id"] for frame in full] == [f"resume-rj:{seq}" for seq in range(len(full))]
+
+    resumed = await stream(client, stream_request("romeo", "resume-rj"), "resume-rj:4")
+    assert [frame["id"] for frame in resumed] == [frame["id"] for frame in full[5:]]
+    assert texts(resumed) == texts(full[5:])
+
+
+async def test_resumed_stream_keeps_its_byte_limit(client):
+    full = await stream(client, stream_request("holmes", "resume-sherlock"))
+    resumed = await stream(client, stream_request("holmes", "resume-sherlock"), "resume-sherlock:10")
+    assert resumed[-1]["id"] == full[-1]["id"]
+    assert texts(resumed) == texts(full[11:])
+
+
+async def test_resubscribe_resumes_from_last_event_id(client):
+    full = await stream(client, stream_request("art of war chapter 1", "resume-resubscribe"))
+    request = rpc("tasks/resubscribe", {"id": "resume-resubscribe"})
+
+    resumed = await stream(client, request, "resume-resubscribe:2")
+    assert texts(resumed) == texts(full[3:])
+    # An id from another task is ignored: the stream continues from where the
+    # task got to, which for a finished one is its end
+    assert await stream(client, request, "another-task:2") == []
+
+
+async def test_resume_artifact_output(client):
+    full = await stream(client, stream_request("romeo", "resume-artifact", output="artifacts"))
+    assert full[0]["data"]["result"]["status"]["state"] == "working"
+    assert full[-1]["data"]["result"]["status"]["state"] == "completed"
+    chunks = [frame["data"]["result"]["artifact"] for frame in full[1:-1]]
+    assert chunks[0]["append"] is False and chunks[-1]["lastChunk"] is True
+    assert all(chunk["append"] for chunk in chunks[1:])
+
+    resumed = await stream(client, stream_request("romeo", "resume-artifact", output="artifacts"), "resume-artifact:6")
+    assert [frame["id"] for frame in resumed] == [frame["id"] for frame in full[7:]]
+    assert texts(resumed) == texts(full[7:])
+
+
+async def test_cancel_mid_stream(client):
+    frames = []
+
+    async def read():
+        body = stream_request("holmes", "cancel-mid-stream", pacing={"linesPerSecond": 50})
+        frames.extend(await stream(client, body))
+
+    async def cancel():
+        await asyncio.sleep(0.3)
+        return (await client.post("/", json=rpc("tasks/cancel", {"id": "cancel-mid-stream"}))).json()
+
+    _, canceled = await asyncio.gather(read(), cancel())
+    assert canceled["result"]["status"]["state"] == "canceled"
+
+    last = frames[-1]
+    assert last["event"] == "statusUpdate"
+    assert last["data"]["result"]["status"]["state"] == "canceled"
+    assert last["data"]["result"]["final"] is True
+    # Paced at 50 lines a second, a chapter takes far longer than the cancel
+    assert 1 < len(frames) < 100
+    assert [frame["id"] for frame in frames] == [f"cancel-mid-stream:{seq}" for seq in range(len(frames))]
+
+    task = (await client.post("/", json=rpc("tasks/get", {"id": "cancel-mid-stream"}))).json()["result"]
+    assert task["status"]["state"] == "canceled"
+    assert [step["state"] for step in task["metadata"]["stateTransitions"]] == ["working", "canceled"]
+
+    again = (await client.post("/", json=rpc("tasks/cancel", {"id": "cancel-mid-stream"}))).json()
+    assert again["error"]["code"] == -32002
+
+
+async def test_cancel_unknown_task(client):
+    response = (await client.post("/", json=rpc("tasks/cancel", {"id": "no-such-task"}))).json()
+    assert response["error"]["code"] == -32001
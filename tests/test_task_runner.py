@@ -0,0 +1,15 @@
+from a2a_parts.streaming import Segment
+from a2a_parts.task_runner import segment_text
+from a2a_parts.task_store import TaskRecord
+
+
+def test_byte_budget_counts_utf8_bytes():
+    # Curly quotes are three bytes each in UTF-8
+    lines = ["“Seven!”\n", "I answered.\n"]
+    segment = Segment(("test", "budget"), "storyLine", lambda: iter(lines))
+    record = TaskRecord(id="budget", document="sherlock", section_kind="chapter", section_start=0)
+
+    # Nine characters, but thirteen bytes
+    assert segment_text(segment, 13, record) == ("“Seven!”", 13)
+    assert segment_text(segment, 12, record) == ("", 0)
+    assert segment_text(segment, None, record) == ("“Seven!”\nI answered.", 25)
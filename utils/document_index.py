@@ -0,0 +1,505 @@
+import bisect
+import json
+import mmap
+import os
+import re
+import threading
+from array import array
+from dataclasses import dataclass, field
+from collections.abc import Sequence
+from typing import Any, Callable, Iterator
+from utils.log import get_logger
+from utils.packfile import Pack, PackFormatError, write_pack
+
+DOCUMENTS_DIR = os.getenv("DOCUMENTS_DIR", "documents")
+# Compiled corpus written by `python -m utils.document_index`, mapped instead of parsing the text files
+CORPUS_PATH = os.getenv("CORPUS_PATH", os.path.join(DOCUMENTS_DIR, "corpus.pack"))
+
+log = get_logger("document_index")
+
+SHERLOCK_CHAPTER_TITLES = [
+    "I. A SCANDAL IN BOHEMIA",
+    "II. THE RED-HEADED LEAGUE",
+    "III. A CASE OF IDENTITY",
+    "IV. THE BOSCOMBE VALLEY MYSTERY",
+    "V. THE FIVE ORANGE PIPS",
+    "VI. THE MAN WITH THE TWISTED LIP",
+    "VII. THE ADVENTURE OF THE BLUE CARBUNCLE",
+    "VIII. THE ADVENTURE OF THE SPECKLED BAND",
+    "IX. THE ADVENTURE OF THE ENGINEER’S THUMB",
+    "X. THE ADVENTURE OF THE NOBLE BACHELOR",
+    "XI. THE ADVENTURE OF THE BERYL CORONET",
+    "XII. THE ADVENTURE OF THE COPPER BEECHES",
+]
+
+GUTENBERG_END_MARKER = "*** END OF THE PROJECT GUTENBERG"
+
+ROMAN_HEADING = re.compile(r"^([IVXLC]+)\. (\S.*)$")
+NUMBERED_PARAGRAPH = re.compile(r"^(\d+(?:,\d+)*)\. ")
+CHAPTER_VERSE = re.compile(r"^(\d+):(\d+)\s")
+
+
+@dataclass(slots=True)
+class Section:
+    '''
+    A contiguous byte range [start, end) of a document.
+    `start` points at the first body line, after the heading.
+    '''
+    kind: str
+    title: str
+    start: int
+    end: int
+    number: int | None = None
+    parent: str | None = None
+
+
+class PackedSections(Sequence[Section]):
+    '''
+    A section table read straight from a corpus pack; Sections are built on access
+    '''
+
+    def __init__(self, kind: str, pack: Pack, prefix: str):
+        self.kind = kind
+        self.starts = pack.blob(f"{prefix}.start")
+        self.ends = pack.blob(f"{prefix}.end")
+        self.numbers = pack.blob(f"{prefix}.number")
+        self.titles = pack.blob(f"{prefix}.title")
+        self.title_offsets = pack.blob(f"{prefix}.title_offsets")
+        self.parents = pack.blob(f"{prefix}.parent")
+        self.parent_offsets = pack.blob(f"{prefix}.parent_offsets")
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+
+        parent = bytes(self.parents[self.parent_offsets[i]:self.parent_offsets[i + 1]]).decode()
+        return Section(
+            self.kind,
+            bytes(self.titles[self.title_offsets[i]:self.title_offsets[i + 1]]).decode(),
+            self.starts[i],
+            self.ends[i],
+            number=None if self.numbers[i] < 0 else self.numbers[i],
+            parent=parent or None,
+        )
+
+
+@dataclass
+class DocumentIndex:
+    name: str
+    path: str
+    size: int
+    sections: dict[str, Sequence[Section]] = field(default_factory=dict)
+    buffer: mmap.mmap | memoryview | None = None
+    starts: dict[str, Sequence[int]] = field(default_factory=dict, repr=False)
+    # Only for documents loaded from a corpus pack: where each line starts (plus
+    # the document size), and each stripped line already escaped for a JSON string
+    line_starts: Sequence[int] | None = field(default=None, repr=False)
+    escaped: memoryview | None = field(default=None, repr=False)
+    escaped_offsets: Sequence[int] | None = field(default=None, repr=False)
+
+    def of_kind(self, kind: str) -> Sequence[Section]:
+        return self.sections.get(kind, [])
+
+    def section_starts(self, kind: str) -> Sequence[int]:
+        if kind not in self.starts:
+            self.starts[kind] = [section.start for section in self.of_kind(kind)]
+        return self.starts[kind]
+
+    def within(self, kind: str, outer: Section) -> list[Section]:
+        '''
+        Sections of `kind` that start inside `outer`, e.g. the verses of a chapter
+        '''
+        sections = self.of_kind(kind)
+        starts = self.section_starts(kind)
+        lo = bisect.bisect_left(starts, outer.start)
+        hi = bisect.bisect_left(starts, outer.end, lo)
+        return sections[lo:hi]
+
+    def find(self, kind: str, start: int) -> Section | None:
+        '''
+        The section of `kind` that starts exactly at `start`
+        '''
+        sections = self.of_kind(kind)
+        i = bisect.bisect_left(self.section_starts(kind), start)
+        if i < len(sections) and sections[i].start == start:
+            return sections[i]
+        return None
+
+    def enclosing(self, kind: str, offset: int) -> Section | None:
+        '''
+        The section of `kind` that contains `offset`, e.g. the chapter of a verse
+        '''
+        sections = self.of_kind(kind)
+        i = bisect.bisect_right(self.section_starts(kind), offset) - 1
+        if i >= 0 and offset < sections[i].end:
+            return sections[i]
+        return None
+
+    def read(self, section: Section) -> bytes:
+        if self.buffer is not None:
+            return bytes(self.buffer[section.start:section.end])
+
+        with open(self.path, "rb") as f:
+            f.seek(section.start)
+            return f.read(section.end - section.start)
+
+    def iter_lines(self, section: Section) -> Iterator[str]:
+        yield from self.read(section).decode("utf-8").splitlines()
+
+    def iter_escaped(self, section: Section) -> Iterator[bytes]:
+        '''
+        The section's lines, stripped and JSON-escaped, as stored in the corpus pack
+        '''
+        lo = bisect.bisect_left(self.line_starts, section.start)
+        hi = bisect.bisect_left(self.line_starts, section.end, lo)
+        offsets = self.escaped_offsets
+        for i in range(lo, min(hi, len(offsets) - 1)):
+            yield bytes(self.escaped[offsets[i]:offsets[i + 1]])
+
+    def scan_lines(self) -> Iterator[tuple[int, int, str]]:
+        if self.line_starts is None:
+            yield from scan_lines(self.path)
+            return
+
+        for i in range(len(self.line_starts) - 1):
+            start, end = self.line_starts[i], self.line_starts[i + 1]
+            raw = bytes(self.buffer[start:end])
+            yield start, end, raw.decode("utf-8-sig" if start == 0 else "utf-8").strip()
+
+
+def scan_lines(path: str) -> Iterator[tuple[int, int, str]]:
+    '''
+    Yield (start offset, end offset, stripped text) for every line of the file
+    '''
+    offset = 0
+    with open(path, "rb") as f:
+        for raw in f:
+            end = offset + len(raw)
+            yield offset, end, raw.decode("utf-8-sig" if offset == 0 else "utf-8").strip()
+            offset = end
+
+
+def close_sections(sections: list[Section], end: int):
+    if sections and sections[-1].end == -1:
+        sections[-1].end = end
+
+
+def index_sherlock(path: str) -> dict[str, list[Section]]:
+    titles = {title: number for number, title in enumerate(SHERLOCK_CHAPTER_TITLES, start=1)}
+    chapters: list[Section] = []
+
+    for start, end, text in scan_lines(path):
+        upper = text.upper()
+        if upper in titles:
+            close_sections(chapters, start)
+            chapters.append(Section("chapter", text.title(), end, -1, number=titles[upper]))
+        elif chapters and text.startswith(GUTENBERG_END_MARKER):
+            close_sections(chapters, start)
+            break
+
+    close_sections(chapters, os.path.getsize(path))
+    return {"chapter": chapters}
+
+
+def index_romeo_and_juliet(path: str) -> dict[str, list[Section]]:
+    acts: list[Section] = []
+    scenes: list[Section] = []
+
+    for start, end, text in scan_lines(path):
+        upper = text.upper()
+        if upper.startswith("ACT "):
+            close_sections(scenes, start)
+            close_sections(acts, start)
+            acts.append(Section("act", text.title(), end, -1, number=len(acts) + 1))
+        elif upper.startswith("SCENE "):
+            close_sections(scenes, start)
+            act = acts[-1].title if acts else None
+            scenes.append(Section("scene", text.title(), end, -1, number=len(scenes) + 1, parent=act))
+
+    size = os.path.getsize(path)
+    close_sections(scenes, size)
+    close_sections(acts, size)
+    return {"act": acts, "scene": scenes}
+
+
+def index_art_of_war(path: str) -> dict[str, list[Section]]:
+    chapters: list[Section] = []
+    verses: list[Section] = []
+
+    for start, end, text in scan_lines(path):
+        if text == "THE END":
+            close_sections(verses, start)
+            close_sections(chapters, start)
+            break
+
+        heading = ROMAN_HEADING.match(text)
+        if heading:
+            close_sections(verses, start)
+            close_sections(chapters, start)
+            chapters.append(Section("chapter", text, end, -1, number=len(chapters) + 1))
+            continue
+
+        paragraph = NUMBERED_PARAGRAPH.match(text)
+        if chapters and paragraph:
+            close_sections(verses, start)
+            numbers = paragraph.group(1)
+            verses.append(Section(
+                "verse",
+                numbers,
+                start,
+                -1,
+                number=int(numbers.split(",")[0]),
+                parent=chapters[-1].title,
+            ))
+
+    size = os.path.getsize(path)
+    close_sections(verses, size)
+    close_sections(chapters, size)
+    return {"chapter": chapters, "verse": verses}
+
+
+def index_bible(path: str) -> dict[str, list[Section]]:
+    '''
+    Verses are lines starting with `chapter:verse`. A `1:1` verse opens a new
+    book, titled by the last heading that followed a blank line.
+    '''
+    books: list[Section] = []
+    chapters: list[Section] = []
+    verses: list[Section] = []
+    heading = None
+    previous_blank = True
+    final = os.path.getsize(path)
+
+    for start, end, text in scan_lines(path):
+        if text.startswith(GUTENBERG_END_MARKER):
+            final = start
+            break
+
+        match = CHAPTER_VERSE.match(text)
+        if not match:
+            if text and previous_blank:
+                # A paragraph after a blank line is a heading, not part of the last verse
+                close_sections(verses, start)
+                heading = text
+            previous_blank = not text
+            continue
+
+        chapter, verse = int(match.group(1)), int(match.group(2))
+        close_sections(verses, start)
+
+        if verse == 1:
+            close_sections(chapters, start)
+            if chapter == 1:
+                close_sections(books, start)
+                title = heading or f"Book {len(books) + 1}"
+                books.append(Section("book", title, start, -1, number=len(books) + 1))
+            book = books[-1].title if books else None
+            chapters.append(Section("chapter", f"{book} {chapter}", start, -1, number=chapter, parent=book))
+
+        parent = chapters[-1].title if chapters else None
+        verses.append(Section("verse", f"{chapter}:{verse}", start, -1, number=verse, parent=parent))
+        heading = None
+        previous_blank = False
+
+    close_sections(verses, final)
+    close_sections(chapters, final)
+    close_sections(books, final)
+    return {"book": books, "chapter": chapters, "verse": verses}
+
+
+DOCUMENTS: dict[str, tuple[str, Callable[[str], dict[str, list[Section]]]]] = {
+    "sherlock": ("the-adventures-of-sherlock-holmes.txt", index_sherlock),
+    "romeo_and_juliet": ("romeo-and-juliet.txt", index_romeo_and_juliet),
+    "art_of_war": ("the-art-of-war.txt", index_art_of_war),
+    "bible": ("bible.txt", index_bible),
+}
+
+_indexes: dict[str, DocumentIndex] = {}
+_lock = threading.Lock()
+_corpus: Pack | None = None
+_corpus_opened = False
+
+
+def document_path(name: str) -> str:
+    return os.path.join(DOCUMENTS_DIR, DOCUMENTS[name][0])
+
+
+def open_corpus() -> Pack | None:
+    '''
+    The compiled corpus at CORPUS_PATH, mapped once per process, or None
+    '''
+    global _corpus, _corpus_opened
+    if not _corpus_opened:
+        _corpus_opened = True
+        if os.path.exists(CORPUS_PATH):
+            try:
+                _corpus = Pack(CORPUS_PATH)
+            except (PackFormatError, KeyError, ValueError) as e:
+                log.warning("corpus_unreadable", extra={"path": CORPUS_PATH, "error": str(e)})
+    return _corpus
+
+
+def packed_entry(name: str) -> dict[str, Any] | None:
+    '''
+    The corpus pack's entry for a document, unless its text file has changed since.
+    A pack can stand in for text files that aren't deployed at all.
+    '''
+    corpus = open_corpus()
+    entry = corpus.meta["documents"].get(name) if corpus is not None else None
+    if entry is None:
+        return None
+
+    path = document_path(name)
+    if os.path.exists(path):
+        stat = os.stat(path)
+        if [stat.st_size, stat.st_mtime_ns] != entry["stamp"]:
+            return None
+    return entry
+
+
+def source_stamp(name: str) -> list[int]:
+    '''
+    Size and mtime of a document's text, for telling whether derived data is stale
+    '''
+    path = document_path(name)
+    if os.path.exists(path):
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+    return packed_entry(name)["stamp"]
+
+
+def available_documents() -> list[str]:
+    return [name for name in DOCUMENTS if os.path.exists(document_path(name)) or packed_entry(name) is not None]
+
+
+def map_file(path: str) -> mmap.mmap | None:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def load_packed_index(name: str, entry: dict[str, Any]) -> DocumentIndex:
+    corpus = open_corpus()
+    sections = {kind: PackedSections(kind, corpus, f"{name}.{kind}") for kind in entry["kinds"]}
+    return DocumentIndex(
+        name=name,
+        path=document_path(name),
+        size=entry["stamp"][0],
+        sections=sections,
+        buffer=corpus.blob(f"{name}.text"),
+        starts={kind: table.starts for kind, table in sections.items()},
+        line_starts=corpus.blob(f"{name}.lines"),
+        escaped=corpus.blob(f"{name}.escaped"),
+        escaped_offsets=corpus.blob(f"{name}.escaped_offsets"),
+    )
+
+
+def build_index(name: str) -> DocumentIndex:
+    entry = packed_entry(name)
+    if entry is not None:
+        return load_packed_index(name, entry)
+
+    filename, builder = DOCUMENTS[name]
+    path = os.path.join(DOCUMENTS_DIR, filename)
+    return DocumentIndex(
+        name=name,
+        path=path,
+        size=os.path.getsize(path),
+        sections=builder(path),
+        buffer=map_file(path),
+    )
+
+
+def get_index(name: str) -> DocumentIndex:
+    '''
+    Return the index for a document, building it on first use.
+    Raises FileNotFoundError if the document is not present.
+    '''
+    index = _indexes.get(name)
+    if index is not None:
+        return index
+
+    with _lock:
+        if name not in _indexes:
+            _indexes[name] = build_index(name)
+        return _indexes[name]
+
+
+def build_all():
+    '''
+    Build every index whose document is present, e.g. at startup
+    '''
+    for name in available_documents():
+        get_index(name)
+
+
+def pack_strings(strings: list[str]) -> tuple[bytes, array]:
+    offsets = array("I", [0])
+    encoded = bytearray()
+    for string in strings:
+        encoded += string.encode()
+        offsets.append(len(encoded))
+    return bytes(encoded), offsets
+
+
+def compile_document(name: str) -> tuple[dict[str, Any], dict[str, array | bytes]]:
+    '''
+    The pack entry and blobs for one document's text file: the raw text, the
+    line offsets, each line stripped and JSON-escaped, and every section table
+    '''
+    filename, builder = DOCUMENTS[name]
+    path = os.path.join(DOCUMENTS_DIR, filename)
+    line_starts = array("I")
+    escaped = []
+    for start, _, text in scan_lines(path):
+        line_starts.append(start)
+        escaped.append(json.dumps(text, ensure_ascii=False)[1:-1])
+    line_starts.append(os.path.getsize(path))
+    escaped_text, escaped_offsets = pack_strings(escaped)
+
+    with open(path, "rb") as f:
+        blobs: dict[str, array | bytes] = {
+            f"{name}.text": f.read(),
+            f"{name}.lines": line_starts,
+            f"{name}.escaped": escaped_text,
+            f"{name}.escaped_offsets": escaped_offsets,
+        }
+
+    sections = builder(path)
+    for kind, table in sections.items():
+        prefix = f"{name}.{kind}"
+        blobs[f"{prefix}.start"] = array("I", (section.start for section in table))
+        blobs[f"{prefix}.end"] = array("I", (section.end for section in table))
+        blobs[f"{prefix}.number"] = array("i", (-1 if section.number is None else section.number for section in table))
+        blobs[f"{prefix}.title"], blobs[f"{prefix}.title_offsets"] = pack_strings([section.title for section in table])
+        blobs[f"{prefix}.parent"], blobs[f"{prefix}.parent_offsets"] = pack_strings([section.parent or "" for section in table])
+
+    stat = os.stat(path)
+    return {"stamp": [stat.st_size, stat.st_mtime_ns], "kinds": list(sections)}, blobs
+
+
+def compile_corpus(path: str = CORPUS_PATH) -> list[str]:
+    '''
+    Compile every present text file into one pack at `path`
+    '''
+    entries = {}
+    blobs: dict[str, array | bytes] = {}
+    names = [name for name in DOCUMENTS if os.path.exists(document_path(name))]
+    for name in names:
+        entries[name], document_blobs = compile_document(name)
+        blobs.update(document_blobs)
+    write_pack(path, {"documents": entries}, blobs)
+    return names
+
+
+if __name__ == "__main__":
+    names = compile_corpus()
+    print(f"Wrote {CORPUS_PATH} ({os.path.getsize(CORPUS_PATH)} bytes) from {', '.join(names)}")
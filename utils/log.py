@@ -0,0 +1,86 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" writes one object per line, "text" a line for people to read
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+ROOT_LOGGER = "streaming_agent"
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "exception"}
+
+
+def fields(record: logging.LogRecord) -> dict:
+    '''
+    What was passed as `extra=` when logging
+    '''
+    return {key: value for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES}
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+            **fields(record),
+        }
+        if getattr(record, "exception", None):
+            entry["exception"] = record.exception
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = " ".join(
+            [self.formatTime(record), record.levelname, record.name, record.getMessage()]
+            + [f"{key}={value}" for key, value in fields(record).items()]
+        )
+        if getattr(record, "exception", None):
+            line += "\n" + record.exception
+        return line
+
+
+class DeferredHandler(logging.handlers.QueueHandler):
+    '''
+    Hands records to the listener thread, which does the formatting and the
+    blocking write, so logging on the request path is just a queue put
+    '''
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exception = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup() -> logging.Logger:
+    records = queue.SimpleQueue()
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JSONFormatter())
+    listener = logging.handlers.QueueListener(records, output)
+
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(DeferredHandler(records))
+    logger.propagate = False
+
+    listener.start()
+    atexit.register(listener.stop)
+    return logger
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+setup()
@@ -0,0 +1,243 @@
+import bisect
+import math
+import threading
+from typing import Callable, Iterable
+import anyio.to_thread
+
+# Seconds, from sub-millisecond frame renders to multi-minute streams
+TIME_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+SIZE_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+class Metric:
+    '''
+    Values are kept per thread: a thread only ever writes its own shard, so
+    recording takes no lock, and a scrape adds the shards up. Copying a
+    shard is a single dict operation, atomic under the GIL.
+    '''
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._local = threading.local()
+        self._shards: list[dict] = []
+        self._shards_lock = threading.Lock()
+        registry.append(self)
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._shards_lock:
+                self._shards.append(values)
+            return values
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _snapshots(self) -> list[dict]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        return [shard.copy() for shard in shards]
+
+    def _label_text(self, key: tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{label}="{escape(value)}"' for label, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    '''
+    A monotonically increasing count, optionally split by label values
+    '''
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: str):
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        key = self._key(labels)
+        return sum(shard.get(key, 0) for shard in self._snapshots())
+
+    def items(self) -> list[tuple[tuple[str, ...], float]]:
+        totals: dict[tuple[str, ...], float] = {}
+        for shard in self._snapshots():
+            for key, value in shard.items():
+                totals[key] = totals.get(key, 0) + value
+        return list(totals.items())
+
+    def samples(self) -> Iterable[str]:
+        for key, value in sorted(self.items()):
+            yield f"{self.name}{self._label_text(key)} {format_value(value)}"
+
+
+class Histogram(Metric):
+    '''
+    Observations counted into cumulative `le` buckets, with their sum and count
+    '''
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: tuple[float, ...], labels: tuple[str, ...] = ()):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, description, labels)
+
+    def observe(self, value: float, **labels: str):
+        shard = self._shard()
+        key = self._key(labels)
+        # One slot per bucket, one for +Inf, then the sum
+        counts = shard.get(key)
+        if counts is None:
+            counts = shard[key] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def totals(self) -> dict[tuple[str, ...], list[float]]:
+        totals: dict[tuple[str, ...], list[float]] = {}
+        for shard in self._snapshots():
+            for key, counts in shard.items():
+                total = totals.setdefault(key, [0] * (len(self.buckets) + 2))
+                for i, count in enumerate(list(counts)):
+                    total[i] += count
+        return totals
+
+    def count(self, **labels: str) -> int:
+        counts = self.totals().get(self._key(labels))
+        return int(sum(counts[:-1])) if counts else 0
+
+    def samples(self) -> Iterable[str]:
+        for key, counts in sorted(self.totals().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else format_value(bound)
+                labels = self._label_text(key, f'le="{le}"')
+                yield f"{self.name}_bucket{labels} {format_value(cumulative)}"
+            yield f"{self.name}_sum{self._label_text(key)} {format_value(counts[-1])}"
+            yield f"{self.name}_count{self._label_text(key)} {format_value(cumulative)}"
+
+
+class Gauge(Metric):
+    '''
+    A value read when metrics are scraped
+    '''
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, read: Callable[[], float | None]):
+        self.read = read
+        super().__init__(name, description)
+
+    def samples(self) -> Iterable[str]:
+        value = self.read()
+        if value is not None:
+            yield f"{self.name} {format_value(value)}"
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def threadpool_statistics():
+    # Only answerable from the event loop, which is where /metrics is served
+    try:
+        return anyio.to_thread.current_default_thread_limiter().statistics()
+    except RuntimeError:
+        return None
+
+
+def render() -> str:
+    '''
+    Every metric in the Prometheus text exposition format
+    '''
+    return "\n".join(metric.render() for metric in registry) + "\n"
+
+
+registry: list[Metric] = []
+
+rpc_requests = Counter(
+    "rpc_requests_total",
+    "JSON-RPC requests by method",
+    labels=("method",),
+)
+skill_routes = Counter(
+    "skill_routes_total",
+    "Messages by the skill they were routed to",
+    labels=("skill",),
+)
+streams_ended = Counter(
+    "streams_ended_total",
+    "SSE streams by how they ended: completed, disconnected or stalled",
+    labels=("outcome",),
+)
+stream_first_chunk_seconds = Histogram(
+    "stream_first_chunk_seconds",
+    "Time from starting an SSE response to writing its first chunk",
+    TIME_BUCKETS,
+)
+stream_duration_seconds = Histogram(
+    "stream_duration_seconds",
+    "How long SSE streams ran, by how they ended",
+    TIME_BUCKETS,
+    labels=("outcome",),
+)
+stream_bytes = Histogram(
+    "stream_bytes",
+    "Bytes written per SSE stream",
+    SIZE_BUCKETS,
+)
+stream_events = Histogram(
+    "stream_events",
+    "Events written per SSE stream",
+    SIZE_BUCKETS,
+)
+frame_render_seconds = Histogram(
+    "frame_render_seconds",
+    "Time to serialize one SSE frame, by how it was rendered",
+    TIME_BUCKETS,
+    labels=("method",),
+)
+admission_rejected = Counter(
+    "admission_rejected_total",
+    "Streams refused for being over a concurrency limit, by limit: global, token or ip",
+    labels=("limit",),
+)
+admission_unavailable = Counter(
+    "admission_unavailable_total",
+    "Streams admitted without being counted because the limiter's store could not be reached",
+)
+broadcast_fallbacks = Counter(
+    "broadcast_fallbacks_total",
+    "Broadcast subscribers that found their frames overwritten and encoded the section themselves",
+)
+push_deliveries = Counter(
+    "push_deliveries_total",
+    "Webhook calls pushing task updates, by outcome: delivered, retried, rejected, failed or blocked",
+    labels=("outcome",),
+)
+threadpool_waiting = Gauge(
+    "threadpool_waiting_tasks",
+    "Calls queued for a worker thread of the default threadpool",
+    lambda: (statistics := threadpool_statistics()) and statistics.tasks_waiting,
+)
+threadpool_busy = Gauge(
+    "threadpool_busy_threads",
+    "Worker threads of the default threadpool currently running a call",
+    lambda: (statistics := threadpool_statistics()) and statistics.borrowed_tokens,
+)
@@ -0,0 +1,86 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Any
+
+MAGIC = b"A2APACK1"
+HEADER_LENGTH = struct.Struct("<I")
+ALIGNMENT = 8
+
+
+class PackFormatError(ValueError):
+    pass
+
+
+def padding(offset: int) -> int:
+    return -offset % ALIGNMENT
+
+
+def write_pack(path: str, meta: dict[str, Any], blobs: dict[str, array | bytes]):
+    '''
+    Write `blobs` (integer arrays or raw bytes) after a JSON header holding `meta`
+    and where each blob sits. Blobs are 8-byte aligned so they can be viewed in
+    place once mapped. The file is replaced atomically.
+    '''
+    layout = {}
+    offset = 0
+    for name, blob in blobs.items():
+        typecode = blob.typecode if isinstance(blob, array) else "B"
+        length = len(blob) * (blob.itemsize if isinstance(blob, array) else 1)
+        layout[name] = {"offset": offset, "length": length, "typecode": typecode}
+        offset += length + padding(length)
+
+    header = json.dumps({"byteorder": sys.byteorder, "meta": meta, "blobs": layout}).encode()
+    data_start = len(MAGIC) + HEADER_LENGTH.size + len(header)
+    data_start += padding(data_start)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + HEADER_LENGTH.pack(len(header)) + header)
+        f.write(b"\0" * (data_start - f.tell()))
+        for name, blob in blobs.items():
+            data = blob.tobytes() if isinstance(blob, array) else blob
+            f.write(data + b"\0" * padding(len(data)))
+        # Offsets in the header are relative to the data start
+        f.write(struct.pack("<Q", data_start))
+    os.replace(tmp_path, path)
+
+
+class Pack:
+    '''
+    A pack file mapped read-only. Blobs are memoryviews into the mapping, so
+    every process that opens the same file shares its pages.
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(self.buffer)
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise PackFormatError(f"{path} is not a pack file")
+        (header_length,) = HEADER_LENGTH.unpack_from(view, len(MAGIC))
+        header_start = len(MAGIC) + HEADER_LENGTH.size
+        header = json.loads(bytes(view[header_start:header_start + header_length]))
+        if header["byteorder"] != sys.byteorder:
+            raise PackFormatError(f"{path} was written on a {header['byteorder']}-endian machine")
+
+        (data_start,) = struct.unpack_from("<Q", view, len(view) - 8)
+        self.meta: dict[str, Any] = header["meta"]
+        self._layout: dict[str, dict[str, Any]] = header["blobs"]
+        self._data = view[data_start:len(view) - 8]
+
+    def __contains__(self, name: str):
+        return name in self._layout
+
+    def blob(self, name: str) -> memoryview:
+        '''
+        The blob as a memoryview of its array type, or of bytes
+        '''
+        entry = self._layout[name]
+        raw = self._data[entry["offset"]:entry["offset"] + entry["length"]]
+        return raw if entry["typecode"] == "B" else raw.cast(entry["typecode"])
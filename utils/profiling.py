@@ -0,0 +1,193 @@
+import contextlib
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Iterable, Iterator
+from uuid import uuid4 as uuid
+from utils.lru import LRUCache
+
+# Off by default; when on, a request opts in with the X-Profile header
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILE_SAMPLE_MS = float(os.getenv("PROFILE_SAMPLE_MS", "5"))
+PROFILES_KEPT = int(os.getenv("PROFILES_KEPT", "100"))
+
+HEADER = "x-profile"
+# What "stacks" profiles sample: stacks aren't tied to a request, so the loop's
+# samples include whatever else it was running
+SAMPLED = (
+    "the event loop thread, shared with every other request it served meanwhile, "
+    "and worker threads while inside one of this request's spans"
+)
+STAGES = ("route", "read", "build", "serialize", "write")
+NO_SPAN = contextlib.nullcontext()
+
+
+class Profile:
+    '''
+    Where one request's time went: total, count and longest span per pipeline
+    stage and, in "stacks" mode, stack samples of the threads serving it
+    '''
+
+    def __init__(self, mode: str):
+        self.id = uuid().hex
+        self.mode = mode
+        self.started = time.perf_counter()
+        self.finished: float | None = None
+        self.stages: dict[str, list[float]] = {}
+        self.samples: Counter[str] = Counter()
+        # Threads currently inside one of this profile's spans, by nesting depth
+        self.threads: dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sampler: threading.Thread | None = None
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            totals = self.stages.setdefault(stage, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+
+    def enter(self, thread: int):
+        with self._lock:
+            self.threads[thread] = self.threads.get(thread, 0) + 1
+
+    def leave(self, thread: int):
+        with self._lock:
+            if self.threads.get(thread, 0) <= 1:
+                self.threads.pop(thread, None)
+            else:
+                self.threads[thread] -= 1
+
+    def start_sampling(self, thread: int):
+        '''
+        Sample `thread` (the event loop's) and any thread inside a span of this profile
+        '''
+        def sample():
+            while not self._stopped.wait(PROFILE_SAMPLE_MS / 1000):
+                frames = sys._current_frames()
+                with self._lock:
+                    threads = {thread, *self.threads}
+                # Walk the stacks outside the lock, count them under it
+                stacks = [collapse(frames[ident]) for ident in threads if ident in frames]
+                with self._lock:
+                    self.samples.update(stacks)
+
+        self._sampler = threading.Thread(target=sample, name=f"profile-{self.id[:8]}", daemon=True)
+        self._sampler.start()
+
+    def finish(self):
+        if self.finished is None:
+            self.finished = time.perf_counter()
+            self._stopped.set()
+
+    def summary(self) -> dict:
+        with self._lock:
+            stages = {
+                stage: {"count": count, "seconds": round(total, 6), "max_seconds": round(longest, 6)}
+                for stage, (count, total, longest) in self.stages.items()
+            }
+            samples = sum(self.samples.values())
+        end = self.finished or time.perf_counter()
+        return {
+            "id": self.id,
+            "mode": self.mode,
+            "complete": self.finished is not None,
+            "seconds": round(end - self.started, 6),
+            "stages": stages,
+            "samples": samples,
+            "scope": SAMPLED if self.mode == "stacks" else "this request's spans",
+        }
+
+    def collapsed(self) -> str:
+        '''
+        Stack samples in the collapsed format flamegraph.pl and speedscope read
+        '''
+        with self._lock:
+            samples = self.samples.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in samples)
+
+
+def collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Span:
+    __slots__ = ("profile", "stage", "started", "thread")
+
+    def __init__(self, profile: Profile, stage: str):
+        self.profile = profile
+        self.stage = stage
+
+    def __enter__(self):
+        self.thread = threading.get_ident()
+        self.profile.enter(self.thread)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.record(self.stage, time.perf_counter() - self.started)
+        self.profile.leave(self.thread)
+
+
+current: ContextVar[Profile | None] = ContextVar("profile", default=None)
+profiles = LRUCache(PROFILES_KEPT)
+
+
+def span(stage: str):
+    '''
+    Time a block as `stage` of the current request's profile. Without
+    profiling this is one flag check and a shared no-op context manager.
+    '''
+    if not PROFILING_ENABLED:
+        return NO_SPAN
+    profile = current.get()
+    return NO_SPAN if profile is None else Span(profile, stage)
+
+
+def timed(stage: str, items: Iterable) -> Iterable:
+    '''
+    Count the time spent producing each item of a lazy iterable as `stage`
+    '''
+    if not PROFILING_ENABLED or current.get() is None:
+        return items
+    return _timed(current.get(), stage, iter(items))
+
+
+def _timed(profile: Profile, stage: str, items: Iterator) -> Iterator:
+    while True:
+        with Span(profile, stage):
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+        yield item
+
+
+def begin(mode: str | None) -> Profile | None:
+    '''
+    Profile the rest of the current request if profiling is enabled and it asked
+    for it: "stacks" also samples stacks, any other value only times stages
+    '''
+    if not PROFILING_ENABLED or not mode:
+        return None
+    profile = Profile("stacks" if mode.strip().lower() == "stacks" else "spans")
+    profiles.put(profile.id, profile)
+    current.set(profile)
+    if profile.mode == "stacks":
+        profile.start_sampling(threading.get_ident())
+    return profile
+
+
+def finish():
+    profile = current.get()
+    if profile is not None:
+        profile.finish()
@@ -0,0 +1,248 @@
+import heapq
+import math
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Any, Iterator, NamedTuple, Sequence
+from utils import document_index
+from utils.log import get_logger
+from utils.packfile import Pack, PackFormatError, write_pack
+
+# Where `python -m utils.search_index` writes the prebuilt index, and where startup looks for it
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", os.path.join(document_index.DOCUMENTS_DIR, "search.idx"))
+SEARCH_RESULTS = int(os.getenv("SEARCH_RESULTS", "10"))
+
+TOKEN = re.compile(r"[a-z0-9]+")
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Term frequencies are stored as uint16
+MAX_TF = 0xFFFF
+
+log = get_logger("search_index")
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN.findall(text.lower())
+
+
+class Hit(NamedTuple):
+    document: str
+    start: int
+    end: int
+    score: float
+
+
+def iter_passages(index: document_index.DocumentIndex) -> Iterator[tuple[int, int, str]]:
+    '''
+    Yield (start, end, text) for every paragraph of a document's body, i.e. every
+    run of non-blank lines between the first section and the end of the last one
+    '''
+    sections = [section for kind in index.sections.values() for section in kind]
+    if not sections:
+        return
+    body_start = min(section.start for section in sections)
+    body_end = max(section.end for section in sections)
+
+    start = end = None
+    lines: list[str] = []
+    for line_start, line_end, text in index.scan_lines():
+        if line_start < body_start:
+            continue
+        if line_start >= body_end:
+            break
+        if text:
+            if start is None:
+                start = line_start
+            end = line_end
+            lines.append(text)
+        elif lines:
+            yield start, end, " ".join(lines)
+            start, lines = None, []
+
+    if lines:
+        yield start, end, " ".join(lines)
+
+
+def source_stamps(names: Sequence[str]) -> dict[str, list[int]]:
+    return {name: document_index.source_stamp(name) for name in names}
+
+
+def available_documents() -> list[str]:
+    return document_index.available_documents()
+
+
+def build(names: Sequence[str] | None = None) -> tuple[dict[str, Any], dict[str, array | bytes]]:
+    '''
+    Index every paragraph of the given documents (all present ones by default).
+    Returns the pack meta and blobs; postings are flat arrays sliced per term.
+    '''
+    names = list(available_documents() if names is None else names)
+    passage_doc = array("H")
+    passage_start = array("I")
+    passage_end = array("I")
+    passage_length = array("I")
+    term_passages: dict[str, array] = {}
+    term_tfs: dict[str, array] = {}
+
+    for doc_id, name in enumerate(names):
+        index = document_index.get_index(name)
+        for start, end, text in iter_passages(index):
+            tokens = tokenize(text)
+            if not tokens:
+                continue
+            passage_id = len(passage_doc)
+            passage_doc.append(doc_id)
+            passage_start.append(start)
+            passage_end.append(end)
+            passage_length.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                if term not in term_passages:
+                    term_passages[term] = array("I")
+                    term_tfs[term] = array("H")
+                term_passages[term].append(passage_id)
+                term_tfs[term].append(min(tf, MAX_TF))
+
+    terms = sorted(term_passages)
+    term_offsets = array("I", [0])
+    postings = array("I")
+    tfs = array("H")
+    for term in terms:
+        postings.extend(term_passages[term])
+        tfs.extend(term_tfs[term])
+        term_offsets.append(len(postings))
+
+    meta = {
+        "documents": names,
+        "sources": source_stamps(names),
+        "average_length": sum(passage_length) / len(passage_length) if passage_length else 0.0,
+    }
+    blobs = {
+        "terms": "\n".join(terms).encode(),
+        "term_offsets": term_offsets,
+        "postings": postings,
+        "tfs": tfs,
+        "passage_doc": passage_doc,
+        "passage_start": passage_start,
+        "passage_end": passage_end,
+        "passage_length": passage_length,
+    }
+    return meta, blobs
+
+
+class SearchIndex:
+    '''
+    BM25 over document paragraphs. The arrays are either built in this process
+    or memoryviews into a mapped pack file; only the term lookup is a dict.
+    '''
+
+    def __init__(self, meta: dict[str, Any], blobs: dict[str, Any]):
+        self.documents: list[str] = meta["documents"]
+        self.sources: dict[str, list[int]] = meta["sources"]
+        self.average_length: float = meta["average_length"] or 1.0
+        terms = bytes(blobs["terms"]).decode()
+        self.terms = {term: i for i, term in enumerate(terms.split("\n"))} if terms else {}
+        self.term_offsets = blobs["term_offsets"]
+        self.postings = blobs["postings"]
+        self.tfs = blobs["tfs"]
+        self.passage_doc = blobs["passage_doc"]
+        self.passage_start = blobs["passage_start"]
+        self.passage_end = blobs["passage_end"]
+        self.passage_length = blobs["passage_length"]
+        # Keeps the mapping alive for indexes loaded from a pack file
+        self.pack: Pack | None = None
+
+    def __len__(self):
+        return len(self.passage_doc)
+
+    @classmethod
+    def load(cls, path: str) -> "SearchIndex":
+        pack = Pack(path)
+        index = cls(pack.meta, {name: pack.blob(name) for name in BLOB_NAMES})
+        index.pack = pack
+        return index
+
+    def is_current(self) -> bool:
+        '''
+        Whether the index covers exactly the documents present now, unchanged
+        '''
+        names = available_documents()
+        return sorted(names) == sorted(self.documents) and source_stamps(names) == self.sources
+
+    def search(self, query: str, limit: int = SEARCH_RESULTS) -> list[Hit]:
+        passages = len(self)
+        scores: dict[int, float] = {}
+
+        for term in set(tokenize(query)):
+            term_id = self.terms.get(term)
+            if term_id is None:
+                continue
+            lo, hi = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            idf = math.log(1 + (passages - (hi - lo) + 0.5) / (hi - lo + 0.5))
+            for passage_id, tf in zip(self.postings[lo:hi], self.tfs[lo:hi]):
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.passage_length[passage_id] / self.average_length)
+                scores[passage_id] = scores.get(passage_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [
+            Hit(
+                self.documents[self.passage_doc[passage_id]],
+                self.passage_start[passage_id],
+                self.passage_end[passage_id],
+                score,
+            )
+            for passage_id, score in best
+        ]
+
+
+BLOB_NAMES = ("terms", "term_offsets", "postings", "tfs", "passage_doc", "passage_start", "passage_end", "passage_length")
+
+_index: SearchIndex | None = None
+_lock = threading.Lock()
+
+
+def load_or_build(path: str = SEARCH_INDEX_PATH) -> SearchIndex:
+    '''
+    Map the prebuilt index at `path` if it is current, otherwise build one in memory
+    '''
+    if os.path.exists(path):
+        try:
+            index = SearchIndex.load(path)
+            if index.is_current():
+                return index
+            log.info("search_index_stale", extra={"path": path})
+        except (PackFormatError, KeyError, ValueError) as e:
+            log.warning("search_index_unreadable", extra={"path": path, "error": str(e)})
+    return SearchIndex(*build())
+
+
+def get_index() -> SearchIndex:
+    '''
+    The search index, loaded or built on first use.
+    Raises FileNotFoundError if no document is present.
+    '''
+    global _index
+    if _index is not None:
+        return _index
+
+    with _lock:
+        if _index is None:
+            index = load_or_build()
+            if not index.documents:
+                raise FileNotFoundError("No documents to search")
+            _index = index
+        return _index
+
+
+def passage_text(hit: Hit) -> str:
+    index = document_index.get_index(hit.document)
+    section = document_index.Section("passage", "", hit.start, hit.end)
+    return " ".join(line.strip() for line in index.iter_lines(section) if line.strip())
+
+
+if __name__ == "__main__":
+    meta, blobs = build()
+    write_pack(SEARCH_INDEX_PATH, meta, blobs)
+    postings = len(blobs["postings"])
+    print(f"Wrote {SEARCH_INDEX_PATH}: {len(blobs['passage_doc'])} passages, {postings} postings from {', '.join(meta['documents'])}")